@@ -1,9 +1,57 @@
-"""审计日志：在关键操作后写入 audit_logs 表。"""
-from typing import Optional
+"""审计日志：在关键操作后写入 audit_logs 表。
 
+- log_audit：同步写入（或并入调用方事务），用于账号、权限等必须落库的安全相关操作；
+- log_audit_deferred：放入进程内队列后立即返回，后台线程每 AUDIT_FLUSH_INTERVAL_MS 毫秒或攒够
+  AUDIT_FLUSH_MAX_ENTRIES 条时多行插入一次，用于登录、导出等高频且非关键的记录，不再为一条审计单独提交事务。
+  应用关闭时排空队列；进程被强制终止时队列中尚未写入的记录会丢失。
+
+两者的关键字参数（如 device_code=..., format="csv", count=123）写入结构化列 details_json，
+可按字段筛选（PostgreSQL 走 GIN 索引）；未传 details 时文本列自动生成 "k=v,k=v" 兼容旧展示。
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from . import models
+from .config import settings
+from .database import SessionLocal
+
+_logger = logging.getLogger(__name__)
+
+# 队列上限：写库持续跟不上时新记录改为同步写入（反压），不丢弃
+AUDIT_QUEUE_MAX = 10000
+
+_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=AUDIT_QUEUE_MAX)
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+_stop = threading.Event()
+
+
+def _audit_values(
+    actor_id: int,
+    action: str,
+    target_type: Optional[str],
+    target_id: Optional[int],
+    details: Optional[str],
+    fields: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    data = {k: v for k, v in (fields or {}).items() if v is not None} or None
+    if details is None and data:
+        details = ",".join(f"{k}={v}" for k, v in data.items())
+    return {
+        "actor_id": actor_id,
+        "action": action[:64],
+        "target_type": target_type[:64] if target_type else None,
+        "target_id": target_id,
+        "details": details,
+        "details_json": data,
+    }
 
 
 def log_audit(
@@ -15,16 +63,122 @@ def log_audit(
     details: Optional[str] = None,
     *,
     do_commit: bool = True,
+    **fields: Any,
 ) -> None:
     """写入一条审计记录。action 建议格式：资源.操作，如 device.create、usage.export、auth.login。
-    do_commit=False 时仅 add 不提交，由调用方统一 commit（用于与业务操作同事务）。"""
-    entry = models.AuditLog(
-        actor_id=actor_id,
-        action=action[:64],
-        target_type=target_type[:64] if target_type else None,
-        target_id=target_id,
-        details=details,
-    )
+    do_commit=False 时仅 add 不提交，由调用方统一 commit（用于与业务操作同事务）。
+    其余关键字参数为结构化详情（值为 None 的忽略），写入 details_json。"""
+    entry = models.AuditLog(**_audit_values(actor_id, action, target_type, target_id, details, fields))
     db.add(entry)
     if do_commit:
         db.commit()
+
+
+def log_audit_deferred(
+    actor_id: int,
+    action: str,
+    target_type: Optional[str] = None,
+    target_id: Optional[int] = None,
+    details: Optional[str] = None,
+    **fields: Any,
+) -> None:
+    """异步写入一条审计记录（非关键操作）：时间取调用时刻，由后台线程批量落库。"""
+    values = _audit_values(actor_id, action, target_type, target_id, details, fields)
+    values["created_at"] = datetime.utcnow()
+    if settings.AUDIT_FLUSH_INTERVAL_MS <= 0:
+        _write_batch([values])
+        return
+    _ensure_worker()
+    try:
+        _queue.put_nowait(values)
+    except queue.Full:
+        _write_batch([values])
+
+
+def _write_batch(batch: List[Dict[str, Any]]) -> None:
+    """多行插入一批审计；整批失败（如某条的操作人已被删除）时逐条重试，只丢弃写不进去的那条。"""
+    db = SessionLocal()
+    try:
+        try:
+            db.execute(insert(models.AuditLog), batch)
+            db.commit()
+            return
+        except Exception:
+            db.rollback()
+            if len(batch) == 1:
+                _logger.exception("审计记录写入失败，已丢弃: %s", batch[0].get("action"))
+                return
+        for values in batch:
+            try:
+                db.execute(insert(models.AuditLog), [values])
+                db.commit()
+            except Exception:
+                db.rollback()
+                _logger.exception("审计记录写入失败，已丢弃: %s", values.get("action"))
+    finally:
+        db.close()
+
+
+def _run_worker() -> None:
+    interval = max(settings.AUDIT_FLUSH_INTERVAL_MS, 1) / 1000
+    max_entries = max(settings.AUDIT_FLUSH_MAX_ENTRIES, 1)
+    while True:
+        try:
+            first = _queue.get(timeout=1.0)
+        except queue.Empty:
+            if _stop.is_set():
+                return
+            continue
+        batch = [first]
+        deadline = time.monotonic() + interval
+        while len(batch) < max_entries:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _write_batch(batch)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def _ensure_worker() -> None:
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _stop.clear()
+            _worker = threading.Thread(target=_run_worker, name="audit-writer", daemon=True)
+            _worker.start()
+
+
+def flush_audit_queue() -> None:
+    """等待队列中已有的审计全部写入（测试、关闭前使用）。"""
+    if _worker is not None and _worker.is_alive():
+        _queue.join()
+        return
+    batch = []
+    while True:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        _write_batch(batch)
+        for _ in batch:
+            _queue.task_done()
+
+
+def shutdown_audit_writer() -> None:
+    """应用关闭时排空队列并停止后台线程。"""
+    global _worker
+    flush_audit_queue()
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout=5)
+        _worker = None
@@ -0,0 +1,314 @@
+"""
+审计日志保留与归档：audit_logs 不再无限增长。
+
+- PostgreSQL：执行一次 migrate_to_partitions 把 audit_logs 转为按 created_at 的月度范围分区表
+  （分区名 audit_logs_YYYYMM，另有 audit_logs_default 兜底），之后由维护命令提前建好后续月份的分区；
+  按时间筛选的审计查询只扫描相关分区，过期月份整分区 DETACH 后归档、DROP，不产生大量 DELETE。
+- 其他数据库（SQLite）或尚未迁移的 PostgreSQL：按月份把过期记录写入归档文件后分批 DELETE。
+- 归档文件为 gzip 压缩的 NDJSON（默认）或 CSV，每月一个，写完（.part 改名）后才删除库中数据。
+
+保留月数 AUDIT_RETENTION_MONTHS（0 表示永久保留），归档目录 AUDIT_ARCHIVE_DIR；
+运行方式见 run_audit_maintenance.py。
+"""
+import csv
+import gzip
+import json
+import os
+import re
+from datetime import date, datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from . import models
+
+PARENT_TABLE = "audit_logs"
+DEFAULT_PARTITION = "audit_logs_default"
+_PARTITION_RE = re.compile(r"^audit_logs_(\d{4})(\d{2})$")
+ARCHIVE_FORMATS = ("ndjson", "csv")
+# 归档时每批从游标读取的行数、非分区表每批删除的行数
+ARCHIVE_FETCH_SIZE = 5000
+DELETE_BATCH_SIZE = 5000
+
+# 与模型 __table_args__ 一致，迁移后在分区父表上重建（自动下推到各分区）
+PARTITIONED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_audit_logs_id ON audit_logs (id)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_created_id ON audit_logs (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_action_created ON audit_logs (action, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_actor_created ON audit_logs (actor_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_target_created ON audit_logs (target_type, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_details_json ON audit_logs USING gin (details_json jsonb_path_ops)",
+    f"CREATE INDEX IF NOT EXISTS ix_audit_details_count ON audit_logs ({models.AUDIT_DETAILS_COUNT_SQL}) "
+    f"WHERE {models.AUDIT_DETAILS_COUNT_IS_NUMBER_SQL}",
+]
+
+
+def month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, n: int) -> date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month.year:04d}{month.month:02d}"
+
+
+def retention_cutoff(today: date, retention_months: int) -> Optional[date]:
+    """早于该月初的审计视为过期（保留本月及之前 retention_months 个整月）；0 表示永久保留。"""
+    if retention_months <= 0:
+        return None
+    return add_months(month_start(today), -retention_months)
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :t AND c.relnamespace = current_schema()::regnamespace"
+    ), {"t": PARENT_TABLE}).first())
+
+
+def list_partitions(conn: Connection) -> List[Tuple[str, date]]:
+    """已挂载的月度分区 (分区名, 月初)，按月份升序；不含 default 分区。"""
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :t AND p.relnamespace = current_schema()::regnamespace"
+    ), {"t": PARENT_TABLE}).scalars().all()
+    result = []
+    for name in rows:
+        m = _PARTITION_RE.match(name)
+        if m:
+            result.append((name, date(int(m.group(1)), int(m.group(2)), 1)))
+    return sorted(result, key=lambda x: x[1])
+
+
+def _create_month_partition(conn: Connection, month: date) -> bool:
+    """建一个月度分区；default 分区中已有该月记录时先建独立表、搬入记录再挂载（否则 PostgreSQL 拒绝建分区）。"""
+    name = partition_name(month)
+    if conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar():
+        return False
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    has_default = conn.execute(text("SELECT to_regclass(:n)"), {"n": DEFAULT_PARTITION}).scalar()
+    stray = has_default and conn.execute(text(
+        f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= :lo AND created_at < :hi LIMIT 1"
+    ), {"lo": lower, "hi": upper}).first()
+    if not stray:
+        conn.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        ))
+        return True
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :lo AND created_at < :hi RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"lo": lower, "hi": upper})
+    conn.execute(text(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    ))
+    return True
+
+
+def ensure_partitions(conn: Connection, today: date, months_ahead: int) -> List[str]:
+    """确保本月及之后 months_ahead 个月的分区存在（仅分区表），返回新建的分区名。"""
+    if not is_partitioned(conn):
+        return []
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+    created = []
+    month = month_start(today)
+    for i in range(max(months_ahead, 0) + 1):
+        if _create_month_partition(conn, add_months(month, i)):
+            created.append(partition_name(add_months(month, i)))
+    return created
+
+
+def migrate_to_partitions(engine: Engine, today: date, months_ahead: int = 3) -> int:
+    """PostgreSQL 一次性迁移：把普通 audit_logs 表转为月度分区表，返回搬移的行数。
+
+    在一个事务内完成（期间审计表加排他锁，写审计的请求会等待），建议在低峰期执行；已是分区表时直接返回 0。
+    """
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("仅 PostgreSQL 支持分区表")
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return 0
+        conn.execute(text(f"LOCK TABLE {PARENT_TABLE} IN ACCESS EXCLUSIVE MODE"))
+        # 分区键进入主键后不能为空，早期缺时间的记录按迁移时刻补齐
+        conn.execute(text(f"UPDATE {PARENT_TABLE} SET created_at = timezone('utc', now()) WHERE created_at IS NULL"))
+        bounds = conn.execute(text(f"SELECT min(created_at), max(created_at) FROM {PARENT_TABLE}")).first()
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO audit_logs_legacy"))
+        conn.execute(text(
+            f"CREATE TABLE {PARENT_TABLE} (LIKE audit_logs_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+        first_month = month_start(bounds[0]) if bounds[0] else month_start(today)
+        last_month = max(month_start(bounds[1]) if bounds[1] else first_month, add_months(month_start(today), months_ahead))
+        month = first_month
+        while month <= last_month:
+            _create_month_partition(conn, month)
+            month = add_months(month, 1)
+        moved = conn.execute(text(f"INSERT INTO {PARENT_TABLE} SELECT * FROM audit_logs_legacy")).rowcount
+        # id 序列改归新表所有，删除旧表时不随之删除
+        seq = conn.execute(text("SELECT pg_get_serial_sequence('audit_logs_legacy', 'id')")).scalar()
+        if seq:
+            conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY {PARENT_TABLE}.id"))
+        conn.execute(text("DROP TABLE audit_logs_legacy"))
+        # 分区表的主键须包含分区键
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ADD PRIMARY KEY (id, created_at)"))
+        conn.execute(text(
+            f"ALTER TABLE {PARENT_TABLE} ADD CONSTRAINT audit_logs_actor_id_fkey "
+            "FOREIGN KEY (actor_id) REFERENCES users (id)"
+        ))
+        for index_sql in PARTITIONED_INDEXES:
+            conn.execute(text(index_sql))
+    return moved
+
+
+def _archive_path(archive_dir: str, month: date, fmt: str) -> str:
+    suffix = "ndjson.gz" if fmt == "ndjson" else "csv.gz"
+    return os.path.join(archive_dir, f"{partition_name(month)}.{suffix}")
+
+
+def _json_default(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return str(v)
+
+
+def _csv_value(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, ensure_ascii=False, default=_json_default)
+    return _json_default(v)
+
+
+def write_archive(rows: Iterable, columns: List[str], path: str, fmt: str) -> int:
+    """把一个月的审计写入 gzip 压缩文件（先写 .part，完成后改名），返回行数。"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".part"
+    count = 0
+    with gzip.open(tmp_path, "wt", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow([_csv_value(v) for v in row])
+                count += 1
+        else:
+            for row in rows:
+                f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default))
+                f.write("\n")
+                count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def _stream(conn: Connection, stmt):
+    """服务端游标分批读取，整月数据不一次载入内存。"""
+    return conn.execution_options(stream_results=True, yield_per=ARCHIVE_FETCH_SIZE).execute(stmt)
+
+
+def _archive_partitions(engine: Engine, cutoff: date, archive_dir: str, fmt: str, dry_run: bool) -> List[Tuple[str, int]]:
+    done = []
+    with engine.connect() as conn:
+        attached = {name for name, _ in list_partitions(conn)}
+        # 上次归档中断时已摘下、尚未删除的月表也一并处理
+        tables = conn.execute(text(
+            "SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename ~ :p"
+        ), {"p": _PARTITION_RE.pattern}).scalars().all()
+    expired = []
+    for name in sorted(tables):
+        m = _PARTITION_RE.match(name)
+        month = date(int(m.group(1)), int(m.group(2)), 1)
+        if add_months(month, 1) <= cutoff:
+            expired.append((name, month))
+    for name, month in expired:
+        if dry_run:
+            with engine.connect() as conn:
+                done.append((name, conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()))
+            continue
+        # 先摘下分区：之后的审计查询不再涉及该月，归档期间也不会有新记录写入
+        if name in attached:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        with engine.connect() as conn:
+            result = _stream(conn, text(f"SELECT * FROM {name} ORDER BY id"))
+            count = write_archive(result, list(result.keys()), _archive_path(archive_dir, month, fmt), fmt)
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE {name}"))
+        done.append((name, count))
+    # default 分区中的过期记录（建分区之前写入的月份）按行归档
+    return done + _archive_rows(engine, cutoff, archive_dir, fmt, dry_run, skip={name for name, _ in expired})
+
+
+def _archive_rows(
+    engine: Engine, cutoff: date, archive_dir: str, fmt: str, dry_run: bool, skip: Optional[set] = None
+) -> List[Tuple[str, int]]:
+    """未分区的表：按月写归档文件后分批删除；skip 为已按分区处理的月份。"""
+    table = models.AuditLog.__table__
+    done = []
+    with engine.connect() as conn:
+        oldest = conn.execute(select(func.min(table.c.created_at))).scalar()
+    if oldest is None:
+        return done
+    month = month_start(oldest)
+    while month < cutoff:
+        if skip and partition_name(month) in skip:
+            month = add_months(month, 1)
+            continue
+        lo = datetime(month.year, month.month, 1)
+        hi = datetime(add_months(month, 1).year, add_months(month, 1).month, 1)
+        in_month = (table.c.created_at >= lo) & (table.c.created_at < hi)
+        with engine.connect() as conn:
+            n = conn.execute(select(func.count()).select_from(table).where(in_month)).scalar()
+        if n and dry_run:
+            done.append((partition_name(month), n))
+        elif n:
+            with engine.connect() as conn:
+                result = _stream(conn, select(table).where(in_month).order_by(table.c.id))
+                n = write_archive(result, list(result.keys()), _archive_path(archive_dir, month, fmt), fmt)
+            # 文件写完才删除；分批删除，避免一个大事务长时间锁表
+            while True:
+                with engine.begin() as conn:
+                    ids = select(table.c.id).where(in_month).limit(DELETE_BATCH_SIZE).scalar_subquery()
+                    if conn.execute(delete(table).where(table.c.id.in_(ids))).rowcount == 0:
+                        break
+            done.append((partition_name(month), n))
+        month = add_months(month, 1)
+    return done
+
+
+def archive_expired(
+    engine: Engine,
+    today: date,
+    retention_months: int,
+    archive_dir: str,
+    fmt: str = "ndjson",
+    dry_run: bool = False,
+) -> List[Tuple[str, int]]:
+    """归档并删除保留期之前的审计，返回 [(月份名, 行数)]；dry_run 只统计不改动。"""
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"不支持的归档格式: {fmt}")
+    cutoff = retention_cutoff(today, retention_months)
+    if cutoff is None:
+        return []
+    with engine.connect() as conn:
+        partitioned = is_partitioned(conn)
+    if partitioned:
+        return _archive_partitions(engine, cutoff, archive_dir, fmt, dry_run)
+    return _archive_rows(engine, cutoff, archive_dir, fmt, dry_run)
+
+
+def read_archive(path: str) -> Iterator[dict]:
+    """逐条读取 NDJSON 归档（排查时使用）。"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -137,6 +137,24 @@ def decode_token(token: str) -> Optional[dict]:
         return None
 
 
+def create_download_ticket(user: models.User, resource: str, expire_seconds: int) -> str:
+    """生成下载凭证：浏览器直接跳转下载时无法携带 Authorization 头，凭证放在 URL 上，仅对指定资源有效。"""
+    now = int(time.time())
+    payload = {"sub": str(user.id), "res": resource, "exp": now + expire_seconds, "iat": now}
+    return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
+
+
+def user_from_download_ticket(db: Session, ticket: str, resource: str) -> Optional[models.User]:
+    """校验下载凭证，返回签发对象；凭证无效、资源不符或账号已停用时返回 None。"""
+    payload = decode_token(ticket)
+    if not payload or payload.get("res") != resource or "sub" not in payload:
+        return None
+    user = db.get(models.User, int(payload["sub"]))
+    if not user or getattr(user, "is_active", True) is False:
+        return None
+    return user
+
+
 security = HTTPBearer(auto_error=False)
 
 
@@ -148,7 +166,8 @@ def get_current_user_optional(
     if not credentials:
         return None
     payload = decode_token(credentials.credentials)
-    if not payload or "sub" not in payload:
+    # 下载凭证（带 res）只能用于对应资源的下载，不能当登录 token 使用
+    if not payload or "sub" not in payload or "res" in payload:
         return None
     user_id = int(payload["sub"])
     user = db.get(models.User, user_id)
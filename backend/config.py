@@ -1,5 +1,6 @@
 """应用配置：企业微信、JWT、院内访问控制等（从环境变量读取）。"""
 import os
+import tempfile
 from functools import lru_cache
 from typing import List
 
@@ -41,6 +42,45 @@ def get_settings():
         WECOM_HTTP_TIMEOUT: float = float(os.getenv("WECOM_HTTP_TIMEOUT", "10.0"))
         # 登记记录可撤销的时间范围（小时），超过则不允许撤销，默认 24
         UNDO_WINDOW_HOURS: int = int(os.getenv("UNDO_WINDOW_HOURS", "24"))
+        # 使用记录 CSV 流式导出预算：最大行数、最大字节数（0 表示不限制），超出行数拒绝导出，超出字节数截断并提示
+        EXPORT_MAX_ROWS: int = int(os.getenv("EXPORT_MAX_ROWS", "2000000"))
+        EXPORT_MAX_BYTES: int = int(os.getenv("EXPORT_MAX_BYTES", str(1024 * 1024 * 1024)))
+        # 后台导出任务：临时文件目录、并发工作线程数、排队上限、完成文件保留时长（小时）
+        EXPORT_SPOOL_DIR: str = os.getenv(
+            "EXPORT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "device_scan_exports")
+        )
+        EXPORT_JOB_WORKERS: int = int(os.getenv("EXPORT_JOB_WORKERS", "2"))
+        EXPORT_JOB_MAX_PENDING: int = int(os.getenv("EXPORT_JOB_MAX_PENDING", "10"))
+        EXPORT_JOB_TTL_HOURS: int = int(os.getenv("EXPORT_JOB_TTL_HOURS", "24"))
+        # 排队/进行中的导出任务心跳（开始渲染、每批进度时更新）超过该分钟数未更新视为已中断（进程重启或被终止），标记为失败且不占排队名额
+        EXPORT_JOB_STALE_MINUTES: int = int(os.getenv("EXPORT_JOB_STALE_MINUTES", "60"))
+        # 字典进程内缓存：每隔多少秒比对一次数据库版本号（多 worker 部署下字典变更的最大延迟）
+        DICT_CACHE_CHECK_SECONDS: float = float(os.getenv("DICT_CACHE_CHECK_SECONDS", "5"))
+        # 分页总数缓存时长（秒），按规范化筛选条件缓存；0 表示不缓存
+        COUNT_CACHE_TTL_SECONDS: float = float(os.getenv("COUNT_CACHE_TTL_SECONDS", "10"))
+        # 工作台统计结果进程内缓存时长（秒），并发刷新共享一次计算；0 表示不缓存
+        DASHBOARD_CACHE_TTL_SECONDS: float = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "15"))
+        # 按编号查找设备的进程内缓存时长（秒），多 worker 部署下设备修改的最大延迟；0 表示不缓存
+        DEVICE_CACHE_TTL_SECONDS: float = float(os.getenv("DEVICE_CACHE_TTL_SECONDS", "60"))
+        # 设备二维码图片缓存：磁盘目录（按内容寻址，多 worker 共享；留空则只用进程内缓存）、
+        # 进程内缓存字节上限（0 表示不在内存缓存）、响应 Cache-Control 的 max-age（秒）
+        QR_CACHE_DIR: str = os.getenv(
+            "QR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "device_scan_qrcodes")
+        )
+        QR_CACHE_MAX_BYTES: int = int(os.getenv("QR_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        QR_CACHE_MAX_AGE_SECONDS: int = int(os.getenv("QR_CACHE_MAX_AGE_SECONDS", "300"))
+        # 批量打印标签时渲染二维码的进程数，0 或 1 表示在请求进程内串行渲染
+        QR_RENDER_WORKERS: int = int(os.getenv("QR_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+        # 非关键审计（登录、导出等）异步批量写入：最长攒批间隔（毫秒，0 表示不排队、立即写入）、每批最多条数
+        AUDIT_FLUSH_INTERVAL_MS: int = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "200"))
+        AUDIT_FLUSH_MAX_ENTRIES: int = int(os.getenv("AUDIT_FLUSH_MAX_ENTRIES", "500"))
+        # 审计保留整月数（0 表示永久保留），过期月份由 run_audit_maintenance.py 归档到该目录后删除；
+        # 分区表（PostgreSQL）每次维护提前建好的月份数
+        AUDIT_RETENTION_MONTHS: int = int(os.getenv("AUDIT_RETENTION_MONTHS", "12"))
+        AUDIT_ARCHIVE_DIR: str = os.getenv(
+            "AUDIT_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "audit_archive")
+        )
+        AUDIT_PARTITION_MONTHS_AHEAD: int = int(os.getenv("AUDIT_PARTITION_MONTHS_AHEAD", "3"))
     return Settings()
 
 
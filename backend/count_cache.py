@@ -0,0 +1,140 @@
+"""
+分页总数：列表与总数一次查询返回（COUNT(*) OVER()），总数按规范化筛选条件短期缓存；
+approximate=true 且无筛选条件时在 PostgreSQL 上直接读取规划器统计（pg_class.reltuples），不扫描全表。
+"""
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from fastapi import Response
+from sqlalchemy import func, text
+from sqlalchemy.orm import Query, Session
+
+from .config import settings
+
+TOTAL_COUNT_HEADER = "X-Total-Count"
+TOTAL_APPROXIMATE_HEADER = "X-Total-Approximate"
+
+# 缓存条目上限，超出时淘汰最早过期的条目
+COUNT_CACHE_MAX_ENTRIES = 2048
+
+_lock = threading.Lock()
+_cache: Dict[Hashable, Tuple[float, int]] = {}
+
+
+def count_cache_key(scope: str, **filters: Any) -> Tuple:
+    """规范化筛选条件作为缓存键：忽略空值，字符串去首尾空白，参数顺序无关。"""
+    items = []
+    for k, v in filters.items():
+        if isinstance(v, str):
+            v = v.strip()
+        if v is None or v == "" or v is False:
+            continue
+        items.append((k, v))
+    return (scope, tuple(sorted(items)))
+
+
+def get_cached_count(key: Hashable) -> Optional[int]:
+    with _lock:
+        hit = _cache.get(key)
+        if hit is None:
+            return None
+        if hit[0] < time.monotonic():
+            _cache.pop(key, None)
+            return None
+        return hit[1]
+
+
+def set_cached_count(key: Hashable, total: int) -> None:
+    ttl = settings.COUNT_CACHE_TTL_SECONDS
+    if ttl <= 0:
+        return
+    with _lock:
+        if len(_cache) >= COUNT_CACHE_MAX_ENTRIES:
+            now = time.monotonic()
+            for k in [k for k, (exp, _) in _cache.items() if exp < now]:
+                del _cache[k]
+            if len(_cache) >= COUNT_CACHE_MAX_ENTRIES:
+                del _cache[min(_cache, key=lambda k: _cache[k][0])]
+        _cache[key] = (time.monotonic() + ttl, total)
+
+
+def invalidate_counts(scope: str) -> None:
+    """本进程内该类数据写入后清除其总数缓存（其他 worker 最迟在 TTL 后刷新）。"""
+    with _lock:
+        for k in [k for k in _cache if isinstance(k, tuple) and k and k[0] == scope]:
+            del _cache[k]
+
+
+def estimate_table_rows(db: Session, table_name: str) -> Optional[int]:
+    """PostgreSQL 规划器估算的表行数（随 ANALYZE/autovacuum 更新）；其他数据库或从未统计时返回 None。"""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    value = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE relname = :t AND relkind IN ('r', 'p')"),
+        {"t": table_name},
+    ).scalar()
+    if value is None or value < 0:
+        return None
+    return int(value)
+
+
+def cached_count(query: Query, key: Hashable) -> int:
+    """精确总数，命中缓存时不查库。"""
+    total = get_cached_count(key)
+    if total is None:
+        total = query.order_by(None).count()
+        set_cached_count(key, total)
+    return total
+
+
+def count_total(
+    db: Session,
+    query: Query,
+    key: Hashable,
+    table_name: str,
+    approximate: bool = False,
+) -> Tuple[int, bool]:
+    """返回 (总数, 是否估算)：approximate 时使用规划器估算（调用方仅在无筛选条件时传入），否则走缓存的精确计数。"""
+    if approximate:
+        estimate = estimate_table_rows(db, table_name)
+        if estimate is not None:
+            return estimate, True
+    return cached_count(query, key), False
+
+
+def fetch_page_with_total(
+    db: Session,
+    query: Query,
+    key: Hashable,
+    table_name: str,
+    offset: int,
+    limit: int,
+    approximate: bool = False,
+) -> Tuple[List[Any], int, bool]:
+    """一次查询取出当前页及总数：总数已缓存或可估算时只查当前页，否则附加 COUNT(*) OVER() 同时取回。"""
+    total: Optional[int] = None
+    estimated = False
+    if approximate:
+        total = estimate_table_rows(db, table_name)
+        estimated = total is not None
+    if total is None:
+        total = get_cached_count(key)
+    if total is not None:
+        return query.offset(offset).limit(limit).all(), total, estimated
+    rows = query.add_columns(func.count().over()).offset(offset).limit(limit).all()
+    if rows:
+        total = rows[0][-1]
+        items = [row[0] for row in rows]
+    else:
+        # 偏移超出末页时窗口函数没有行可携带总数，退回单独计数
+        items = []
+        total = query.order_by(None).count()
+    set_cached_count(key, total)
+    return items, total, False
+
+
+def set_total_headers(response: Response, total: int, estimated: bool = False) -> None:
+    response.headers[TOTAL_COUNT_HEADER] = str(total)
+    if estimated:
+        response.headers[TOTAL_APPROXIMATE_HEADER] = "1"
@@ -0,0 +1,29 @@
+"""
+游标分页（keyset pagination）：把「最后一条记录的排序键」编码为不透明字符串返回给前端，
+下一页按该键做 seek 过滤（WHERE (时间, id) < (上一页末条)），深翻页与第一页代价相同。
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+# 列表接口通过响应头返回下一页游标，保持原有数组响应结构不变
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort_time: datetime, row_id: int) -> str:
+    """将 (排序时间, id) 编码为 URL 安全的不透明游标。"""
+    raw = f"{sort_time.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """解析游标为 (排序时间, id)；为空返回 None，格式非法抛 ValueError。"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        time_str, id_str = raw.rsplit("|", 1)
+        return datetime.fromisoformat(time_str), int(id_str)
+    except Exception as e:
+        raise ValueError("cursor 无效") from e
@@ -0,0 +1,106 @@
+"""
+按设备编号查找的进程内 LRU 缓存：扫码页解析编号（GET /api/devices/by-code/{code}）与登记前的设备校验走缓存，不再每次查库。
+只缓存启用且未删除的设备；设备新增、修改、导入及借用/维修状态变化时在本进程内失效，其他 worker 最迟
+DEVICE_CACHE_TTL_SECONDS 秒后刷新。登记写入仍以 INSERT 语句中的设备条件为准，缓存陈旧不会放行已停用设备。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .device_state import derive_live_status
+
+# 缓存设备数上限，超出时淘汰最久未访问的
+DEVICE_CACHE_MAX_ENTRIES = 10000
+
+
+class CachedDevice(NamedTuple):
+    """设备快照（与 ORM 对象脱离，可跨请求共享；字段同 DeviceRead）。"""
+    id: int
+    device_code: str
+    name: str
+    dept: Optional[str]
+    location: Optional[str]
+    status: str
+    qr_value: Optional[str]
+    is_active: bool
+    is_deleted: bool
+    created_at: object
+    open_borrow_count: int
+    open_repair_count: int
+
+    @property
+    def live_status(self) -> str:
+        return derive_live_status(self.status, self.open_borrow_count, self.open_repair_count)
+
+
+_lock = threading.Lock()
+_cache: "OrderedDict[str, Tuple[float, CachedDevice]]" = OrderedDict()
+
+
+def _snapshot(d: models.Device) -> CachedDevice:
+    return CachedDevice(
+        id=d.id,
+        device_code=d.device_code,
+        name=d.name,
+        dept=d.dept,
+        location=d.location,
+        status=d.status,
+        qr_value=d.qr_value,
+        is_active=bool(d.is_active),
+        is_deleted=bool(d.is_deleted),
+        created_at=d.created_at,
+        open_borrow_count=d.open_borrow_count or 0,
+        open_repair_count=d.open_repair_count or 0,
+    )
+
+
+def get_active_device(db: Session, device_code: str) -> Optional[CachedDevice]:
+    """按编号（已规范化）取启用且未删除的设备；不存在或已停用/删除返回 None（不缓存未命中）。"""
+    if not device_code:
+        return None
+    now = time.monotonic()
+    with _lock:
+        hit = _cache.get(device_code)
+        if hit is not None:
+            if hit[0] > now:
+                _cache.move_to_end(device_code)
+                return hit[1]
+            del _cache[device_code]
+    device = (
+        db.query(models.Device)
+        .filter(
+            models.Device.device_code == device_code,
+            models.Device.is_active.is_(True),
+            models.Device.is_deleted.is_(False),
+        )
+        .first()
+    )
+    if device is None:
+        return None
+    snapshot = _snapshot(device)
+    ttl = settings.DEVICE_CACHE_TTL_SECONDS
+    if ttl > 0:
+        with _lock:
+            _cache[device_code] = (now + ttl, snapshot)
+            _cache.move_to_end(device_code)
+            while len(_cache) > DEVICE_CACHE_MAX_ENTRIES:
+                _cache.popitem(last=False)
+    return snapshot
+
+
+def invalidate_devices(*device_codes: Optional[str]) -> None:
+    """设备变更后清除本进程缓存中的对应编号（在 commit 之后调用，避免清除后又被旧数据回填）。"""
+    with _lock:
+        for code in device_codes:
+            if code:
+                _cache.pop(code, None)
+
+
+def clear_device_cache() -> None:
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,242 @@
+"""
+设备批量导入流水线：上传文件先落盘，Excel（openpyxl 只读模式）或 CSV 逐行解析，按块处理：
+- 每块一次 IN 查询找出已存在的编号，文件内重复用集合判断；
+- 新设备一条批量 INSERT（PostgreSQL / SQLite 带 ON CONFLICT DO NOTHING，并发导入同一编号时不会整块失败），
+  每块写一条汇总审计并提交，不再逐行 SELECT + flush + 审计，也不在一个长事务里导入整个文件；
+- dry_run 时只校验、查重并返回结果，不写库；
+- 某块读取或写入出错时回滚该块并抛出 DeviceImportError，说明此前已提交的条数与出错行号。
+"""
+import codecs
+import csv
+import io
+import shutil
+import tempfile
+from itertools import islice
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert as sa_insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .audit import log_audit
+from .count_cache import invalidate_counts
+from .device_cache import invalidate_devices
+
+# 每块行数：一次 IN 查询、一次批量 INSERT、一条审计、一次提交
+IMPORT_CHUNK_SIZE = 1000
+# 上传文件落盘时每次复制的字节数
+IMPORT_SPOOL_CHUNK = 1024 * 1024
+# 返回给前端的逐行错误最多条数（计数不受限制）
+IMPORT_MAX_ERRORS = 500
+# CSV 编码探测读取的字节数：能按 UTF-8 解码则按 UTF-8（含 BOM），否则按 GB18030（Excel 中文版另存的 CSV）
+CSV_SNIFF_BYTES = 64 * 1024
+
+# (行号, 单元格值)
+ImportRow = Tuple[int, Sequence[Any]]
+
+
+class DeviceImportError(ValueError):
+    """导入中途出错：此前各块已提交（created 条），first_row 起的行未导入。"""
+
+    def __init__(
+        self, cause: Exception, created: int, first_row: int, last_row: Optional[int], dry_run: bool
+    ) -> None:
+        self.created = created
+        self.first_row = first_row
+        self.last_row = last_row
+        rows = f"第{first_row}-{last_row}行" if last_row and last_row != first_row else f"第{first_row}行"
+        if dry_run:
+            done = f"此前 {created} 条校验通过（预检未写库）"
+        else:
+            done = f"此前已导入 {created} 条（已保存），请修正后从第{first_row}行起重新导入"
+        super().__init__(f"{rows}处理失败：{cause!s}；{done}")
+
+
+def spool_upload(src: IO[bytes]) -> IO[bytes]:
+    """把上传内容分块复制到临时文件（关闭即删除），解析时不在内存中保留整个文件。"""
+    spool = tempfile.TemporaryFile()
+    shutil.copyfileobj(src, spool, IMPORT_SPOOL_CHUNK)
+    spool.seek(0)
+    return spool
+
+
+def iter_xlsx_rows(f: IO[bytes]) -> Iterator[ImportRow]:
+    """Excel 活动工作表第二行起的数据行（只读模式按行流式读取）。"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(f, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        if ws is None:
+            raise ValueError("Excel 无有效工作表")
+        yield from enumerate(ws.iter_rows(min_row=2, values_only=True), start=2)
+    finally:
+        wb.close()
+
+
+def _sniff_csv_encoding(f: IO[bytes]) -> str:
+    head = f.read(CSV_SNIFF_BYTES)
+    f.seek(0)
+    try:
+        # 增量解码：末尾被截断的多字节字符不算错误
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "gb18030"
+
+
+def iter_csv_rows(f: IO[bytes]) -> Iterator[ImportRow]:
+    """CSV 第二行起的数据行，列顺序同 Excel 模板。"""
+    text = io.TextIOWrapper(f, encoding=_sniff_csv_encoding(f), newline="")
+    try:
+        reader = csv.reader(text)
+        next(reader, None)
+        yield from enumerate(reader, start=2)
+    finally:
+        # 文件由调用方关闭
+        text.detach()
+
+
+def _cell(row: Sequence[Any], i: int) -> str:
+    v = row[i] if len(row) > i else None
+    return str(v).strip() if v is not None else ""
+
+
+def _parse_row(row_idx: int, row: Sequence[Any], errors: List[str]) -> Optional[Dict[str, Any]]:
+    """单行转为设备字段；必填项缺失时记录错误并返回 None。"""
+    code, name, dept = _cell(row, 0), _cell(row, 1), _cell(row, 2)
+    if not code:
+        errors.append(f"第{row_idx}行：设备编号为空，已跳过")
+        return None
+    if not name:
+        errors.append(f"第{row_idx}行：设备名称为空，已跳过")
+        return None
+    if not dept:
+        errors.append(f"第{row_idx}行：科室为空，已跳过")
+        return None
+    status_str = _cell(row, 4)
+    return {
+        "device_code": code,
+        "name": name,
+        "dept": dept,
+        "location": _cell(row, 3) or None,
+        "status": status_str if status_str.isdigit() else "1",
+        "is_active": True,
+        "is_deleted": False,
+    }
+
+
+def _is_blank(row: Sequence[Any]) -> bool:
+    return not row or all(cell is None or (isinstance(cell, str) and not cell.strip()) for cell in row)
+
+
+def _insert_devices(db: Session, rows: List[Dict[str, Any]]) -> set:
+    """批量插入，返回实际插入的编号（并发导入抢先插入的编号不在其中）。"""
+    table = models.Device.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        db.execute(sa_insert(table), rows)
+        return {r["device_code"] for r in rows}
+    stmt = (
+        insert(table)
+        .on_conflict_do_nothing(index_elements=["device_code"])
+        .returning(table.c.device_code)
+    )
+    return set(db.execute(stmt, rows).scalars().all())
+
+
+def import_device_rows(
+    db: Session,
+    rows: Iterable[ImportRow],
+    actor_id: int,
+    *,
+    dry_run: bool = False,
+    chunk_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """按块导入（或 dry_run 预检）设备行，返回 {created, skipped, errors, dry_run}。"""
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    created = 0
+    skipped = 0
+    errors: List[str] = []
+    seen_codes: set = set()
+    it = iter(rows)
+    next_row = 2
+    try:
+        while True:
+            try:
+                chunk = list(islice(it, chunk_size))
+            except Exception as e:
+                # 文件后部损坏等读取错误：出错行之前的块已提交
+                raise DeviceImportError(e, created, next_row, None, dry_run) from e
+            if not chunk:
+                break
+            next_row = chunk[-1][0] + 1
+            try:
+                candidates: List[Tuple[int, Dict[str, Any]]] = []
+                for row_idx, row in chunk:
+                    if _is_blank(row):
+                        continue
+                    data = _parse_row(row_idx, row, errors)
+                    if data is None:
+                        skipped += 1
+                        continue
+                    code = data["device_code"]
+                    if code in seen_codes:
+                        errors.append(f"第{row_idx}行：设备编号 {code} 在本文件中重复，已跳过")
+                        skipped += 1
+                        continue
+                    seen_codes.add(code)
+                    candidates.append((row_idx, data))
+                if not candidates:
+                    continue
+                codes = [data["device_code"] for _, data in candidates]
+                existing = {
+                    c for (c,) in db.query(models.Device.device_code).filter(models.Device.device_code.in_(codes))
+                }
+                new_rows: List[Dict[str, Any]] = []
+                for row_idx, data in candidates:
+                    if data["device_code"] in existing:
+                        errors.append(f"第{row_idx}行：设备编号 {data['device_code']} 已存在，已跳过")
+                        skipped += 1
+                    else:
+                        new_rows.append(data)
+                if not new_rows:
+                    continue
+                if dry_run:
+                    created += len(new_rows)
+                    continue
+                inserted = _insert_devices(db, new_rows)
+                for row_idx, data in candidates:
+                    code = data["device_code"]
+                    if code not in existing and code not in inserted:
+                        errors.append(f"第{row_idx}行：设备编号 {code} 已存在，已跳过")
+                        skipped += 1
+                log_audit(
+                    db,
+                    actor_id,
+                    "device.import.batch",
+                    None,
+                    None,
+                    f"rows={chunk[0][0]}-{chunk[-1][0]},created={len(inserted)}",
+                    do_commit=False,
+                    first_row=chunk[0][0],
+                    last_row=chunk[-1][0],
+                    created=len(inserted),
+                )
+                db.commit()
+                created += len(inserted)
+                invalidate_devices(*inserted)
+            except Exception as e:
+                db.rollback()
+                raise DeviceImportError(e, created, chunk[0][0], chunk[-1][0], dry_run) from e
+    finally:
+        if created and not dry_run:
+            invalidate_counts("devices")
+    if len(errors) > IMPORT_MAX_ERRORS:
+        omitted = len(errors) - IMPORT_MAX_ERRORS
+        errors = errors[:IMPORT_MAX_ERRORS] + [f"……其余 {omitted} 条提示已省略"]
+    return {"created": created, "skipped": skipped, "errors": errors, "dry_run": dry_run}
@@ -0,0 +1,119 @@
+"""
+设备实时状态投影：devices.open_borrow_count / open_repair_count 记录未归还借用、未完成维修条数，
+在登记、批量登记、归还、维修完成、撤销时于同一事务内增减。设备列表、导出、工作台据此直接得出
+实时状态（维修中 / 使用中），无需逐台查询使用记录。计数与明细不一致时运行 run_rebuild_device_state.py 重建。
+"""
+from collections import Counter
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, case, func, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+BORROW_USAGE_TYPE = "2"
+REPAIR_USAGE_TYPE = "3"
+
+# 实时状态编码（与设备状态字典一致）
+STATUS_IN_USE = "2"
+STATUS_IN_REPAIR = "3"
+# 人工标记为故障、报废时以人工状态为准，不被借用/维修覆盖
+MANUAL_OVERRIDE_STATUSES = ("4", "5")
+
+
+def derive_live_status(status: Optional[str], open_borrow_count: Optional[int], open_repair_count: Optional[int]) -> str:
+    """人工状态 + 未闭环计数 -> 实时状态：故障/报废 > 有未完成维修（维修中）> 有未归还借用（使用中）> 人工状态。"""
+    manual = str(status).strip() if status not in (None, "") else "1"
+    if manual in MANUAL_OVERRIDE_STATUSES:
+        return manual
+    if open_repair_count:
+        return STATUS_IN_REPAIR
+    if open_borrow_count:
+        return STATUS_IN_USE
+    return manual
+
+
+def live_status_expr(status_col, open_borrow_col, open_repair_col):
+    """derive_live_status 的 SQL 表达式版本，供导出等在查询中直接得出实时状态。"""
+    manual = func.coalesce(func.nullif(func.trim(status_col), ""), "1")
+    return case(
+        (manual.in_(MANUAL_OVERRIDE_STATUSES), manual),
+        (func.coalesce(open_repair_col, 0) > 0, STATUS_IN_REPAIR),
+        (func.coalesce(open_borrow_col, 0) > 0, STATUS_IN_USE),
+        else_=manual,
+    )
+
+
+def open_count_deltas(usage_type: str, sign: int) -> Dict[str, int]:
+    """某类登记打开（sign=1）或关闭（sign=-1）时各计数列的增量；其他类型不影响实时状态。"""
+    if str(usage_type) == BORROW_USAGE_TYPE:
+        return {"open_borrow_count": sign}
+    if str(usage_type) == REPAIR_USAGE_TYPE:
+        return {"open_repair_count": sign}
+    return {}
+
+
+def is_open_record(record: models.UsageRecord) -> bool:
+    """记录当前是否计入未闭环计数（未撤销且未归还/未完成）。"""
+    if record.is_deleted:
+        return False
+    usage_type = str(record.usage_type)
+    if usage_type == BORROW_USAGE_TYPE:
+        return record.returned_at is None
+    if usage_type == REPAIR_USAGE_TYPE:
+        return record.repair_completed_at is None
+    return False
+
+
+def adjust_device_state(db: Session, device_code: str, usage_type: str, sign: int) -> None:
+    """单条记录打开/关闭时更新设备计数（调用方 commit 之前，与明细同一事务）。"""
+    deltas = open_count_deltas(usage_type, sign)
+    if not deltas:
+        return
+    D = models.Device
+    db.execute(
+        update(D)
+        .where(D.device_code == device_code)
+        .values({col: func.coalesce(getattr(D, col), 0) + n for col, n in deltas.items()})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def add_device_open_counts(db: Session, opened: Counter) -> None:
+    """批量登记：opened 为 (设备编号, 使用类型) -> 新增条数，每个计数列一次 executemany。"""
+    table = models.Device.__table__
+    for col, usage_type in (("open_borrow_count", BORROW_USAGE_TYPE), ("open_repair_count", REPAIR_USAGE_TYPE)):
+        rows = [{"code": code, "n": n} for (code, t), n in opened.items() if t == usage_type and n]
+        if rows:
+            db.execute(
+                update(table)
+                .where(table.c.device_code == bindparam("code"))
+                .values({col: func.coalesce(table.c[col], 0) + bindparam("n")}),
+                rows,
+            )
+
+
+def rebuild_device_state(db: Session) -> None:
+    """按未闭环明细全量重算所有设备的计数（回填/纠偏）；调用方负责 commit。"""
+    D, U = models.Device, models.UsageRecord
+
+    def _open_count(usage_type: str, closed_col):
+        return (
+            select(func.count(U.id))
+            .where(
+                U.device_code == D.device_code,
+                U.usage_type == usage_type,
+                closed_col.is_(None),
+                U.is_deleted.is_(False),
+            )
+            .scalar_subquery()
+        )
+
+    db.execute(
+        update(D)
+        .values(
+            open_borrow_count=_open_count(BORROW_USAGE_TYPE, U.returned_at),
+            open_repair_count=_open_count(REPAIR_USAGE_TYPE, U.repair_completed_at),
+        )
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,124 @@
+"""
+字典进程内缓存：全部 DictItem 常驻内存，按 (dict_type, code) 建索引。
+字典增删改时在同一事务中递增数据库中的版本号（cache_versions 表），各 worker 最多每
+DICT_CACHE_CHECK_SECONDS 秒比对一次版本号，不一致则整体重载，因此多进程部署下的陈旧窗口有界。
+"""
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+
+DICT_CACHE_NAME = "dict_items"
+
+
+class CachedDictItem(NamedTuple):
+    """字典项快照（与 ORM 对象脱离，可跨请求共享；字段同 DictItemRead）。"""
+    id: int
+    dict_type: str
+    code: str
+    label: str
+    is_active: bool
+    is_deleted: bool
+    sort_order: int
+    created_at: object
+
+
+_lock = threading.Lock()
+_items: List[CachedDictItem] = []
+_index: Dict[Tuple[str, str], CachedDictItem] = {}
+_version: Optional[int] = None
+_checked_at: float = 0.0
+
+
+def _read_version(db: Session) -> int:
+    row = db.get(models.CacheVersion, DICT_CACHE_NAME)
+    return row.version if row else 0
+
+
+def bump_dict_version(db: Session) -> None:
+    """字典变更时调用（在调用方 commit 之前）：递增数据库版本号并使本进程缓存立即失效。"""
+    global _version
+    result = db.execute(
+        update(models.CacheVersion)
+        .where(models.CacheVersion.name == DICT_CACHE_NAME)
+        .values(version=models.CacheVersion.version + 1)
+    )
+    if not result.rowcount:
+        db.add(models.CacheVersion(name=DICT_CACHE_NAME, version=1))
+    with _lock:
+        _version = None
+
+
+def _reload(db: Session, version: int) -> None:
+    global _items, _index, _version
+    rows = (
+        db.query(models.DictItem)
+        .order_by(models.DictItem.sort_order, models.DictItem.id)
+        .all()
+    )
+    items = [
+        CachedDictItem(
+            id=r.id,
+            dict_type=r.dict_type,
+            code=r.code if isinstance(r.code, str) else str(r.code),
+            label=r.label,
+            is_active=bool(r.is_active),
+            is_deleted=bool(r.is_deleted),
+            sort_order=r.sort_order or 0,
+            created_at=r.created_at,
+        )
+        for r in rows
+    ]
+    index = {}
+    for item in items:
+        # 同类型同编码可能存在已删除的旧项，未删除项优先
+        key = (item.dict_type, item.code)
+        if key not in index or index[key].is_deleted:
+            index[key] = item
+    _items, _index, _version = items, index, version
+
+
+def _ensure_fresh(db: Session) -> None:
+    global _checked_at
+    now = time.monotonic()
+    with _lock:
+        if _version is not None and now - _checked_at < settings.DICT_CACHE_CHECK_SECONDS:
+            return
+        version = _read_version(db)
+        if version != _version:
+            _reload(db, version)
+        _checked_at = now
+
+
+def get_dict_items(
+    db: Session,
+    dict_type: Optional[str] = None,
+    include_inactive: bool = False,
+    include_deleted: bool = False,
+) -> List[CachedDictItem]:
+    """按 sort_order、id 排序的字典项列表，筛选条件同 GET /api/dict。"""
+    _ensure_fresh(db)
+    return [
+        item for item in _items
+        if (not dict_type or item.dict_type == dict_type)
+        and (include_deleted or not item.is_deleted)
+        and (include_inactive or item.is_active)
+    ]
+
+
+def get_dict_item(db: Session, dict_type: str, code) -> Optional[CachedDictItem]:
+    _ensure_fresh(db)
+    return _index.get((dict_type, str(code)))
+
+
+def get_label_map(db: Session, dict_type: str) -> Dict[str, str]:
+    """未删除字典项的编码 -> 显示名（含已停用项，历史数据仍需显示名称）。"""
+    return {
+        item.code: item.label or item.code
+        for item in get_dict_items(db, dict_type, include_inactive=True)
+    }
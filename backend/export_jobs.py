@@ -0,0 +1,228 @@
+"""
+后台导出任务：大批量导出不再占用 HTTP 请求与线程池直到渲染结束（nginx 60s 超时会中断），
+而是提交到有界工作线程池，渲染结果写入临时目录，前端轮询进度后再下载。
+"""
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .database import SessionLocal
+
+_logger = logging.getLogger(__name__)
+
+# 进度回调：参数为已写出的行数
+ProgressCallback = Callable[[int], None]
+# 渲染函数：接收进度回调，产出文件内容字节块
+RenderFunc = Callable[[ProgressCallback], Iterator[bytes]]
+
+# 任务中断（服务关闭取消、进程被终止）时写入的错误说明
+INTERRUPTED_ERROR = "任务已中断（服务重启或超时），请重新导出"
+
+_executor: Optional[ThreadPoolExecutor] = None
+# 本进程已提交、尚未结束的任务，关闭时据此把被取消的排队任务标记为失败
+_futures: Dict[int, Future] = {}
+_futures_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.EXPORT_JOB_WORKERS),
+            thread_name_prefix="export-job",
+        )
+    return _executor
+
+
+def shutdown_export_workers() -> None:
+    """应用关闭时停止工作线程：未开始的任务取消并标记为失败，进行中的任务随进程结束。"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    with _futures_lock:
+        cancelled = [job_id for job_id, future in _futures.items() if future.cancelled()]
+        _futures.clear()
+    for job_id in cancelled:
+        try:
+            _update_job(job_id, status="failed", error=INTERRUPTED_ERROR, finished_at=datetime.utcnow())
+        except Exception:
+            _logger.exception("导出任务 %s 取消后状态更新失败", job_id)
+
+
+def _stale_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(minutes=max(1, settings.EXPORT_JOB_STALE_MINUTES))
+
+
+def _last_heartbeat():
+    # 心跳列补建之前的任务没有 updated_at，按创建时间判断
+    return func.coalesce(models.ExportJob.updated_at, models.ExportJob.created_at)
+
+
+def count_active_jobs(db: Session) -> int:
+    """排队中与进行中的任务数，用于限制排队上限；心跳超过 EXPORT_JOB_STALE_MINUTES 未更新的视为已中断，不计入。"""
+    return (
+        db.query(models.ExportJob)
+        .filter(
+            models.ExportJob.status.in_(("pending", "running")),
+            _last_heartbeat() >= _stale_cutoff(),
+        )
+        .count()
+    )
+
+
+def fail_interrupted_jobs(db: Session) -> int:
+    """把心跳超过 EXPORT_JOB_STALE_MINUTES 未更新的排队/进行中任务标记为失败（所在进程已退出或被终止），返回条数。
+
+    只按心跳判断：多 worker 部署时其他进程的任务可能仍在正常进行，不能在启动时一律标记。
+    """
+    n = (
+        db.query(models.ExportJob)
+        .filter(
+            models.ExportJob.status.in_(("pending", "running")),
+            _last_heartbeat() < _stale_cutoff(),
+        )
+        .update(
+            {"status": "failed", "error": INTERRUPTED_ERROR, "finished_at": datetime.utcnow()},
+            synchronize_session=False,
+        )
+    )
+    if n:
+        db.commit()
+    return n
+
+
+def cleanup_expired_jobs(db: Session) -> None:
+    """删除超过保留时长的已完成任务文件，任务记录标记为 expired；顺带清理已中断的任务。"""
+    fail_interrupted_jobs(db)
+    cutoff = datetime.utcnow() - timedelta(hours=max(1, settings.EXPORT_JOB_TTL_HOURS))
+    expired = (
+        db.query(models.ExportJob)
+        .filter(
+            models.ExportJob.status.in_(("done", "failed")),
+            models.ExportJob.finished_at < cutoff,
+        )
+        .all()
+    )
+    for job in expired:
+        if job.file_path:
+            try:
+                os.remove(job.file_path)
+            except OSError:
+                pass
+        job.status = "expired"
+        job.file_path = None
+    if expired:
+        db.commit()
+
+
+def _update_job(job_id: int, only_status: Optional[str] = None, **values) -> int:
+    """用独立短会话更新任务状态（渲染会话持有服务端游标，不能中途提交）。
+
+    only_status 给出时仅在任务仍为该状态时更新（已被判定中断的任务不会被改回），返回更新行数。
+    """
+    db = SessionLocal()
+    try:
+        stmt = update(models.ExportJob).where(models.ExportJob.id == job_id)
+        if only_status is not None:
+            stmt = stmt.where(models.ExportJob.status == only_status)
+        n = db.execute(stmt.values(**values)).rowcount
+        db.commit()
+        return n
+    finally:
+        db.close()
+
+
+def _touch_queued_jobs(now: datetime) -> None:
+    """本进程排队中的任务随进度一起更新心跳：等待线程池空位不算中断。"""
+    with _futures_lock:
+        queued = [job_id for job_id, future in _futures.items() if not future.running() and not future.done()]
+    if not queued:
+        return
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(models.ExportJob)
+            .where(models.ExportJob.id.in_(queued), models.ExportJob.status == "pending")
+            .values(updated_at=now)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _run_export_job(job_id: int, render: RenderFunc, suffix: str) -> None:
+    os.makedirs(settings.EXPORT_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(settings.EXPORT_SPOOL_DIR, f"export_{job_id}{suffix}")
+    tmp_path = path + ".part"
+    now = datetime.utcnow()
+    if not _update_job(job_id, only_status="pending", status="running", updated_at=now):
+        # 排队期间已被判定中断（标记为失败），不再渲染
+        return
+    _touch_queued_jobs(now)
+    rows_done = 0
+
+    def progress(n: int) -> None:
+        nonlocal rows_done
+        rows_done = n
+        now = datetime.utcnow()
+        _update_job(job_id, only_status="running", rows_done=n, updated_at=now)
+        _touch_queued_jobs(now)
+
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in render(progress):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+        now = datetime.utcnow()
+        finished = _update_job(
+            job_id,
+            only_status="running",
+            status="done",
+            rows_done=rows_done,
+            file_path=path,
+            file_size=os.path.getsize(path),
+            finished_at=now,
+            updated_at=now,
+        )
+        if not finished:
+            # 渲染期间已被判定中断，保持失败状态，文件无人下载
+            _remove_file(path)
+    except Exception as e:
+        _logger.exception("导出任务 %s 失败", job_id)
+        _remove_file(tmp_path)
+        _update_job(
+            job_id, only_status="running", status="failed", error=str(e)[:500], finished_at=datetime.utcnow()
+        )
+
+
+def submit_export_job(job_id: int, render: RenderFunc, suffix: str) -> None:
+    """提交任务到后台线程池；任务记录须已提交（工作线程用独立会话读写）。"""
+    future = _get_executor().submit(_run_export_job, job_id, render, suffix)
+    with _futures_lock:
+        _futures[job_id] = future
+    future.add_done_callback(lambda f: _forget_future(job_id, f))
+
+
+def _forget_future(job_id: int, future: Future) -> None:
+    # 被取消的任务留给 shutdown_export_workers 标记为失败
+    if future.cancelled():
+        return
+    with _futures_lock:
+        if _futures.get(job_id) is future:
+            del _futures[job_id]
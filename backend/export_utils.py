@@ -0,0 +1,304 @@
+"""
+导出公共工具：使用记录、设备列表共用的 CSV / Excel / PDF 写出（CSV 边读边发，Excel / PDF 先写入临时文件再发送）。
+- openpyxl 写入模式（write_only）逐行追加，行数据直接落到临时 XML，不在内存中保留单元格对象；
+  xlsx 是 zip 包，须全部行写完才能打包，因此 Excel 是先落盘再发送（非边查边发），首字节要等全部渲染完成；
+- PDF 逐页直接绘制表格（避免单个超大 platypus Table 布局耗时随行数超线性增长），中文字体每进程只注册一次；
+- 设备二维码标签按 A4 多列多行排版（每页 LABEL_COLUMNS × LABEL_ROWS 张）；
+- 生成的文件写入临时文件后按块读出，交给 StreamingResponse 发送。
+"""
+import codecs
+import csv
+import os
+import tempfile
+from functools import lru_cache
+from io import BytesIO, StringIO
+from itertools import islice
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Excel 单个工作表最多 1048576 行（含表头）
+XLSX_MAX_ROWS = 1_048_575
+
+# 向客户端发送时每块字节数
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# CSV 每攒够多少行编码发送一次
+CSV_BATCH_ROWS = 1000
+
+# PDF 表格字号、行高与单元格内边距（pt）；每页行数按可用高度计算
+PDF_FONT_SIZE = 9
+PDF_ROW_HEIGHT = 18
+PDF_CELL_PADDING = 3
+# PDF 临时文件在内存中的上限，超出后落盘
+PDF_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+# 标签页：A4 纵向每页 3 列 × 8 行（常见 24 格不干胶标签纸），页边距与标签内文字字号（mm / pt）
+LABEL_COLUMNS = 3
+LABEL_ROWS = 8
+LABEL_MARGIN_X_MM = 5
+LABEL_MARGIN_Y_MM = 8.5
+LABEL_FONT_SIZE = 8
+
+
+def _iter_file_chunks(f, chunk_size: int) -> Iterator[bytes]:
+    f.seek(0)
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def iter_csv_chunks(
+    headers: Sequence[str],
+    rows: Iterable[List],
+    batch_rows: int = CSV_BATCH_ROWS,
+) -> Iterator[bytes]:
+    """UTF-8（带 BOM，Excel 可直接打开）CSV：先发表头，之后每 batch_rows 行编码发送一次，不在内存中拼接整个文件。"""
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(headers)
+    yield codecs.BOM_UTF8 + output.getvalue().encode("utf-8")
+    it = iter(rows)
+    for batch in iter(lambda: list(islice(it, batch_rows)), []):
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerows(batch)
+        yield output.getvalue().encode("utf-8")
+
+
+def iter_xlsx_chunks(
+    sheet_title: str,
+    headers: Sequence[str],
+    rows: Iterable[List],
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """按行写出单工作表 Excel（表头加粗）：边消费 rows 边写入临时文件，全部写完后才分块产出文件内容。
+
+    内存恒定，但不是流式发送：首个字节要等所有行渲染完成后才产出，大批量 Excel 应走后台导出任务，
+    避免同步请求在渲染期间被网关超时中断。
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+    bold = Font(bold=True)
+    header_cells = []
+    for h in headers:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.font = bold
+        header_cells.append(cell)
+    ws.append(header_cells)
+    for row in rows:
+        ws.append(row)
+    with tempfile.TemporaryFile() as f:
+        wb.save(f)
+        yield from _iter_file_chunks(f, chunk_size)
+
+
+@lru_cache(maxsize=1)
+def get_pdf_font_name() -> str:
+    """注册 PDF 中文字体并返回字体名；每进程只查找、注册一次（应用启动时预热）。"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    # 1) 优先尝试 ReportLab 内置 CID 字体（Adobe 亚洲语言包，若系统已安装）
+    try:
+        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+        pdfmetrics.registerFont(UnicodeCIDFont("STSong-Light"))
+        return "STSong-Light"
+    except Exception:
+        pass
+    # 2) 若未注册成功，尝试系统 TTF/TTC 字体
+    windir = os.environ.get("WINDIR", "C:\\Windows")
+    fonts_dir = os.path.join(windir, "Fonts")
+    # Windows 常见中文字体（.ttc 居多，.ttf 部分系统有）
+    candidate_paths = [
+        os.path.join(fonts_dir, "simsun.ttc"),
+        os.path.join(fonts_dir, "msyh.ttc"),
+        os.path.join(fonts_dir, "msyhbd.ttc"),
+        os.path.join(fonts_dir, "simsun.ttf"),
+        os.path.join(fonts_dir, "msyh.ttf"),
+        os.path.join(fonts_dir, "simhei.ttf"),
+        "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    ]
+    # 项目内 static/fonts 下的字体（可放置 SimSun.ttf 等）
+    static_fonts = os.path.join(os.path.dirname(__file__), "static", "fonts")
+    for name in ("SimSun.ttf", "SimHei.ttf", "msyh.ttf", "CJK.ttf"):
+        candidate_paths.append(os.path.join(static_fonts, name))
+    for path in candidate_paths:
+        if not os.path.isfile(path):
+            continue
+        try:
+            # TTC 需指定 subfontIndex（取第一个子字体）
+            if path.lower().endswith(".ttc"):
+                pdfmetrics.registerFont(TTFont("CJK", path, subfontIndex=0))
+            else:
+                pdfmetrics.registerFont(TTFont("CJK", path))
+            return "CJK"
+        except TypeError:
+            # 旧版 reportlab 无 subfontIndex，对 .ttc 直接传 path 可能报错，跳过
+            try:
+                pdfmetrics.registerFont(TTFont("CJK", path))
+                return "CJK"
+            except Exception:
+                pass
+        except Exception:
+            pass
+    return "Helvetica"
+
+
+def iter_pdf_chunks(
+    title: str,
+    headers: Sequence[str],
+    rows: Iterable[List],
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """横向 A4 表格 PDF：边消费 rows 边逐页直接绘制（表头每页重复），写入临时文件后分块产出。
+
+    不使用 platypus Table：每页按本页内容计算列宽后一次性输出文字与网格，耗时与行数线性相关。
+    """
+    from copy import copy
+
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfgen.canvas import Canvas
+    from reportlab.platypus import Paragraph
+
+    font_name = get_pdf_font_name()
+    page_w, page_h = landscape(A4)
+    margin_x, margin_y = 12 * mm, 15 * mm
+    header = ["" if h is None else str(h) for h in headers]
+    header_bg = colors.HexColor("#e0f2f1")
+
+    # 科室、类型、姓名等取值大量重复，缓存文字宽度（单次导出内有效）
+    width_cache: dict = {}
+
+    def text_width(val: str) -> float:
+        w = width_cache.get(val)
+        if w is None:
+            w = stringWidth(val, font_name, PDF_FONT_SIZE)
+            if len(width_cache) < 100_000:
+                width_cache[val] = w
+        return w
+
+    def draw_page(c, top: float, page_rows: List[List[str]]) -> None:
+        table = [header] + page_rows
+        widths = [
+            max(text_width(row[i]) for row in table) + 2 * PDF_CELL_PADDING
+            for i in range(len(header))
+        ]
+        xs = [margin_x]
+        for w in widths:
+            xs.append(xs[-1] + w)
+        ys = [top - i * PDF_ROW_HEIGHT for i in range(len(table) + 1)]
+        c.setFillColor(header_bg)
+        c.rect(xs[0], ys[1], xs[-1] - xs[0], PDF_ROW_HEIGHT, stroke=0, fill=1)
+        c.setFillColor(colors.black)
+        text = c.beginText()
+        text.setFont(font_name, PDF_FONT_SIZE)
+        for r, row in enumerate(table):
+            baseline = ys[r + 1] + PDF_CELL_PADDING + 0.25 * PDF_FONT_SIZE
+            for i, val in enumerate(row):
+                if val:
+                    text.setTextOrigin(xs[i] + PDF_CELL_PADDING, baseline)
+                    text.textOut(val)
+        c.drawText(text)
+        c.setStrokeColor(colors.grey)
+        c.setLineWidth(0.5)
+        c.grid(xs, ys)
+
+    with tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_MEMORY) as f:
+        c = Canvas(f, pagesize=(page_w, page_h))
+        title_style = copy(getSampleStyleSheet()["Title"])
+        title_style.fontName = font_name
+        para = Paragraph(title, title_style)
+        _, title_h = para.wrapOn(c, page_w - 2 * margin_x, page_h)
+        para.drawOn(c, margin_x, page_h - margin_y - title_h)
+        top = page_h - margin_y - title_h - 6
+        it = iter(rows)
+        first = True
+        while True:
+            # 本页可容纳的数据行数（扣除表头行）
+            capacity = max(1, int((top - margin_y) // PDF_ROW_HEIGHT) - 1)
+            page_rows = [
+                ["" if v is None else str(v) for v in row]
+                for row in islice(it, capacity)
+            ]
+            if not page_rows and not first:
+                break
+            first = False
+            draw_page(c, top, page_rows)
+            c.showPage()
+            top = page_h - margin_y
+            if len(page_rows) < capacity:
+                break
+        c.save()
+        yield from _iter_file_chunks(f, chunk_size)
+
+
+def iter_label_pdf_chunks(
+    labels: Iterable[Tuple[bytes, Sequence[str]]],
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """二维码标签页 PDF：labels 为 (二维码 PNG, 文字行) 序列，左侧二维码、右侧逐行文字，超宽截断加省略号。"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfgen.canvas import Canvas
+
+    font_name = get_pdf_font_name()
+    page_w, page_h = A4
+    margin_x, margin_y = LABEL_MARGIN_X_MM * mm, LABEL_MARGIN_Y_MM * mm
+    label_w = (page_w - 2 * margin_x) / LABEL_COLUMNS
+    label_h = (page_h - 2 * margin_y) / LABEL_ROWS
+    pad = 2 * mm
+    qr_size = label_h - 2 * pad
+    text_w = label_w - qr_size - 3 * pad
+    line_h = LABEL_FONT_SIZE * 1.4
+    per_page = LABEL_COLUMNS * LABEL_ROWS
+
+    def fit(val: str) -> str:
+        if stringWidth(val, font_name, LABEL_FONT_SIZE) <= text_w:
+            return val
+        while val and stringWidth(val + "…", font_name, LABEL_FONT_SIZE) > text_w:
+            val = val[:-1]
+        return val + "…"
+
+    with tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_MEMORY) as f:
+        c = Canvas(f, pagesize=(page_w, page_h))
+        n = 0
+        for image, lines in labels:
+            slot = n % per_page
+            if n and slot == 0:
+                c.showPage()
+            n += 1
+            x = margin_x + (slot % LABEL_COLUMNS) * label_w
+            y = page_h - margin_y - (slot // LABEL_COLUMNS + 1) * label_h
+            # 浅色裁切线
+            c.setStrokeColor(colors.lightgrey)
+            c.setLineWidth(0.3)
+            c.rect(x, y, label_w, label_h, stroke=1, fill=0)
+            c.drawImage(ImageReader(BytesIO(image)), x + pad, y + pad, qr_size, qr_size)
+            text = c.beginText()
+            text.setFont(font_name, LABEL_FONT_SIZE)
+            text.setTextOrigin(x + qr_size + 2 * pad, y + label_h - pad - LABEL_FONT_SIZE)
+            text.setLeading(line_h)
+            for line in lines:
+                text.textLine(fit("" if line is None else str(line)))
+            c.drawText(text)
+        if n == 0:
+            c.setFont(font_name, LABEL_FONT_SIZE)
+            c.drawString(margin_x, page_h - margin_y - LABEL_FONT_SIZE, "没有符合条件的设备")
+        c.showPage()
+        c.save()
+        yield from _iter_file_chunks(f, chunk_size)
@@ -1,6 +1,7 @@
 import logging
 import os
 import pathlib
+from datetime import date
 
 from fastapi import FastAPI, Request
 from fastapi.openapi.docs import get_swagger_ui_html
@@ -8,9 +9,17 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
+from .audit import shutdown_audit_writer
+from .audit_retention import ensure_partitions as ensure_audit_partitions
 from .config import JWT_SECRET_DEFAULT, settings
 from .database import Base, engine
 from .device_code_utils import normalize_device_code
+from .device_state import rebuild_device_state
+from .dict_cache import bump_dict_version
+from .export_jobs import fail_interrupted_jobs, shutdown_export_workers
+from .export_utils import get_pdf_font_name
+from .qrcode_utils import shutdown_qr_render_pool
+from .usage_rollup import ROLLUP_BACKFILL_LOCK_KEY, rebuild_usage_rollup
 from . import models
 from . import routes_auth, routes_audit, routes_dashboard, routes_devices, routes_dict, routes_usage, routes_users, routes_wecom
 from .admin_access import AdminAccessMiddleware
@@ -57,20 +66,69 @@ def create_app() -> FastAPI:
         ("usage_records", "photo_urls", "TEXT"),
         ("usage_records", "terminal_disinfection", "TEXT"),
         ("devices", "is_deleted", "BOOLEAN DEFAULT FALSE"),
+        ("usage_records", "idempotency_key", "VARCHAR(128)"),
+        ("devices", "open_borrow_count", "INTEGER DEFAULT 0"),
+        ("devices", "open_repair_count", "INTEGER DEFAULT 0"),
+        ("export_jobs", "updated_at", "TIMESTAMP"),
+        ("audit_logs", "details_json", "JSONB" if engine.dialect.name == "postgresql" else "JSON"),
+    ]
+    # 已有表补建索引（create_all 不会为已存在的表新建索引），索引已存在则忽略；已被替换的旧索引在此删除
+    _add_indexes = [
+        "CREATE INDEX IF NOT EXISTS ix_usage_user_device_created ON usage_records (user_id, device_code, created_at)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_usage_user_idempotency ON usage_records (user_id, idempotency_key)",
+        "CREATE INDEX IF NOT EXISTS ix_audit_created_id ON audit_logs (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_audit_action_created ON audit_logs (action, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_audit_actor_created ON audit_logs (actor_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_audit_target_created ON audit_logs (target_type, created_at, id)",
+        # 未归还借用部分索引已改为唯一索引 ux_usage_open_borrow（下方按模型创建），删除旧的非唯一索引，避免重复维护
+        "DROP INDEX IF EXISTS ix_usage_open_borrow",
+    ]
+    # 部分索引由模型定义按方言生成 WHERE 条件（与 ORM 查询条件的写法一致，规划器才会选用）；
+    # 审计详情 GIN 索引与 count 表达式索引只在 PostgreSQL 上创建
+    _add_model_indexes = [
+        "ux_usage_open_borrow", "ix_usage_open_repair", "ix_audit_details_json", "ix_audit_details_count",
     ]
     try:
         from sqlalchemy import text
         with engine.connect() as conn:
+            added_columns = set()
             for table, col, type_sql in _add_columns:
                 try:
                     conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col} {type_sql}"))
                     conn.commit()
+                    added_columns.add((table, col))
                 except Exception as e:
                     err = str(e).lower()
                     if "duplicate column" in err or "already exists" in err:
                         pass
                     else:
                         _logger.warning("自迁移 %s.%s 跳过: %s", table, col, e)
+                    conn.rollback()
+            for index_sql in _add_indexes:
+                try:
+                    conn.execute(text(index_sql))
+                    conn.commit()
+                except Exception as e:
+                    _logger.warning("自迁移索引跳过: %s (%s)", index_sql, e)
+                    conn.rollback()
+            model_indexes = {ix.name: ix for t in Base.metadata.tables.values() for ix in t.indexes}
+            for index_name in _add_model_indexes:
+                try:
+                    model_indexes[index_name].create(conn, checkfirst=True)
+                    conn.commit()
+                except Exception as e:
+                    _logger.warning("自迁移索引跳过: %s (%s)", index_name, e)
+                    conn.rollback()
+        # 设备实时状态计数列刚补上时按已有登记记录回填一次
+        if ("devices", "open_borrow_count") in added_columns:
+            from .database import SessionLocal
+
+            db = SessionLocal()
+            try:
+                rebuild_device_state(db)
+                db.commit()
+            finally:
+                db.close()
     except Exception:
         _logger.exception("轻量自迁移失败（请检查数据库权限或手工执行迁移）")
     # 字典表为空时写入初始数据
@@ -91,10 +149,34 @@ def create_app() -> FastAPI:
                 ("device_status", 5, "报废", 5),
             ]:
                 db.add(models.DictItem(dict_type=item[0], code=str(item[1]), label=item[2], sort_order=item[3]))
+            bump_dict_version(db)
             db.commit()
         db.close()
     except Exception:
         _logger.exception("字典种子数据写入失败")
+    # 按日汇总表为空而已有登记记录（首次升级）时回填一次；
+    # PostgreSQL 下先取事务级咨询锁，多 worker 同时启动时其余 worker 等待后看到汇总已有数据即跳过
+    try:
+        db = SessionLocal()
+        try:
+            if db.get_bind().dialect.name == "postgresql":
+                db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": ROLLUP_BACKFILL_LOCK_KEY})
+            if (
+                db.query(models.UsageDailyRollup).first() is None
+                and db.query(models.UsageRecord.id).first() is not None
+            ):
+                rebuild_usage_rollup(db)
+            db.commit()
+        finally:
+            db.close()
+    except Exception:
+        _logger.exception("使用记录按日汇总回填失败（可手工运行 run_rebuild_usage_rollup.py）")
+    # 审计表已按月分区（PostgreSQL）时补建本月及后续月份分区，维护任务漏跑也不会全部落入 default 分区
+    try:
+        with engine.begin() as conn:
+            ensure_audit_partitions(conn, date.today(), settings.AUDIT_PARTITION_MONTHS_AHEAD)
+    except Exception:
+        _logger.exception("审计分区补建失败（可手工运行 run_audit_maintenance.py partitions）")
 
     app = FastAPI(
         title=_DOCS_TITLE,
@@ -114,6 +196,31 @@ def create_app() -> FastAPI:
             if os.getenv("ENVIRONMENT", "").lower() == "production":
                 raise RuntimeError("生产环境必须设置 JWT_SECRET 环境变量，且不可使用默认值")
 
+    @app.on_event("startup")
+    def _register_pdf_font():
+        # PDF 中文字体每进程只查找、注册一次，避免每次导出重复扫描字体路径
+        try:
+            get_pdf_font_name()
+        except Exception:
+            _logger.exception("PDF 中文字体注册失败，导出 PDF 时将回退默认字体")
+
+    @app.on_event("startup")
+    def _fail_interrupted_export_jobs():
+        # 上次进程退出或被终止时遗留的排队/进行中任务标记为失败，避免长期占用排队名额
+        db = SessionLocal()
+        try:
+            fail_interrupted_jobs(db)
+        except Exception:
+            _logger.exception("中断的导出任务清理失败")
+        finally:
+            db.close()
+
+    @app.on_event("shutdown")
+    def _stop_export_workers():
+        shutdown_export_workers()
+        shutdown_qr_render_pool()
+        shutdown_audit_writer()
+
     @app.get("/health")
     async def health_check():
         return {"status": "ok"}
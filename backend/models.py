@@ -2,15 +2,19 @@ from datetime import date, datetime
 from typing import Optional
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Date,
     DateTime,
     ForeignKey,
     Index,
     Integer,
+    JSON,
     String,
     Text,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 from .database import Base
@@ -58,6 +62,9 @@ class Device(Base):
     )
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False)  # 软删除标识
+    # 实时状态投影：未归还借用、未完成维修条数，随登记/归还/维修完成/撤销在同一事务内增减（见 device_state.py）
+    open_borrow_count: Mapped[int] = mapped_column(Integer, default=0)
+    open_repair_count: Mapped[int] = mapped_column(Integer, default=0)
     created_by: Mapped[Optional[int]] = mapped_column(
         Integer, ForeignKey("users.id"), nullable=True
     )
@@ -69,6 +76,13 @@ class Device(Base):
         "UsageRecord", back_populates="device"
     )
 
+    @property
+    def live_status(self) -> str:
+        """实时状态编码：人工状态叠加未归还借用（使用中）、未完成维修（维修中）。"""
+        from .device_state import derive_live_status
+
+        return derive_live_status(self.status, self.open_borrow_count, self.open_repair_count)
+
     __table_args__ = (
         Index("ix_devices_active_deleted", "is_active", "is_deleted"),
     )
@@ -116,6 +130,8 @@ class UsageRecord(Base):
     )  # 逗号分隔的 URL 列表
 
     source: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    # 客户端幂等键（请求头 Idempotency-Key 或批量条目字段），同一用户内唯一，重试时返回原记录
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.utcnow
     )
@@ -134,9 +150,29 @@ class UsageRecord(Base):
     __table_args__ = (
         Index("ix_usage_user_start", "user_id", "start_time"),
         Index("ix_usage_device_start", "device_code", "start_time"),
+        # 未带幂等键的提交仍按时间窗口防重复，覆盖 (user_id, device_code, created_at) 查询
+        Index("ix_usage_user_device_created", "user_id", "device_code", "created_at"),
+        Index("ux_usage_user_idempotency", "user_id", "idempotency_key", unique=True),
     )
 
 
+# 未归还借用 / 未完成维修的部分索引：只收录未闭环的少量行，借用互斥检查与「当前借出/维修中」列表走此索引。
+# 借用索引为唯一索引：同一设备最多一条未归还借用，并发借用同一设备时由数据库拦下后到者
+Index(
+    "ux_usage_open_borrow",
+    UsageRecord.device_code,
+    unique=True,
+    postgresql_where=(UsageRecord.usage_type == "2") & UsageRecord.returned_at.is_(None) & UsageRecord.is_deleted.is_(False),
+    sqlite_where=(UsageRecord.usage_type == "2") & UsageRecord.returned_at.is_(None) & UsageRecord.is_deleted.is_(False),
+)
+Index(
+    "ix_usage_open_repair",
+    UsageRecord.device_code,
+    postgresql_where=(UsageRecord.usage_type == "3") & UsageRecord.repair_completed_at.is_(None) & UsageRecord.is_deleted.is_(False),
+    sqlite_where=(UsageRecord.usage_type == "3") & UsageRecord.repair_completed_at.is_(None) & UsageRecord.is_deleted.is_(False),
+)
+
+
 class DictItem(Base):
     """字典项：使用类型、设备状态等；编码为数字且同类型内唯一，支持软删除与启用/停用。"""
     __tablename__ = "dict_items"
@@ -153,6 +189,55 @@ class DictItem(Base):
     )
 
 
+class UsageDailyRollup(Base):
+    """使用记录按日汇总：登记/撤销时同一事务内增减，工作台统计与趋势直接读取。"""
+    __tablename__ = "usage_daily_rollup"
+
+    registration_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    dept: Mapped[str] = mapped_column(String(128), primary_key=True, default="")  # 设备科室，无科室为空串
+    usage_type: Mapped[str] = mapped_column(String(32), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class CacheVersion(Base):
+    """进程内缓存的版本号：数据变更时递增，各 worker 比对后重载（多进程部署下缓存失效）。"""
+    __tablename__ = "cache_versions"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class ExportJob(Base):
+    """后台导出任务：大批量导出在工作线程中渲染到临时目录，前端轮询进度后下载。"""
+    __tablename__ = "export_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    created_by: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), index=True)
+    format: Mapped[str] = mapped_column(String(16))  # csv / xlsx / pdf
+    params: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # 筛选条件 JSON
+    status: Mapped[str] = mapped_column(
+        String(16), default="pending"
+    )  # pending / running / done / failed / expired
+    rows_total: Mapped[int] = mapped_column(Integer, default=0)
+    rows_done: Mapped[int] = mapped_column(Integer, default=0)
+    file_path: Mapped[Optional[str]] = mapped_column(String(512), nullable=True)
+    file_size: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow
+    )
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # 心跳：开始渲染与每批进度时更新（本进程排队中的任务随之一并更新），超时未更新视为已中断
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, default=datetime.utcnow)
+
+
+# 审计详情 count 的 PostgreSQL 表达式：索引定义与查询条件须逐字一致，规划器才会选用
+AUDIT_DETAILS_COUNT_IS_NUMBER_SQL = "jsonb_typeof(details_json -> 'count') = 'number'"
+AUDIT_DETAILS_COUNT_SQL = (
+    f"(CASE WHEN {AUDIT_DETAILS_COUNT_IS_NUMBER_SQL} THEN (details_json ->> 'count')::numeric END)"
+)
+
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
@@ -164,6 +249,11 @@ class AuditLog(Base):
     target_type: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     target_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     details: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # 结构化详情（如 {"device_code": "XYZ"}、{"format": "csv", "count": 123}），PostgreSQL 为 JSONB；
+    # details 文本列保留给旧记录与列表展示
+    details_json: Mapped[Optional[dict]] = mapped_column(
+        JSON().with_variant(JSONB(), "postgresql"), nullable=True
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.utcnow
     )
@@ -172,3 +262,25 @@ class AuditLog(Base):
         "User", foreign_keys=[actor_id]
     )
 
+    # 审计页按时间倒序游标分页，各筛选条件在前、(created_at, id) 在后，筛选与 seek 都走同一索引
+    __table_args__ = (
+        Index("ix_audit_created_id", "created_at", "id"),
+        Index("ix_audit_action_created", "action", "created_at", "id"),
+        Index("ix_audit_actor_created", "actor_id", "created_at", "id"),
+        Index("ix_audit_target_created", "target_type", "created_at", "id"),
+        # 按详情字段筛选（@> 包含查询）走 GIN 索引，仅 PostgreSQL 创建
+        Index(
+            "ix_audit_details_json",
+            "details_json",
+            postgresql_using="gin",
+            postgresql_ops={"details_json": "jsonb_path_ops"},
+        ).ddl_if(dialect="postgresql"),
+        # 详情 count 的数值范围筛选（如导出超过 1 万行）：GIN 只支持包含查询，另建表达式索引；
+        # 非数值的 count 经 CASE 变为 NULL，不会使转换报错
+        Index(
+            "ix_audit_details_count",
+            text(AUDIT_DETAILS_COUNT_SQL),
+            postgresql_where=text(AUDIT_DETAILS_COUNT_IS_NUMBER_SQL),
+        ).ddl_if(dialect="postgresql"),
+    )
+
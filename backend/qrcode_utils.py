@@ -0,0 +1,223 @@
+"""
+设备二维码图片：按内容寻址缓存渲染结果，避免管理后台查看、批量打印标签时反复渲染。
+
+缓存键为 sha256(最终二维码内容 + 格式 + 模块尺寸)，同一内容同一参数的图片字节恒定，
+因此键同时用作 HTTP ETag；设备编号或 qr_value 变化后内容不同、键随之变化，无需主动失效。
+先查进程内 LRU（按字节数封顶），再查磁盘目录 QR_CACHE_DIR（多 worker、重启后共享），都未命中才渲染。
+批量取图（标签打印）时未命中的图片交给进程池并行渲染，PIL 光栅化不受 GIL 限制。
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from itertools import repeat
+from typing import List, Optional, Sequence, Tuple
+
+import qrcode
+from qrcode.image.svg import SvgPathImage
+
+from .config import settings
+
+QR_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+DEFAULT_BOX_SIZE = 10
+# 批量渲染时未命中数不少于该值才使用进程池，少量图片进程间传输反而更慢
+QR_PARALLEL_MIN = 64
+
+_logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_cache_bytes = 0
+
+_pool_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def device_qr_value(device) -> str:
+    """设备二维码的最终内容：必须为完整 URL，否则企微/浏览器扫码无法打开。"""
+    qr_value = getattr(device, "qr_value", None)
+    if qr_value and (qr_value.startswith("http://") or qr_value.startswith("https://")):
+        return qr_value
+    relative = (qr_value or f"/h5/scan?device_code={device.device_code}").strip()
+    if not relative.startswith("/"):
+        relative = "/" + relative
+    return f"{settings.BASE_URL.rstrip('/')}{relative}"
+
+
+def qr_cache_key(qr_value: str, fmt: str, box_size: int) -> str:
+    return hashlib.sha256(f"{fmt}\n{box_size}\n{qr_value}".encode("utf-8")).hexdigest()
+
+
+def _render(qr_value: str, fmt: str, box_size: int) -> bytes:
+    buf = BytesIO()
+    if fmt == "svg":
+        # 矢量路径输出：打印时任意缩放不失真（耗时主要在二维码编码，与 PNG 相近）
+        qrcode.make(qr_value, image_factory=SvgPathImage, box_size=box_size).save(buf)
+        return buf.getvalue()
+    img = qrcode.make(qr_value, box_size=box_size)
+    # 兼容 PIL 与 pypng 等后端：PIL 用 format="PNG"，pypng 只支持 .save(buf)
+    try:
+        img.save(buf, format="PNG")
+    except TypeError:
+        img.save(buf)
+    return buf.getvalue()
+
+
+def _remember(key: str, data: bytes) -> None:
+    global _cache_bytes
+    limit = settings.QR_CACHE_MAX_BYTES
+    if limit <= 0 or len(data) > limit:
+        return
+    with _lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= len(old)
+        _cache[key] = data
+        _cache_bytes += len(data)
+        while _cache_bytes > limit:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+
+def _disk_path(key: str, fmt: str) -> Optional[str]:
+    if not settings.QR_CACHE_DIR:
+        return None
+    # 按键前两位分子目录，避免单目录文件过多
+    return os.path.join(settings.QR_CACHE_DIR, key[:2], f"{key}.{fmt}")
+
+
+def _read_disk(path: Optional[str]) -> Optional[bytes]:
+    if not path:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_disk(path: Optional[str], data: bytes) -> None:
+    """写临时文件再原子替换，并发写同一键时读者不会读到半个文件；写失败（只读目录等）只影响缓存。"""
+    if not path:
+        return
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def get_qr_image(qr_value: str, fmt: str = "png", box_size: int = DEFAULT_BOX_SIZE) -> Tuple[str, bytes]:
+    """返回 (缓存键, 图片字节)；fmt 为 png 或 svg。"""
+    key = qr_cache_key(qr_value, fmt, box_size)
+    with _lock:
+        data = _cache.get(key)
+        if data is not None:
+            _cache.move_to_end(key)
+            return key, data
+    path = _disk_path(key, fmt)
+    data = _read_disk(path)
+    if data is None:
+        data = _render(qr_value, fmt, box_size)
+        _write_disk(path, data)
+    _remember(key, data)
+    return key, data
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn 而非 fork：应用进程内有工作线程与数据库连接，fork 出的子进程可能继承被持有的锁
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.QR_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_qr_render_pool() -> None:
+    """应用关闭时停止渲染进程。"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _render_many(values: List[str], fmt: str, box_size: int) -> List[bytes]:
+    workers = settings.QR_RENDER_WORKERS
+    if workers > 1 and len(values) >= QR_PARALLEL_MIN:
+        chunksize = max(1, len(values) // (workers * 4))
+        try:
+            return list(_get_render_pool().map(_render, values, repeat(fmt), repeat(box_size), chunksize=chunksize))
+        except Exception:
+            # 进程池不可用（受限环境、子进程异常退出等）时退回本进程渲染
+            _logger.warning("QR render pool failed, rendering in-process", exc_info=True)
+            shutdown_qr_render_pool()
+    return [_render(v, fmt, box_size) for v in values]
+
+
+def get_qr_images(qr_values: Sequence[str], fmt: str = "png", box_size: int = DEFAULT_BOX_SIZE) -> List[bytes]:
+    """批量取图（顺序与 qr_values 一致）：缓存命中的直接返回，其余去重后并行渲染并写回缓存。"""
+    keys = [qr_cache_key(v, fmt, box_size) for v in qr_values]
+    found = {}
+    with _lock:
+        for key in keys:
+            data = _cache.get(key)
+            if data is not None:
+                _cache.move_to_end(key)
+                found[key] = data
+    missing = {}
+    for key, value in zip(keys, qr_values):
+        if key in found or key in missing:
+            continue
+        data = _read_disk(_disk_path(key, fmt))
+        if data is not None:
+            found[key] = data
+            _remember(key, data)
+        else:
+            missing[key] = value
+    if missing:
+        rendered = _render_many(list(missing.values()), fmt, box_size)
+        for key, data in zip(missing.keys(), rendered):
+            _write_disk(_disk_path(key, fmt), data)
+            _remember(key, data)
+            found[key] = data
+    return [found[key] for key in keys]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中（支持 *、逗号分隔多个值与弱校验 W/ 前缀）。"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def clear_qr_cache() -> None:
+    """清空进程内缓存（磁盘文件按内容寻址，无需清理）。"""
+    global _cache_bytes
+    with _lock:
+        _cache.clear()
+        _cache_bytes = 0
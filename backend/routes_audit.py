@@ -1,68 +1,151 @@
 """审计日志查询 API，仅管理员可访问。"""
+import re
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import and_, func, literal_column, or_, text, tuple_, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Session, joinedload
 
 from . import models, schemas
 from .auth import require_role
+from .cursor_utils import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 from .database import get_db
 from .time_utils import parse_naive_as_china_then_utc
 
 router = APIRouter(prefix="/api/audit-logs", tags=["audit"])
 
+_DETAIL_KEY_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _parse_detail_filters(items: Optional[List[str]]) -> Dict[str, List[Any]]:
+    """detail=key=value 列表解析为 {key: [候选值]}；数字、true/false 同时按字符串与对应 JSON 类型匹配。"""
+    result: Dict[str, List[Any]] = {}
+    for item in items or []:
+        key, sep, value = item.partition("=")
+        key, value = key.strip(), value.strip()
+        if not sep or not _DETAIL_KEY_RE.match(key):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f"详情筛选格式应为 字段=值：{item}"
+            )
+        candidates: List[Any] = [value]
+        if re.fullmatch(r"-?\d{1,18}", value):
+            candidates.append(int(value))
+        elif value in ("true", "false"):
+            candidates.append(value == "true")
+        result[key] = candidates
+    return result
+
+
+def _details_match(dialect: str, key: str, candidates: List[Any]):
+    """details_json 中 key 等于任一候选值；PostgreSQL 用 @> 包含查询以走 GIN 索引。"""
+    col = models.AuditLog.details_json
+    if dialect == "postgresql":
+        doc = type_coerce(col, JSONB)
+        return or_(*[doc.contains({key: v}) for v in candidates])
+    return or_(*[func.json_extract(col, f"$.{key}") == v for v in candidates])
+
+
+def _device_codes_by_id(db: Session, rows: List[models.AuditLog]) -> Dict[int, str]:
+    """本页所有设备类审计对象的编号，一次 IN 查询取回。"""
+    ids = {r.target_id for r in rows if r.target_type == "device" and r.target_id is not None}
+    if not ids:
+        return {}
+    return dict(
+        db.query(models.Device.id, models.Device.device_code).filter(models.Device.id.in_(ids)).all()
+    )
+
+
+def _details_count_at_least(dialect: str, n: int):
+    """details_json 中数值型 count 不小于 n；非数值（字符串、缺失）不匹配也不报错。
+
+    PostgreSQL 的条件与表达式索引 ix_audit_details_count 的定义逐字一致，范围查询走该索引
+    （GIN jsonb_path_ops 只支持 @> 等包含查询）。
+    """
+    if dialect == "postgresql":
+        return and_(
+            text(models.AUDIT_DETAILS_COUNT_IS_NUMBER_SQL),
+            literal_column(models.AUDIT_DETAILS_COUNT_SQL) >= n,
+        )
+    col = models.AuditLog.details_json
+    return and_(
+        func.json_type(col, "$.count").in_(("integer", "real")),
+        func.json_extract(col, "$.count") >= n,
+    )
+
 
 @router.get("", response_model=List[schemas.AuditLogRead])
 def list_audit_logs(
+    response: Response,
     action: Optional[str] = Query(None, description="操作类型筛选，如 device.create"),
     actor_id: Optional[int] = Query(None, description="操作人 ID"),
     target_type: Optional[str] = Query(None, description="对象类型，如 device"),
     from_time: Optional[datetime] = Query(None, description="开始时间"),
     to_time: Optional[datetime] = Query(None, description="结束时间"),
     limit: int = Query(200, ge=1, le=500, description="最多返回条数"),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页响应头 X-Next-Cursor 的值"),
+    device_code: Optional[str] = Query(None, description="结构化详情中的设备编号"),
+    detail: Optional[List[str]] = Query(None, description="结构化详情筛选，格式 字段=值，可重复，如 format=csv"),
+    min_count: Optional[int] = Query(None, ge=0, description="结构化详情 count 不小于该值（如导出行数）"),
     db: Session = Depends(get_db),
     _user=Depends(require_role("device_admin", "sys_admin")),
 ):
+    """按时间倒序返回审计日志；传 cursor 时按 (created_at, id) 做 seek 分页，下一页游标见响应头 X-Next-Cursor。"""
+    try:
+        after = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    detail_filters = _parse_detail_filters(detail)
+    if device_code:
+        detail_filters["device_code"] = [device_code.strip()]
+    A = models.AuditLog
     query = (
-        db.query(models.AuditLog)
-        .options(joinedload(models.AuditLog.actor))
-        .order_by(models.AuditLog.created_at.desc())
+        db.query(A)
+        .options(joinedload(A.actor))
+        .order_by(A.created_at.desc(), A.id.desc())
     )
     if action:
-        query = query.filter(models.AuditLog.action == action)
+        query = query.filter(A.action == action)
     if actor_id is not None:
-        query = query.filter(models.AuditLog.actor_id == actor_id)
+        query = query.filter(A.actor_id == actor_id)
     if target_type:
-        query = query.filter(models.AuditLog.target_type == target_type)
+        query = query.filter(A.target_type == target_type)
     if from_time:
         from_utc = parse_naive_as_china_then_utc(from_time)
         if from_utc:
-            query = query.filter(models.AuditLog.created_at >= from_utc)
+            query = query.filter(A.created_at >= from_utc)
     if to_time:
         to_utc = parse_naive_as_china_then_utc(to_time)
         if to_utc:
-            query = query.filter(models.AuditLog.created_at <= to_utc)
+            query = query.filter(A.created_at <= to_utc)
+    if detail_filters:
+        dialect = db.get_bind().dialect.name
+        for key, candidates in detail_filters.items():
+            query = query.filter(_details_match(dialect, key, candidates))
+    if min_count is not None:
+        query = query.filter(_details_count_at_least(db.get_bind().dialect.name, min_count))
+    if after is not None:
+        # 单独的 created_at 上界让按月分区的表（PostgreSQL）只扫描游标之前的分区，行比较条件不参与分区裁剪
+        query = query.filter(
+            A.created_at <= after[0], tuple_(A.created_at, A.id) < tuple_(after[0], after[1])
+        )
     rows = query.limit(limit).all()
-    result = []
-    for r in rows:
-        target_code = None
-        if r.target_type == "device" and r.target_id is not None:
-            dev = db.query(models.Device).filter(
-                models.Device.id == r.target_id
-            ).first()
-            if dev:
-                target_code = dev.device_code
-        item = schemas.AuditLogRead(
+    if len(rows) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    device_codes = _device_codes_by_id(db, rows)
+    return [
+        schemas.AuditLogRead(
             id=r.id,
             actor_id=r.actor_id,
             actor_name=(r.actor.real_name or getattr(r.actor, "username", None)) if r.actor else None,
             action=r.action,
             target_type=r.target_type,
             target_id=r.target_id,
-            target_code=target_code,
+            target_code=device_codes.get(r.target_id) if r.target_type == "device" else None,
             details=r.details,
+            details_json=r.details_json,
             created_at=r.created_at,
         )
-        result.append(item)
-    return result
+        for r in rows
+    ]
@@ -6,7 +6,7 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.orm import Session
 
 from . import models
-from .audit import log_audit
+from .audit import log_audit, log_audit_deferred
 from .auth import (
     create_access_token,
     get_wecom_userid,
@@ -97,13 +97,13 @@ def wecom_callback(
         )
         db.add(user)
         db.flush()
-        log_audit(db, user.id, "auth.login", "user", user.id, "wecom", do_commit=False)
+        log_audit(db, user.id, "auth.login", "user", user.id, "wecom", do_commit=False, method="wecom")
         db.commit()
         db.refresh(user)
     else:
         if getattr(user, "is_active", True) is False:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="账号已停用，请联系管理员")
-        log_audit(db, user.id, "auth.login", "user", user.id, "wecom")
+        log_audit_deferred(user.id, "auth.login", "user", user.id, "wecom", method="wecom")
     token = create_access_token(user)
     # 开放重定向防护：仅允许以单斜杠开头的相对路径，且不含 //
     next_path = (state or "").strip() or "/h5/scan"
@@ -152,7 +152,7 @@ def login(
             )
             db.add(user)
             db.flush()
-            log_audit(db, user.id, "auth.login", "user", user.id, "password", do_commit=False)
+            log_audit(db, user.id, "auth.login", "user", user.id, "password", do_commit=False, method="password")
             db.commit()
             db.refresh(user)
             token = create_access_token(user)
@@ -167,7 +167,7 @@ def login(
         if not verify_password(password, user.password_hash):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="用户名或密码错误")
     token = create_access_token(user)
-    log_audit(db, user.id, "auth.login", "user", user.id, "password")
+    log_audit_deferred(user.id, "auth.login", "user", user.id, "password", method="password")
     return {"access_token": token, "token_type": "bearer"}
 
 
@@ -1,13 +1,18 @@
-"""工作台统计：设备数、用户数、使用记录总数及今日/本周/本月登记量。"""
+"""工作台统计：设备数、用户数、使用记录总数及今日/本周/本月登记量；使用记录按日趋势。
+使用记录数读取按日汇总表 usage_daily_rollup（见 usage_rollup.py），不扫描 usage_records。"""
+import threading
+import time
 from datetime import date, timedelta
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 
 from . import models
 from .auth import get_current_user_optional, require_role
+from .config import settings
 from .database import get_db
 from .time_utils import china_today
+from sqlalchemy import and_, case, func, literal, select, true
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
@@ -31,56 +36,126 @@ def _china_month_range() -> tuple[date, date]:
     return first, last
 
 
+_stats_lock = threading.Lock()
+_stats_cache: Optional[Tuple[float, date, Dict[str, int]]] = None  # (过期时刻, 计算时的日期, 结果)
+
+
+def _compute_dashboard_stats(db: Session) -> Dict[str, int]:
+    """两条查询：设备各状态数（FILTER 条件计数）连同启用用户数一条，使用记录数读汇总表一条。"""
+    today = china_today()
+    week_start, week_end = _china_week_range()
+    month_start, month_end = _china_month_range()
+
+    # 设备数：口径同 _devices_query（管理员视角：全部/启用/停用/已删除）
+    from .routes_devices import _devices_table_has_is_deleted
+
+    D = models.Device
+    if _devices_table_has_is_deleted():
+        not_deleted = D.is_deleted.is_(False)
+        deleted_count = func.count().filter(D.is_deleted.is_(True))
+    else:
+        not_deleted = true()
+        deleted_count = literal(0)
+    users_total = (
+        select(func.count())
+        .select_from(models.User)
+        .where(models.User.is_active.is_(True))
+        .scalar_subquery()
+    )
+    (
+        devices_total, devices_active, devices_inactive, devices_deleted,
+        devices_borrowed, devices_in_repair, users_total,
+    ) = db.query(
+        func.count(),
+        func.count().filter(D.is_active.is_(True), not_deleted),
+        func.count().filter(D.is_active.is_(False), not_deleted),
+        deleted_count,
+        # 实时状态投影（device_state.py）：有未归还借用 / 未完成维修的设备
+        func.count().filter(D.open_borrow_count > 0, not_deleted),
+        func.count().filter(D.open_repair_count > 0, not_deleted),
+        users_total,
+    ).select_from(D).one()
+
+    # 使用记录：总数 + 今日/本周/本月（按登记日期，不含已撤销），一条查询读汇总表
+    R = models.UsageDailyRollup
+
+    def _sum_between(start: date, end: date):
+        return func.coalesce(func.sum(case(
+            (and_(R.registration_date >= start, R.registration_date <= end), R.count), else_=0,
+        )), 0)
+
+    usage_total, usage_today, usage_week, usage_month = db.query(
+        func.coalesce(func.sum(R.count), 0),
+        _sum_between(today, today),
+        _sum_between(week_start, week_end),
+        _sum_between(month_start, month_end),
+    ).one()
+
+    return {
+        "devices_total": int(devices_total),
+        "devices_active": int(devices_active),
+        "devices_inactive": int(devices_inactive),
+        "devices_deleted": int(devices_deleted),
+        "devices_borrowed": int(devices_borrowed),
+        "devices_in_repair": int(devices_in_repair),
+        "users_total": int(users_total),
+        "usage_total": int(usage_total),
+        "usage_today": int(usage_today),
+        "usage_week": int(usage_week),
+        "usage_month": int(usage_month),
+    }
+
+
 @router.get("/stats", response_model=Dict[str, Any])
 def get_dashboard_stats(
     db: Session = Depends(get_db),
     _user=Depends(require_role("device_admin", "sys_admin")),
 ):
-    """工作台统计：设备/用户/使用记录总数，及今日、本周、本月登记量（按登记日期）。"""
+    """工作台统计：设备/用户/使用记录总数，及今日、本周、本月登记量（按登记日期）。
+
+    结果在本进程缓存 DASHBOARD_CACHE_TTL_SECONDS 秒；缓存过期时并发请求排队等待同一次计算，不重复查库。
+    """
+    global _stats_cache
+    ttl = settings.DASHBOARD_CACHE_TTL_SECONDS
+    if ttl <= 0:
+        return _compute_dashboard_stats(db)
     today = china_today()
-    week_start, week_end = _china_week_range()
-    month_start, month_end = _china_month_range()
+    cached = _stats_cache
+    if cached and cached[0] > time.monotonic() and cached[1] == today:
+        return cached[2]
+    with _stats_lock:
+        # 等锁期间其他请求可能已算好
+        cached = _stats_cache
+        if cached and cached[0] > time.monotonic() and cached[1] == today:
+            return cached[2]
+        stats = _compute_dashboard_stats(db)
+        _stats_cache = (time.monotonic() + ttl, today, stats)
+        return stats
 
-    # 设备数（复用 devices 查询逻辑）
-    from .routes_devices import _devices_query
-
-    q_all = _devices_query(db, None, None, True, True, False, False, True)
-    q_active = _devices_query(db, None, None, False, False, False, False, True)
-    q_inactive = _devices_query(db, None, None, False, False, False, True, True)
-    q_deleted = _devices_query(db, None, None, False, False, True, False, True)
-
-    devices_total = q_all.count()
-    devices_active = q_active.count()
-    devices_inactive = q_inactive.count()
-    devices_deleted = q_deleted.count()
-
-    # 用户数
-    users_total = db.query(models.User).filter(models.User.is_active.is_(True)).count()
-
-    # 使用记录：总数 + 今日/本周/本月（按 registration_date，不含已撤销）
-    base = db.query(models.UsageRecord).filter(models.UsageRecord.is_deleted.is_(False))
-    usage_total = base.count()
-    usage_today = base.filter(
-        models.UsageRecord.registration_date >= today,
-        models.UsageRecord.registration_date <= today,
-    ).count()
-    usage_week = base.filter(
-        models.UsageRecord.registration_date >= week_start,
-        models.UsageRecord.registration_date <= week_end,
-    ).count()
-    usage_month = base.filter(
-        models.UsageRecord.registration_date >= month_start,
-        models.UsageRecord.registration_date <= month_end,
-    ).count()
 
-    return {
-        "devices_total": devices_total,
-        "devices_active": devices_active,
-        "devices_inactive": devices_inactive,
-        "devices_deleted": devices_deleted,
-        "users_total": users_total,
-        "usage_total": usage_total,
-        "usage_today": usage_today,
-        "usage_week": usage_week,
-        "usage_month": usage_month,
-    }
+@router.get("/usage-trend", response_model=Dict[str, Any])
+def get_usage_trend(
+    days: int = Query(30, ge=1, le=366, description="最近天数（含今日），默认 30"),
+    dept: Optional[str] = Query(None, description="设备科室"),
+    usage_type: Optional[str] = Query(None, description="使用类型编码"),
+    db: Session = Depends(get_db),
+    _user=Depends(require_role("device_admin", "sys_admin")),
+):
+    """最近 N 天每日登记量（按登记日期，不含已撤销），无登记的日期补 0。"""
+    end = china_today()
+    start = end - timedelta(days=days - 1)
+    R = models.UsageDailyRollup
+    query = db.query(R.registration_date, func.sum(R.count)).filter(
+        R.registration_date >= start,
+        R.registration_date <= end,
+    )
+    if dept:
+        query = query.filter(R.dept == dept.strip())
+    if usage_type:
+        query = query.filter(R.usage_type == usage_type.strip())
+    by_day = {d: int(n or 0) for d, n in query.group_by(R.registration_date).all()}
+    items = [
+        {"date": (start + timedelta(days=i)).isoformat(), "count": by_day.get(start + timedelta(days=i), 0)}
+        for i in range(days)
+    ]
+    return {"from": start.isoformat(), "to": end.isoformat(), "items": items}
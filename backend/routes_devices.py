@@ -1,24 +1,50 @@
-import csv
-from io import BytesIO, StringIO
-from typing import Any, Dict, List, Optional
-
-import qrcode
-from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile, status
-from sqlalchemy import inspect
+from contextlib import closing
+from io import BytesIO
+from itertools import chain
+from typing import Any, Dict, Iterator, List, Optional
+
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, func, inspect, select
 from sqlalchemy.orm import Session
 
 from . import models, schemas
-from .audit import log_audit
+from .audit import log_audit, log_audit_deferred
 from .auth import get_current_user_optional, require_role
 from .config import settings
-from .database import engine, get_db
+from .count_cache import (
+    count_cache_key,
+    count_total,
+    fetch_page_with_total,
+    invalidate_counts,
+    set_total_headers,
+)
+from .database import SessionLocal, engine, get_db
+from .device_cache import get_active_device, invalidate_devices
 from .device_code_utils import normalize_device_code
+from .device_import import DeviceImportError, import_device_rows, iter_csv_rows, iter_xlsx_rows, spool_upload
+from .device_state import live_status_expr
+from .export_utils import XLSX_MEDIA_TYPE, iter_csv_chunks, iter_label_pdf_chunks, iter_xlsx_chunks
+from .qrcode_utils import (
+    DEFAULT_BOX_SIZE,
+    QR_FORMATS,
+    device_qr_value,
+    etag_matches,
+    get_qr_image,
+    get_qr_images,
+    qr_cache_key,
+)
+from .search_utils import ilike_any
+from .usage_rollup import move_device_rollup
 
 # 设备导出表头
 DEVICE_EXPORT_HEADERS = [
-    "设备编号", "设备名称", "科室", "位置", "状态", "启用", "已删除", "创建时间",
+    "设备编号", "设备名称", "科室", "位置", "状态", "实时状态", "启用", "已删除", "创建时间",
 ]
 
+# 标签上的二维码约 3cm 见方，模块 6 像素约 130 dpi，足够扫码且渲染与嵌入 PDF 更快
+LABEL_QR_BOX_SIZE = 6
+
 # 缓存：devices 表是否有 is_deleted 列（未迁移的旧库没有）
 _devices_has_is_deleted: Optional[bool] = None
 
@@ -86,10 +112,12 @@ def create_device(
         "device.create",
         "device",
         device.id,
-        f"device_code={device.device_code}",
         do_commit=False,
+        device_code=device.device_code,
     )
     db.commit()
+    invalidate_counts("devices")
+    invalidate_devices(device.device_code)
     db.refresh(device)
     return device
 
@@ -120,11 +148,7 @@ def _devices_query(
     if dept:
         query = query.filter(models.Device.dept == dept)
     if q:
-        like = f"%{q}%"
-        query = query.filter(
-            (models.Device.name.ilike(like))
-            | (models.Device.device_code.ilike(like))
-        )
+        query = query.filter(ilike_any(q, models.Device.name, models.Device.device_code))
     return query.order_by(models.Device.id.desc())
 
 
@@ -144,11 +168,7 @@ def suggest_devices(
     if dept:
         query = query.filter(models.Device.dept == dept)
     if q_normalized and q_normalized.strip():
-        like = f"%{q_normalized.strip()}%"
-        query = query.filter(
-            (models.Device.name.ilike(like))
-            | (models.Device.device_code.ilike(like))
-        )
+        query = query.filter(ilike_any(q_normalized.strip(), models.Device.name, models.Device.device_code))
     rows = query.order_by(models.Device.id.desc()).limit(limit).all()
     return [
         {"id": d.id, "device_code": d.device_code, "name": d.name, "dept": d.dept or ""}
@@ -156,6 +176,34 @@ def suggest_devices(
     ]
 
 
+@router.get("/by-code/{code}", response_model=schemas.DeviceRead)
+def get_device_by_code(code: str, db: Session = Depends(get_db)):
+    """扫码解析：按设备编号精确查找启用中的设备（编号先经 normalize_device_code 规范化），走进程内 LRU 缓存。"""
+    device = get_active_device(db, normalize_device_code(code))
+    if device is None:
+        raise HTTPException(status_code=404, detail="设备不存在或已停用/已删除")
+    return device
+
+
+def _devices_count_key(dept, q, include_inactive, include_deleted, deleted_only, inactive_only, is_admin):
+    """总数缓存键：与 _devices_query 参数一致（非管理员忽略管理员专用开关）。"""
+    return count_cache_key(
+        "devices",
+        dept=dept, q=q, is_admin=bool(is_admin),
+        include_inactive=include_inactive and bool(is_admin),
+        include_deleted=include_deleted and bool(is_admin),
+        deleted_only=deleted_only and bool(is_admin),
+        inactive_only=inactive_only and bool(is_admin),
+    )
+
+
+def _devices_unfiltered(dept, q, include_inactive, include_deleted, deleted_only, inactive_only, is_admin) -> bool:
+    """与 _devices_query 对应：不加任何条件（含默认隐藏停用、已删除）时结果才是整张表，可用表行数估算。"""
+    if dept or q or not is_admin or deleted_only or inactive_only or not include_inactive:
+        return False
+    return include_deleted or not _devices_table_has_is_deleted()
+
+
 @router.get("/count")
 def count_devices(
     dept: Optional[str] = Query(None),
@@ -164,17 +212,25 @@ def count_devices(
     include_deleted: bool = Query(False),
     deleted_only: bool = Query(False, description="管理员可传 true 仅统计已删除设备"),
     inactive_only: bool = Query(False, description="管理员可传 true 仅统计已停用设备"),
+    approximate: bool = Query(
+        False,
+        description="管理员不加任何筛选（include_inactive 与 include_deleted 均为 true）时允许返回数据库统计估算值（PostgreSQL），不扫描全表",
+    ),
     db: Session = Depends(get_db),
     current_user: Optional[models.User] = Depends(get_current_user_optional),
 ):
-    """返回符合条件的设备总数，用于分页展示。"""
+    """返回符合条件的设备总数，用于分页展示；结果按筛选条件短期缓存。"""
     is_admin = current_user and current_user.role in ("device_admin", "sys_admin")
     query = _devices_query(db, dept, q, include_inactive, include_deleted, deleted_only, inactive_only, is_admin)
-    return {"total": query.count()}
+    key = _devices_count_key(dept, q, include_inactive, include_deleted, deleted_only, inactive_only, is_admin)
+    unfiltered = _devices_unfiltered(dept, q, include_inactive, include_deleted, deleted_only, inactive_only, is_admin)
+    total, estimated = count_total(db, query, key, "devices", approximate and unfiltered)
+    return {"total": total, "approximate": True} if estimated else {"total": total}
 
 
 @router.get("", response_model=List[schemas.DeviceRead])
 def list_devices(
+    response: Response,
     dept: Optional[str] = Query(None),
     q: Optional[str] = Query(
         None, description="按名称或编号模糊搜索"
@@ -185,13 +241,25 @@ def list_devices(
     inactive_only: bool = Query(False, description="管理员可传 true 仅查看已停用设备"),
     limit: int = Query(100, ge=1, le=500, description="每页条数"),
     offset: int = Query(0, ge=0, description="偏移量，用于分页"),
+    with_total: bool = Query(False, description="为 true 时同时返回总数（响应头 X-Total-Count），省去单独的 /count 请求"),
+    approximate: bool = Query(False, description="与 with_total 同用：不加任何筛选（同 /count）时允许返回估算总数（PostgreSQL）"),
     db: Session = Depends(get_db),
     current_user: Optional[models.User] = Depends(get_current_user_optional),
 ):
     is_admin = current_user and current_user.role in ("device_admin", "sys_admin")
     q_normalized = normalize_device_code(q) if q else q
     query = _devices_query(db, dept, q_normalized, include_inactive, include_deleted, deleted_only, inactive_only, is_admin)
-    return query.offset(offset).limit(limit).all()
+    if not with_total:
+        return query.offset(offset).limit(limit).all()
+    key = _devices_count_key(dept, q_normalized, include_inactive, include_deleted, deleted_only, inactive_only, is_admin)
+    devices, total, estimated = fetch_page_with_total(
+        db, query, key, "devices", offset, limit,
+        approximate and _devices_unfiltered(
+            dept, q_normalized, include_inactive, include_deleted, deleted_only, inactive_only, is_admin
+        ),
+    )
+    set_total_headers(response, total, estimated)
+    return devices
 
 
 # 设备状态默认中文（字典表为空或未匹配时兜底）
@@ -204,28 +272,68 @@ _DEVICE_STATUS_DEFAULT_LABELS = {
 }
 
 
-def _device_to_export_row(d: models.Device, status_label_map: dict) -> List[str]:
-    """单行设备导出数据，状态为中文。"""
-    status_code = getattr(d, "status", None)
-    if status_code is None:
-        status_code = "1"
-    status_code_str = str(status_code).strip()
-    status_label = (
-        status_label_map.get(status_code_str)
-        or (status_label_map.get(int(status_code_str)) if status_code_str.isdigit() else None)
-        or _DEVICE_STATUS_DEFAULT_LABELS.get(status_code_str)
-        or status_code_str
+# 导出时每批从服务端游标取出的设备数
+DEVICE_EXPORT_BATCH_SIZE = 1000
+
+
+def _status_label_column(code_expr, labels):
+    """状态编码 -> 显示名的 SQL 表达式：字典项显示名，其次内置默认名，最后为编码本身。"""
+    default = case(_DEVICE_STATUS_DEFAULT_LABELS, value=code_expr, else_=code_expr)
+    return func.coalesce(func.nullif(func.trim(labels.c.label), ""), default)
+
+
+def _device_export_query(db: Session, *filters):
+    """设备导出查询：只取导出列，状态与实时状态的显示名在 SQL 中关联 dict_items 得出。"""
+    D = models.Device
+    # 未删除的设备状态字典项（按编码去重，避免重复编码使设备行翻倍）
+    labels_source = (
+        select(func.trim(models.DictItem.code).label("code"), func.min(models.DictItem.label).label("label"))
+        .where(models.DictItem.dict_type == "device_status", models.DictItem.is_deleted.is_(False))
+        .group_by(func.trim(models.DictItem.code))
+        .subquery()
+    )
+    status_labels = labels_source.alias("status_labels")
+    live_labels = labels_source.alias("live_labels")
+    status_code = func.coalesce(func.nullif(func.trim(D.status), ""), "1")
+    live_code = live_status_expr(D.status, D.open_borrow_count, D.open_repair_count)
+    return (
+        _devices_query(db, *filters)
+        .outerjoin(status_labels, status_labels.c.code == status_code)
+        .outerjoin(live_labels, live_labels.c.code == live_code)
+        .with_entities(
+            D.device_code,
+            D.name,
+            D.dept,
+            D.location,
+            _status_label_column(status_code, status_labels),
+            _status_label_column(live_code, live_labels),
+            D.is_active,
+            D.is_deleted,
+            D.created_at,
+        )
     )
-    return [
-        d.device_code or "",
-        d.name or "",
-        d.dept or "",
-        d.location or "",
-        status_label,
-        "是" if d.is_active else "否",
-        "是" if getattr(d, "is_deleted", False) else "否",
-        (d.created_at.strftime("%Y-%m-%d %H:%M:%S") if d.created_at else ""),
-    ]
+
+
+def _iter_device_export_rows(*filters) -> Iterator[List[str]]:
+    """服务端游标逐批读取导出行（独立会话：响应流式发送期间请求会话可能已关闭），内存与设备总数无关。"""
+    db = SessionLocal()
+    try:
+        for code, name, dept, location, status_label, live_label, is_active, is_deleted, created_at in (
+            _device_export_query(db, *filters).yield_per(DEVICE_EXPORT_BATCH_SIZE)
+        ):
+            yield [
+                code or "",
+                name or "",
+                dept or "",
+                location or "",
+                status_label,
+                live_label,
+                "是" if is_active else "否",
+                "是" if is_deleted else "否",
+                created_at.strftime("%Y-%m-%d %H:%M:%S") if created_at else "",
+            ]
+    finally:
+        db.close()
 
 
 @router.get("/export")
@@ -240,63 +348,26 @@ def export_devices(
     db: Session = Depends(get_db),
     current_user: Optional[models.User] = Depends(get_current_user_optional),
 ):
-    """导出设备列表（CSV/Excel），便于核对；仅管理员可导出。"""
+    """导出设备列表（CSV/Excel），便于核对；仅管理员可导出。边从数据库游标读取边写出，不在内存中拼出整个文件
+    （CSV 边读边发；Excel 先写入临时文件，写完才开始发送）。"""
     if not current_user or current_user.role not in ("device_admin", "sys_admin"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="仅管理员可导出",
         )
-    is_admin = True
-    query = _devices_query(db, dept, q, include_inactive, include_deleted, deleted_only, inactive_only, is_admin)
-    devices = query.all()
-    status_label_map = {}
-    for item in db.query(models.DictItem).filter(
-        models.DictItem.dict_type == "device_status",
-        models.DictItem.is_deleted.is_(False),
-    ).all():
-        label = (getattr(item, "label", None) or str(item.code) or "").strip()
-        if not label:
-            label = str(item.code) if item.code is not None else ""
-        code_raw = getattr(item, "code", None)
-        if code_raw is not None:
-            code_key = str(code_raw).strip()
-            status_label_map[code_key] = label
-            if code_key.isdigit():
-                status_label_map[int(code_key)] = label
-    for k, v in _DEVICE_STATUS_DEFAULT_LABELS.items():
-        if k not in status_label_map:
-            status_label_map[k] = v
-    rows = [DEVICE_EXPORT_HEADERS] + [_device_to_export_row(d, status_label_map) for d in devices]
+    filters = (dept, q, include_inactive, include_deleted, deleted_only, inactive_only, True)
+    total = _devices_query(db, *filters).order_by(None).count()
     fmt = (format or "csv").lower().strip()
-    log_audit(db, current_user.id, "device.export", None, None, f"format={fmt},count={len(devices)}")
+    log_audit_deferred(current_user.id, "device.export", format=fmt, count=total)
+    rows = _iter_device_export_rows(*filters)
     if fmt == "xlsx":
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "设备列表"
-        for i, row in enumerate(rows, 1):
-            for j, cell in enumerate(row, 1):
-                ws.cell(row=i, column=j, value=cell)
-        if rows:
-            for cell in ws[1]:
-                cell.font = Font(bold=True)
-        buf = BytesIO()
-        wb.save(buf)
-        buf.seek(0)
-        return Response(
-            content=buf.read(),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        return StreamingResponse(
+            iter_xlsx_chunks("设备列表", DEVICE_EXPORT_HEADERS, rows),
+            media_type=XLSX_MEDIA_TYPE,
             headers={"Content-Disposition": 'attachment; filename="devices.xlsx"'},
         )
-    output = StringIO()
-    writer = csv.writer(output)
-    for row in rows:
-        writer.writerow(row)
-    content = output.getvalue().encode("utf-8-sig")
-    output.close()
-    return Response(
-        content=content,
+    return StreamingResponse(
+        iter_csv_chunks(DEVICE_EXPORT_HEADERS, rows),
         media_type="text/csv; charset=utf-8",
         headers={"Content-Disposition": 'attachment; filename="devices.csv"'},
     )
@@ -306,6 +377,42 @@ def export_devices(
 IMPORT_HEADERS = ["设备编号", "设备名称", "科室", "位置", "状态"]
 
 
+@router.post("/labels.pdf")
+def print_device_labels(
+    payload: schemas.DeviceLabelRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_role("device_admin", "sys_admin")),
+):
+    """批量打印设备二维码标签（A4 每页 24 张），一次请求生成整个科室的标签页；二维码走图片缓存，未命中的并行渲染。"""
+    query = _devices_query(db, payload.dept, payload.q, include_inactive=payload.include_inactive, is_admin=True)
+    if payload.ids:
+        query = query.filter(models.Device.id.in_(payload.ids))
+    devices = (
+        query.order_by(None)
+        .order_by(models.Device.device_code)
+        .limit(schemas.DEVICE_LABEL_MAX + 1)
+        .all()
+    )
+    if len(devices) > schemas.DEVICE_LABEL_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多打印 {schemas.DEVICE_LABEL_MAX} 个标签，请按科室分批打印",
+        )
+    qr_values = [device_qr_value(d) for d in devices]
+    lines = [[d.device_code, d.name, d.dept or "", d.location or ""] for d in devices]
+    log_audit_deferred(current_user.id, "device.labels", count=len(devices))
+
+    def labels():
+        images = get_qr_images(qr_values, "png", LABEL_QR_BOX_SIZE)
+        yield from zip(images, lines)
+
+    return StreamingResponse(
+        iter_label_pdf_chunks(labels()),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'inline; filename="device_labels.pdf"'},
+    )
+
+
 @router.get("/import-template")
 def download_import_template(
     _user=Depends(require_role("device_admin", "sys_admin")),
@@ -337,82 +444,46 @@ def download_import_template(
 
 @router.post("/import", response_model=Dict[str, Any])
 def import_devices(
-    file: UploadFile = File(..., description="Excel 文件（.xlsx），表头：设备编号、设备名称、科室、位置、状态）"),
+    file: UploadFile = File(..., description="Excel（.xlsx）或 CSV 文件，表头：设备编号、设备名称、科室、位置、状态"),
+    dry_run: bool = Query(False, description="仅校验与查重，返回将导入/跳过的结果，不写库"),
     db: Session = Depends(get_db),
     current_user=Depends(require_role("device_admin", "sys_admin")),
 ):
-    """批量导入设备：Excel 首行为表头，从第二行起为数据；设备编号重复则跳过该行。"""
-    if not file.filename or not (file.filename.endswith(".xlsx") or file.filename.endswith(".xls")):
-        raise HTTPException(status_code=400, detail="请上传 .xlsx 格式的 Excel 文件")
-    content = file.file.read()
-    try:
-        from openpyxl import load_workbook
-        wb = load_workbook(BytesIO(content), read_only=True, data_only=True)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"无法解析 Excel：{e!s}")
-    ws = wb.active
-    if not ws:
-        raise HTTPException(status_code=400, detail="Excel 无有效工作表")
-    created = 0
-    skipped = 0
-    errors: List[str] = []
-    seen_codes: set[str] = set()
-    for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-        if not row or all(cell is None or (isinstance(cell, str) and not cell.strip()) for cell in row):
-            continue
-        code = (row[0] if len(row) > 0 else None)
-        name = (row[1] if len(row) > 1 else None)
-        dept = (row[2] if len(row) > 2 else None)
-        location = (row[3] if len(row) > 3 else None) or None
-        status_val = (row[4] if len(row) > 4 else None) or "1"
-        code = str(code).strip() if code is not None else ""
-        name = str(name).strip() if name is not None else ""
-        dept = str(dept).strip() if dept is not None else ""
-        location = str(location).strip() if location else None
-        if not code:
-            errors.append(f"第{row_idx}行：设备编号为空，已跳过")
-            skipped += 1
-            continue
-        if not name:
-            errors.append(f"第{row_idx}行：设备名称为空，已跳过")
-            skipped += 1
-            continue
-        if not dept:
-            errors.append(f"第{row_idx}行：科室为空，已跳过")
-            skipped += 1
-            continue
-        if code in seen_codes:
-            errors.append(f"第{row_idx}行：设备编号 {code} 在本文件中重复，已跳过")
-            skipped += 1
-            continue
-        seen_codes.add(code)
-        status_str = str(status_val).strip() if status_val else "1"
-        if status_str.isdigit():
-            pass
-        else:
-            status_str = "1"
-        existed = db.query(models.Device).filter(models.Device.device_code == code).first()
-        if existed:
-            errors.append(f"第{row_idx}行：设备编号 {code} 已存在，已跳过")
-            skipped += 1
-            continue
-        device = models.Device(
-            device_code=code,
-            name=name,
-            dept=dept,
-            location=location,
-            status=status_str,
-            is_active=True,
-            is_deleted=False,
+    """批量导入设备：首行为表头，从第二行起为数据；设备编号重复则跳过该行。按块批量写入，每块提交一次。
+    中途某块出错时返回 400，说明此前已导入（已提交）的条数与出错行号。"""
+    filename = (file.filename or "").lower()
+    if filename.endswith(".csv"):
+        iter_rows = iter_csv_rows
+    elif filename.endswith(".xlsx") or filename.endswith(".xls"):
+        iter_rows = iter_xlsx_rows
+    else:
+        raise HTTPException(status_code=400, detail="请上传 .xlsx 格式的 Excel 文件或 .csv 文件")
+    # 中途出错时先关闭行生成器再关闭临时文件（生成器收尾时还要访问文件）
+    with spool_upload(file.file) as spool, closing(iter_rows(spool)) as rows:
+        try:
+            # 先取第一行，文件格式错误时在写库前报错
+            first = next(rows, None)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"无法解析文件：{e!s}")
+        try:
+            result = import_device_rows(
+                db,
+                chain([first], rows) if first is not None else [],
+                current_user.id,
+                dry_run=dry_run,
+            )
+        except DeviceImportError as e:
+            if not dry_run:
+                log_audit_deferred(
+                    current_user.id, "device.import", created=e.created, failed_row=e.first_row
+                )
+            raise HTTPException(status_code=400, detail=str(e))
+    if not dry_run:
+        # 各块已随数据写入 device.import.batch，汇总记录异步写入
+        log_audit_deferred(
+            current_user.id, "device.import", created=result["created"], skipped=result["skipped"]
         )
-        db.add(device)
-        db.flush()
-        log_audit(db, current_user.id, "device.create", "device", device.id, f"device_code={code},import", do_commit=False)
-        created += 1
-    wb.close()
-    db.commit()
-    log_audit(db, current_user.id, "device.import", None, None, f"created={created},skipped={skipped}")
-    return {"created": created, "skipped": skipped, "errors": errors}
+    return result
 
 
 @router.get("/{device_id}", response_model=schemas.DeviceRead)
@@ -426,42 +497,32 @@ def get_device(device_id: int, db: Session = Depends(get_db)):
 @router.get("/{device_id}/qrcode")
 def get_device_qrcode(
     device_id: int,
+    format: str = Query("png", pattern="^(png|svg)$", description="图片格式：png 或 svg（矢量，适合打印）"),
+    box_size: int = Query(DEFAULT_BOX_SIZE, ge=1, le=40, description="每个模块的像素数（svg 为相对尺寸）"),
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
 ):
     """
-    返回设备二维码 PNG 图片，后续可用于打印标签。
+    返回设备二维码图片（PNG 或 SVG），后续可用于打印标签。
     二维码内容建议为短链接或包含设备唯一信息的 URL。
+    图片按内容缓存并带 ETag，客户端携带 If-None-Match 且内容未变时返回 304。
     """
     device = db.get(models.Device, device_id)
     if not device or getattr(device, "is_deleted", False) or not device.is_active:
         raise HTTPException(status_code=404, detail="设备不存在")
 
-    # 二维码内容必须为完整 URL，否则企微/浏览器扫码无法打开
-    path = f"/h5/scan?device_code={device.device_code}"
-    if device.qr_value and (device.qr_value.startswith("http://") or device.qr_value.startswith("https://")):
-        qr_value = device.qr_value
-    else:
-        relative = (device.qr_value or path).strip()
-        if not relative.startswith("/"):
-            relative = "/" + relative
-        qr_value = f"{settings.BASE_URL.rstrip('/')}{relative}"
-
-    img = qrcode.make(qr_value)
-    buf = BytesIO()
-    # 兼容 PIL 与 pypng 等后端：PIL 用 format="PNG"，pypng 只支持 .save(buf)
-    try:
-        img.save(buf, format="PNG")
-    except TypeError:
-        img.save(buf)
-    buf.seek(0)
-
-    return Response(
-        content=buf.read(),
-        media_type="image/png",
-        headers={
-            "Content-Disposition": f'inline; filename="device_{device.id}_qrcode.png"'
-        },
-    )
+    qr_value = device_qr_value(device)
+    # ETag 即内容哈希，条件请求命中时直接 304，不读缓存也不渲染
+    etag = f'"{qr_cache_key(qr_value, format, box_size)}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.QR_CACHE_MAX_AGE_SECONDS}",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    _, data = get_qr_image(qr_value, format, box_size)
+    headers["Content-Disposition"] = f'inline; filename="device_{device.id}_qrcode.{format}"'
+    return Response(content=data, media_type=QR_FORMATS[format], headers=headers)
 
 
 @router.patch("/{device_id}", response_model=schemas.DeviceRead)
@@ -476,6 +537,7 @@ def update_device(
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
     was_deleted = getattr(device, "is_deleted", False) if _devices_table_has_is_deleted() else False
+    old_code = device.device_code
     if payload.device_code is not None:
         new_code = (payload.device_code or "").strip()
         if not new_code:
@@ -488,7 +550,11 @@ def update_device(
     if payload.name is not None:
         device.name = payload.name.strip()
     if payload.dept is not None:
-        device.dept = payload.dept.strip() or None
+        new_dept = payload.dept.strip() or None
+        if new_dept != device.dept:
+            # 按日汇总按设备科室分桶：已有登记的计数随设备移到新科室，撤销旧记录时才扣在正确的桶上
+            move_device_rollup(db, old_code, device.dept, new_dept)
+        device.dept = new_dept
     if payload.location is not None:
         device.location = payload.location.strip() or None
     if payload.status is not None:
@@ -507,14 +573,24 @@ def update_device(
             device_id,
             f"{code_prefix},soft_delete",
             do_commit=False,
+            device_code=device.device_code,
+            soft_delete=True,
         )
     elif payload.is_deleted is False and was_deleted:
-        log_audit(db, current_user.id, "device.restore", "device", device_id, code_prefix, do_commit=False)
+        log_audit(
+            db, current_user.id, "device.restore", "device", device_id, code_prefix,
+            do_commit=False, device_code=device.device_code,
+        )
     else:
         parts = [k for k in ("name", "dept", "status", "is_active") if getattr(payload, k) is not None]
         details = code_prefix + ("," + ",".join(parts) if parts else "")
-        log_audit(db, current_user.id, "device.update", "device", device_id, details, do_commit=False)
+        log_audit(
+            db, current_user.id, "device.update", "device", device_id, details,
+            do_commit=False, device_code=device.device_code, fields=parts or None,
+        )
     db.commit()
+    invalidate_counts("devices")
+    invalidate_devices(old_code, device.device_code)
     db.refresh(device)
     return device
 
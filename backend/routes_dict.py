@@ -6,6 +6,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query, status
 from . import models, schemas
 from .auth import require_role
 from .database import get_db
+from .dict_cache import bump_dict_version, get_dict_items
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/api/dict", tags=["dict"])
@@ -18,15 +19,8 @@ def list_dict_items(
     include_deleted: bool = Query(False, description="是否包含已删除项（仅后台管理用）"),
     db: Session = Depends(get_db),
 ):
-    """列表；前端下拉用时不传 include_deleted，只拿未删除且可选的项。"""
-    q = db.query(models.DictItem)
-    if dict_type:
-        q = q.filter(models.DictItem.dict_type == dict_type)
-    if not include_deleted:
-        q = q.filter(models.DictItem.is_deleted.is_(False))
-    if not include_inactive:
-        q = q.filter(models.DictItem.is_active.is_(True))
-    return q.order_by(models.DictItem.sort_order, models.DictItem.id).all()
+    """列表；前端下拉用时不传 include_deleted，只拿未删除且可选的项（读进程内缓存）。"""
+    return get_dict_items(db, dict_type, include_inactive, include_deleted)
 
 
 @router.post("", response_model=schemas.DictItemRead, status_code=status.HTTP_201_CREATED)
@@ -58,6 +52,7 @@ def create_dict_item(
         is_deleted=False,
     )
     db.add(item)
+    bump_dict_version(db)
     db.commit()
     db.refresh(item)
     return item
@@ -80,6 +75,7 @@ def update_dict_item(
         item.label = payload.label.strip()
     if payload.is_active is not None:
         item.is_active = payload.is_active
+    bump_dict_version(db)
     db.commit()
     db.refresh(item)
     return item
@@ -96,6 +92,7 @@ def soft_delete_dict_item(
     if not item:
         raise HTTPException(status_code=404, detail="字典项不存在")
     item.is_deleted = True
+    bump_dict_version(db)
     db.commit()
 
 
@@ -112,6 +109,7 @@ def restore_dict_item(
     if not item.is_deleted:
         raise HTTPException(status_code=400, detail="该项未删除")
     item.is_deleted = False
+    bump_dict_version(db)
     db.commit()
     db.refresh(item)
     return item
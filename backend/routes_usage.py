@@ -1,10 +1,11 @@
 import csv
 import os
+from collections import Counter
 from datetime import date, datetime, timedelta
-from io import BytesIO, StringIO
-from typing import List, Optional
+from io import StringIO
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 
 from .time_utils import (
     china_today,
@@ -12,20 +13,48 @@ from .time_utils import (
     parse_naive_as_china_then_utc,
     utc_naive_to_china_str,
 )
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import and_, exists, literal, select, tuple_, update
+from sqlalchemy import insert as sa_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, joinedload
 
 from . import models, schemas
-from .audit import log_audit
-from .auth import get_current_user_optional, get_current_user
+from .audit import log_audit_deferred
+from .auth import (
+    create_download_ticket,
+    get_current_user,
+    get_current_user_optional,
+    require_role,
+    user_from_download_ticket,
+)
 from .config import settings
-from .database import get_db
+from .count_cache import (
+    count_cache_key,
+    count_total,
+    fetch_page_with_total,
+    invalidate_counts,
+    set_total_headers,
+)
+from .cursor_utils import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from .database import SessionLocal, get_db
 from .device_code_utils import normalize_device_code
+from .device_cache import get_active_device, invalidate_devices
+from .device_state import add_device_open_counts, adjust_device_state, is_open_record, open_count_deltas
+from .dict_cache import get_label_map
+from .export_jobs import (
+    ProgressCallback,
+    cleanup_expired_jobs,
+    count_active_jobs,
+    submit_export_job,
+)
+from .export_utils import XLSX_MAX_ROWS, XLSX_MEDIA_TYPE, iter_pdf_chunks, iter_xlsx_chunks
 from .form_templates import (
     get_form_schema as get_form_schema_from_templates,
     DEFAULT_USAGE_TYPE_TEMPLATE_MAP,
     TEMPLATE_FIELDS,
 )
+from .usage_rollup import add_rollup_counts, adjust_usage_rollup, rollup_date
 
 router = APIRouter(prefix="/api/usage", tags=["usage"])
 
@@ -45,14 +74,8 @@ def _format_display_datetime(dt: Optional[datetime]) -> str:
 
 
 def _get_usage_type_label_map(db: Session) -> dict:
-    """使用类型编码 -> 中文显示名，用于导出与页面展示一致。"""
-    out = {}
-    for item in db.query(models.DictItem).filter(
-        models.DictItem.dict_type == "usage_type",
-        models.DictItem.is_deleted.is_(False),
-    ).all():
-        code = item.code if isinstance(item.code, str) else str(item.code)
-        out[code] = item.label or code
+    """使用类型编码 -> 中文显示名，用于导出与页面展示一致（读字典进程内缓存）。"""
+    out = get_label_map(db, "usage_type")
     for k in (1, 2, 3, 4, 5):
         if str(k) not in out:
             out[str(k)] = str(k)
@@ -106,9 +129,12 @@ def _record_to_row(r: models.UsageRecord, usage_type_label_map: Optional[dict] =
     ]
 
 
-# 导出单次最大条数，避免百万级一次加载导致 OOM
+# PDF 单次最大条数（5 万条约 1800 页，再多已无阅读意义）；CSV/Excel 受 EXPORT_MAX_ROWS 等预算约束
 EXPORT_MAX_RECORDS = 50_000
 
+# 流式导出时服务端游标每批取出的行数
+EXPORT_BATCH_SIZE = 2000
+
 
 def _usage_query(
     db: Session,
@@ -141,7 +167,7 @@ def _usage_query(
     return query.order_by(models.UsageRecord.start_time.desc())
 
 
-def _fetch_export_records(
+def _iter_export_batches(
     db: Session,
     device_code: Optional[str] = None,
     dept: Optional[str] = None,
@@ -151,10 +177,14 @@ def _fetch_export_records(
     registration_date_from: Optional[date] = None,
     registration_date_to: Optional[date] = None,
     bed_number: Optional[str] = None,
-    limit: Optional[int] = None,
-    offset: int = 0,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    progress: Optional[ProgressCallback] = None,
 ):
-    """获取导出用记录，可分批（limit/offset）。limit=None 表示不限制条数（调用方需保证不超过 EXPORT_MAX_RECORDS）。"""
+    """单次查询 + 服务端游标（yield_per）逐批产出导出记录，不再按 offset 反复排序跳行。
+
+    每批交给调用方处理后即将本批记录及其关联设备/用户从会话中移除，内存占用与总行数无关；
+    db 应为导出专用会话，不要与请求中仍需使用的 ORM 对象共用。progress 在每批处理后以累计行数回调。
+    """
     query = (
         _usage_query(
             db, device_code, dept, user_id, from_time, to_time,
@@ -164,10 +194,34 @@ def _fetch_export_records(
             joinedload(models.UsageRecord.device),
             joinedload(models.UsageRecord.user),
         )
+        .yield_per(batch_size)
     )
-    if limit is not None:
-        query = query.limit(limit).offset(offset)
-    return query.all()
+    batch = []
+    done = 0
+    for r in query:
+        batch.append(r)
+        if len(batch) >= batch_size:
+            yield batch
+            done += len(batch)
+            _expunge_export_batch(db, batch)
+            batch = []
+            if progress:
+                progress(done)
+    if batch:
+        yield batch
+        done += len(batch)
+        _expunge_export_batch(db, batch)
+    if progress:
+        progress(done)
+
+
+def _expunge_export_batch(db: Session, batch: list) -> None:
+    """将已写出的一批记录及其关联对象移出会话（不用 expunge_all：游标仍在读取，需保留当前身份映射）。"""
+    for r in batch:
+        for obj in (r, r.device, r.user):
+            if obj is not None and obj in db:
+                db.expunge(obj)
+
 
 # 防重复：同一用户、同一设备在此秒数内的重复提交只保留一条
 DUPLICATE_WINDOW_SECONDS = 10
@@ -218,18 +272,12 @@ def get_usage_form_schema(
     )
 
 
-@router.post(
-    "",
-    response_model=schemas.UsageRecordRead,
-    status_code=status.HTTP_201_CREATED,
-)
-def create_usage_record(
-    payload: schemas.UsageRecordCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
-):
-    # 必须登录后登记，保证每条记录归属到对应用户，不同用户内容可区分
-    user = current_user
+BORROW_CONFLICT_DETAIL = "该设备当前有未归还的借用记录，请先归还后再借"
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+
+
+def _check_usage_payload(payload: schemas.UsageRecordCreate) -> Tuple[str, str]:
+    """设备编号规范化与模板必填校验，返回 (设备编号, 操作类型编码)；不通过时抛 400。"""
     # 支持现有资产码：识别结果可能为多行或「编码+文字」一行，只取编码查库
     device_code_to_use = normalize_device_code(payload.device_code or "").strip()
     if not device_code_to_use:
@@ -240,54 +288,15 @@ def create_usage_record(
     template_err = _validate_payload_by_template(usage_type_str, payload)
     if template_err:
         raise HTTPException(status_code=400, detail=template_err)
+    return device_code_to_use, usage_type_str
 
-    device = (
-        db.query(models.Device)
-        .filter(
-            models.Device.device_code == device_code_to_use,
-            models.Device.is_active.is_(True),
-        )
-        .first()
-    )
-    if not device or getattr(device, "is_deleted", False):
-        raise HTTPException(status_code=404, detail="设备不存在或已停用/已删除")
-
-    # 借用互斥：同一设备只能有一条未归还的借用记录
-    if usage_type_str == "2":
-        unreturned = (
-            db.query(models.UsageRecord)
-            .filter(
-                models.UsageRecord.device_code == device_code_to_use,
-                models.UsageRecord.usage_type == "2",
-                models.UsageRecord.is_deleted.is_(False),
-                models.UsageRecord.returned_at.is_(None),
-            )
-            .first()
-        )
-        if unreturned:
-            raise HTTPException(
-                status_code=400,
-                detail="该设备当前有未归还的借用记录，请先归还后再借",
-            )
-
-    # 防重复：短时间同一用户、同一设备只保留一条（不含已撤销），按中国当前时间计算
-    cutoff = now_china_as_utc() - timedelta(seconds=DUPLICATE_WINDOW_SECONDS)
-    existing = (
-        db.query(models.UsageRecord)
-        .filter(
-            models.UsageRecord.user_id == user.id,
-            models.UsageRecord.device_code == device_code_to_use,
-            models.UsageRecord.is_deleted.is_(False),
-            models.UsageRecord.created_at >= cutoff,
-        )
-        .order_by(models.UsageRecord.created_at.desc())
-        .first()
-    )
-    if existing:
-        return existing
 
+def _build_usage_data(
+    payload: schemas.UsageRecordCreate, device_code_to_use: str, usage_type_str: str
+) -> dict:
+    """提交内容转为入库字段：补默认开始时间与登记日期、时区转换、时间逻辑校验；不通过时抛 400。"""
     data = payload.model_dump()
-    data["usage_type"] = str(payload.usage_type)
+    data["usage_type"] = usage_type_str
     data["device_code"] = device_code_to_use
     if not data.get("start_time"):
         data["start_time"] = now_china_as_utc()
@@ -313,15 +322,332 @@ def create_usage_record(
     photo_urls_list = data.pop("photo_urls", None)
     if photo_urls_list:
         data["photo_urls"] = ",".join(photo_urls_list)
+    return data
+
+
+def _normalize_idempotency_key(key: Optional[str]) -> Optional[str]:
+    key = (key or "").strip()
+    if not key:
+        return None
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key 长度不能超过 {IDEMPOTENCY_KEY_MAX_LENGTH}")
+    return key
+
+
+def _get_usage_by_idempotency_key(db: Session, user_id: int, key: str) -> Optional[models.UsageRecord]:
+    return (
+        db.query(models.UsageRecord)
+        .filter(models.UsageRecord.user_id == user_id, models.UsageRecord.idempotency_key == key)
+        .first()
+    )
+
+
+def _insert_usage_guarded(db: Session, data: dict) -> Optional[models.UsageRecord]:
+    """INSERT ... SELECT ... WHERE <设备可用> [AND <无未归还借用>] [AND <窗口内无重复>]
+    ON CONFLICT (user_id, idempotency_key) DO NOTHING RETURNING *。
+
+    条件不满足或幂等键已存在时不插入并返回 None，由调用方查明原因；带幂等键时不做时间窗口防重复。
+    并发借用同一设备时 NOT EXISTS 可能同时成立，后到者由部分唯一索引拒绝并抛出 IntegrityError。
+    """
+    U, D = models.UsageRecord, models.Device
+    values = {**data, "created_at": datetime.utcnow(), "is_deleted": False}
+    conditions = [
+        exists().where(
+            D.device_code == data["device_code"],
+            D.is_active.is_(True),
+            D.is_deleted.is_(False),
+        )
+    ]
+    if data["usage_type"] == "2":
+        conditions.append(~exists().where(
+            U.device_code == data["device_code"],
+            U.usage_type == "2",
+            U.is_deleted.is_(False),
+            U.returned_at.is_(None),
+        ))
+    if not data.get("idempotency_key"):
+        cutoff = now_china_as_utc() - timedelta(seconds=DUPLICATE_WINDOW_SECONDS)
+        conditions.append(~exists().where(
+            U.user_id == data["user_id"],
+            U.device_code == data["device_code"],
+            U.is_deleted.is_(False),
+            U.created_at >= cutoff,
+        ))
+    columns = U.__table__.c
+    source = select(*[literal(v, columns[c].type).label(c) for c, v in values.items()]).where(*conditions)
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # 其他数据库无 ON CONFLICT：用保存点插入，唯一约束冲突时视为未插入
+        stmt = sa_insert(U).from_select(list(values), source).returning(U)
+        try:
+            with db.begin_nested():
+                return db.scalars(stmt).first()
+        except IntegrityError:
+            return None
+    stmt = insert(U).from_select(list(values), source)
+    if data.get("idempotency_key"):
+        stmt = stmt.on_conflict_do_nothing(index_elements=["user_id", "idempotency_key"])
+    return db.scalars(stmt.returning(U)).first()
+
+
+def _resolve_usage_insert_miss(db: Session, data: dict) -> models.UsageRecord:
+    """快速路径未插入时按原校验顺序查明原因：幂等重试返回原记录，设备不可用 404，借用冲突 400，窗口内重复返回已有记录。"""
+    key = data.get("idempotency_key")
+    if key:
+        existing = _get_usage_by_idempotency_key(db, data["user_id"], key)
+        if existing:
+            return existing
+    device = (
+        db.query(models.Device)
+        .filter(
+            models.Device.device_code == data["device_code"],
+            models.Device.is_active.is_(True),
+        )
+        .first()
+    )
+    if not device or getattr(device, "is_deleted", False):
+        raise HTTPException(status_code=404, detail="设备不存在或已停用/已删除")
+    if data["usage_type"] == "2":
+        unreturned = (
+            db.query(models.UsageRecord.id)
+            .filter(
+                models.UsageRecord.device_code == data["device_code"],
+                models.UsageRecord.usage_type == "2",
+                models.UsageRecord.is_deleted.is_(False),
+                models.UsageRecord.returned_at.is_(None),
+            )
+            .first()
+        )
+        if unreturned:
+            raise HTTPException(status_code=400, detail=BORROW_CONFLICT_DETAIL)
+    if not key:
+        # 防重复：短时间同一用户、同一设备只保留一条（不含已撤销），按中国当前时间计算
+        cutoff = now_china_as_utc() - timedelta(seconds=DUPLICATE_WINDOW_SECONDS)
+        existing = (
+            db.query(models.UsageRecord)
+            .filter(
+                models.UsageRecord.user_id == data["user_id"],
+                models.UsageRecord.device_code == data["device_code"],
+                models.UsageRecord.is_deleted.is_(False),
+                models.UsageRecord.created_at >= cutoff,
+            )
+            .order_by(models.UsageRecord.created_at.desc())
+            .first()
+        )
+        if existing:
+            return existing
+    # 条件在两次查询之间发生变化（如借用刚被归还），提示重试
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="登记状态已变化，请重新提交")
+
+
+@router.post(
+    "",
+    response_model=schemas.UsageRecordRead,
+    status_code=status.HTTP_201_CREATED,
+)
+def create_usage_record(
+    payload: schemas.UsageRecordCreate,
+    idempotency_key: Optional[str] = Header(
+        None, alias="Idempotency-Key", description="客户端幂等键：同一次提交的重试携带相同值，返回首次创建的记录",
+    ),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    # 必须登录后登记，保证每条记录归属到对应用户，不同用户内容可区分
+    user = current_user
+    device_code_to_use, usage_type_str = _check_usage_payload(payload)
+    key = _normalize_idempotency_key(idempotency_key or payload.idempotency_key)
+    # 设备走进程内缓存预检：未知/已停用编号直接 404，不尝试写入；带幂等键的重试仍交给写入路径识别原记录
+    device = get_active_device(db, device_code_to_use)
+    if device is None and not key:
+        raise HTTPException(status_code=404, detail="设备不存在或已停用/已删除")
 
-    record = models.UsageRecord(
-        user_id=user.id,
-        **data,
+    data = _build_usage_data(payload, device_code_to_use, usage_type_str)
+    data["user_id"] = user.id
+    data["idempotency_key"] = key
+    # 快速路径：设备可用、借用互斥、防重复均作为插入条件，一条语句完成校验与写入
+    try:
+        record = _insert_usage_guarded(db, data)
+    except IntegrityError:
+        # 并发借用同一设备：插入条件都通过，由部分唯一索引 ux_usage_open_borrow 拦下后到者
+        record = None
+    if record is None:
+        # 未插入（少见）：回滚后再查明原因，返回已有记录或对应错误
+        db.rollback()
+        return _resolve_usage_insert_miss(db, data)
+    adjust_usage_rollup(
+        db, record.device_code, rollup_date(record.registration_date, record.start_time), record.usage_type, 1,
     )
-    db.add(record)
+    adjust_device_state(db, record.device_code, record.usage_type, 1)
+    result = schemas.UsageRecordRead.model_validate(record)
+    if device is not None:
+        result = result.model_copy(update={"device_name": device.name, "device_dept": device.dept})
     db.commit()
-    db.refresh(record)
-    return record
+    invalidate_counts("usage")
+    if open_count_deltas(result.usage_type, 1):
+        invalidate_devices(result.device_code)
+    return result
+
+
+@router.post("/batch", response_model=schemas.UsageBatchResult)
+def create_usage_records_batch(
+    payload: schemas.UsageBatchCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """批量登记（H5 离线缓存恢复网络后一次同步）：逐条返回结果，单条失败不影响其他条。
+
+    设备一次 IN 查询、借用互斥与防重复按集合各查一次，全部新记录在同一事务中写入。
+    条目带 idempotency_key 时按幂等键判重（重传同一批返回原记录），否则按时间窗口防重复。
+    """
+    try:
+        return _create_usage_batch(db, current_user, payload.items)
+    except IntegrityError:
+        # 并发重传同一幂等键、或并发借用同一设备时唯一约束冲突：回滚后重做一次，
+        # 已提交的条目会按幂等键识别为重复，已被借出的设备按借用互斥返回失败
+        db.rollback()
+        return _create_usage_batch(db, current_user, payload.items)
+
+
+def _create_usage_batch(
+    db: Session, user: models.User, items: List[schemas.UsageRecordCreate]
+) -> schemas.UsageBatchResult:
+    results: List[Optional[schemas.UsageBatchItemResult]] = [None] * len(items)
+    prepared = []  # (序号, 设备编号, 操作类型, 入库字段)
+    for idx, item in enumerate(items):
+        try:
+            device_code_to_use, usage_type_str = _check_usage_payload(item)
+            data = _build_usage_data(item, device_code_to_use, usage_type_str)
+            data["idempotency_key"] = _normalize_idempotency_key(item.idempotency_key)
+        except HTTPException as e:
+            results[idx] = schemas.UsageBatchItemResult(index=idx, status="error", error=str(e.detail))
+            continue
+        prepared.append((idx, device_code_to_use, usage_type_str, data))
+
+    codes = {code for _, code, _, _ in prepared}
+    keys = {data["idempotency_key"] for _, _, _, data in prepared if data["idempotency_key"]}
+    valid_codes = {}  # 可用设备编号 -> 科室
+    borrowed_codes = set()
+    recent = {}  # 设备编号 -> 防重复窗口内本人最近一条记录
+    by_key = {}  # 幂等键 -> 已存在的记录
+    if keys:
+        by_key = {
+            r.idempotency_key: r for r in db.query(models.UsageRecord).filter(
+                models.UsageRecord.user_id == user.id,
+                models.UsageRecord.idempotency_key.in_(keys),
+            ).all()
+        }
+    if codes:
+        valid_codes = {
+            c: dept or "" for c, dept in db.query(models.Device.device_code, models.Device.dept).filter(
+                models.Device.device_code.in_(codes),
+                models.Device.is_active.is_(True),
+                models.Device.is_deleted.is_(False),
+            ).all()
+        }
+        borrow_codes = {code for _, code, t, _ in prepared if t == "2" and code in valid_codes}
+        if borrow_codes:
+            borrowed_codes = {
+                c for (c,) in db.query(models.UsageRecord.device_code).filter(
+                    models.UsageRecord.device_code.in_(borrow_codes),
+                    models.UsageRecord.usage_type == "2",
+                    models.UsageRecord.is_deleted.is_(False),
+                    models.UsageRecord.returned_at.is_(None),
+                ).distinct().all()
+            }
+        unkeyed_codes = {code for _, code, _, data in prepared if not data["idempotency_key"]} & valid_codes.keys()
+        if unkeyed_codes:
+            cutoff = now_china_as_utc() - timedelta(seconds=DUPLICATE_WINDOW_SECONDS)
+            for r in (
+                db.query(models.UsageRecord)
+                .filter(
+                    models.UsageRecord.user_id == user.id,
+                    models.UsageRecord.device_code.in_(unkeyed_codes),
+                    models.UsageRecord.is_deleted.is_(False),
+                    models.UsageRecord.created_at >= cutoff,
+                )
+                .order_by(models.UsageRecord.created_at.asc())
+                .all()
+            ):
+                recent[r.device_code] = r
+
+    new_records = []  # (序号, 记录)
+    batch_dups = []  # (序号, 本批内先出现的同一记录)
+    seen = {}  # 本批内幂等键相同、或 (设备, 类型, 开始时间) 相同的条目视为重复提交
+    for idx, code, usage_type_str, data in prepared:
+        key = data["idempotency_key"]
+        if key and key in by_key:
+            results[idx] = schemas.UsageBatchItemResult(
+                index=idx, status="duplicate", record=schemas.UsageRecordRead.model_validate(by_key[key]),
+            )
+            continue
+        batch_key = ("key", key) if key else (code, usage_type_str, data.get("start_time"))
+        if batch_key in seen:
+            batch_dups.append((idx, seen[batch_key]))
+            continue
+        if code not in valid_codes:
+            results[idx] = schemas.UsageBatchItemResult(index=idx, status="error", error="设备不存在或已停用/已删除")
+            continue
+        if usage_type_str == "2" and code in borrowed_codes:
+            results[idx] = schemas.UsageBatchItemResult(index=idx, status="error", error=BORROW_CONFLICT_DETAIL)
+            continue
+        if not key and code in recent:
+            results[idx] = schemas.UsageBatchItemResult(
+                index=idx, status="duplicate", record=schemas.UsageRecordRead.model_validate(recent[code]),
+            )
+            continue
+        if usage_type_str == "2":
+            # 同批内同一设备只能借出一次
+            borrowed_codes.add(code)
+        record = models.UsageRecord(user_id=user.id, **data)
+        seen[batch_key] = record
+        new_records.append((idx, record))
+
+    if new_records:
+        db.add_all([r for _, r in new_records])
+        db.flush()
+        add_rollup_counts(db, Counter(
+            (rollup_date(r.registration_date, r.start_time), valid_codes[r.device_code], r.usage_type)
+            for _, r in new_records
+        ))
+        opened = Counter((r.device_code, r.usage_type) for _, r in new_records)
+        add_device_open_counts(db, opened)
+        for idx, r in new_records:
+            results[idx] = schemas.UsageBatchItemResult(
+                index=idx, status="created", record=schemas.UsageRecordRead.model_validate(r),
+            )
+        for idx, r in batch_dups:
+            results[idx] = schemas.UsageBatchItemResult(
+                index=idx, status="duplicate", record=schemas.UsageRecordRead.model_validate(r),
+            )
+        db.commit()
+        invalidate_counts("usage")
+        invalidate_devices(*{code for code, t in opened if open_count_deltas(t, 1)})
+    return schemas.UsageBatchResult(
+        created=sum(1 for r in results if r.status == "created"),
+        duplicated=sum(1 for r in results if r.status == "duplicate"),
+        failed=sum(1 for r in results if r.status == "error"),
+        results=results,
+    )
+
+
+def _update_record_if(db: Session, record: models.UsageRecord, condition, **values) -> bool:
+    """仅当 condition 仍成立时更新记录，返回是否更新；并发重复归还/完成/撤销时只有一个请求生效，计数不会重复扣减。"""
+    result = db.execute(
+        update(models.UsageRecord)
+        .where(models.UsageRecord.id == record.id, condition)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        db.rollback()
+        return False
+    return True
 
 
 @router.post("/{record_id}/undo", status_code=status.HTTP_204_NO_CONTENT)
@@ -345,8 +671,19 @@ def undo_usage_record(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"仅支持撤销最近 {window_hours} 小时内的登记记录",
         )
-    record.is_deleted = True
+    was_open = is_open_record(record)
+    device_code = record.device_code
+    if not _update_record_if(db, record, models.UsageRecord.is_deleted.is_(False), is_deleted=True):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="该记录已撤销")
+    if was_open:
+        adjust_device_state(db, record.device_code, record.usage_type, -1)
+    adjust_usage_rollup(
+        db, record.device_code, rollup_date(record.registration_date, record.start_time), record.usage_type, -1,
+    )
     db.commit()
+    invalidate_counts("usage")
+    if was_open:
+        invalidate_devices(device_code)
     return None
 
 
@@ -368,8 +705,12 @@ def return_borrow_record(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="该借用已归还")
     if getattr(record, "is_deleted", False):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="已撤销的记录不能操作")
-    record.returned_at = now_china_as_utc()
+    if not _update_record_if(db, record, models.UsageRecord.returned_at.is_(None), returned_at=now_china_as_utc()):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="该借用已归还")
+    device_code = record.device_code
+    adjust_device_state(db, device_code, record.usage_type, -1)
     db.commit()
+    invalidate_devices(device_code)
     return None
 
 
@@ -391,11 +732,107 @@ def complete_repair_record(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="该维修已标记完成")
     if getattr(record, "is_deleted", False):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="已撤销的记录不能操作")
-    record.repair_completed_at = now_china_as_utc()
+    if not _update_record_if(
+        db, record, models.UsageRecord.repair_completed_at.is_(None), repair_completed_at=now_china_as_utc(),
+    ):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="该维修已标记完成")
+    device_code = record.device_code
+    adjust_device_state(db, device_code, record.usage_type, -1)
     db.commit()
+    invalidate_devices(device_code)
     return None
 
 
+def _usage_read_with_relations(
+    r: models.UsageRecord, schema=schemas.UsageRecordRead, **extra
+) -> schemas.UsageRecordRead:
+    """记录转响应模型并补充设备名称/科室、登记人姓名/科室（需已 joinedload device、user）。"""
+    return schema.model_validate(r).model_copy(
+        update={
+            "device_name": r.device.name if r.device else None,
+            "user_name": r.user.real_name if r.user else None,
+            "wecom_userid": getattr(r.user, "wx_userid", None) if r.user else None,
+            "device_dept": r.device.dept if r.device else None,
+            "user_dept": r.user.dept if r.user else None,
+            "is_deleted": getattr(r, "is_deleted", False),
+            **extra,
+        }
+    )
+
+
+def _list_open_records(
+    db: Session,
+    response: Response,
+    open_condition,
+    overdue_cutoff: datetime,
+    dept: Optional[str],
+    overdue_only: bool,
+    limit: int,
+    offset: int,
+) -> List[schemas.OpenUsageRecordRead]:
+    """未闭环记录（条件与部分索引 ix_usage_open_* 一致），按开始时间从早到晚；end_time 早于 overdue_cutoff 为逾期。"""
+    U = models.UsageRecord
+    query = db.query(U).filter(open_condition, U.is_deleted.is_(False))
+    if dept:
+        query = query.join(U.device).filter(models.Device.dept == dept.strip())
+    if overdue_only:
+        query = query.filter(U.end_time.isnot(None), U.end_time < overdue_cutoff)
+    # 未闭环记录只占全表极少部分，计数与分页都只扫部分索引
+    set_total_headers(response, query.count())
+    records = (
+        query.options(joinedload(U.device), joinedload(U.user))
+        .order_by(U.start_time.asc(), U.id.asc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return [
+        _usage_read_with_relations(
+            r, schemas.OpenUsageRecordRead,
+            overdue=r.end_time is not None and r.end_time < overdue_cutoff,
+        )
+        for r in records
+    ]
+
+
+@router.get("/open-borrows", response_model=List[schemas.OpenUsageRecordRead])
+def list_open_borrows(
+    response: Response,
+    dept: Optional[str] = Query(None, description="设备科室"),
+    overdue_only: bool = Query(False, description="仅返回已过预计归还日期的借用"),
+    limit: int = Query(200, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    _user=Depends(require_role("device_admin", "sys_admin")),
+):
+    """当前借出未归还的设备；overdue 表示预计归还日期（end_time 所在日）已过。总数见响应头 X-Total-Count。"""
+    U = models.UsageRecord
+    # 预计归还日期当天不算逾期：以今日 0 点（中国时区）为界
+    cutoff = parse_naive_as_china_then_utc(datetime.combine(china_today(), datetime.min.time()))
+    return _list_open_records(
+        db, response, and_(U.usage_type == "2", U.returned_at.is_(None)),
+        cutoff, dept, overdue_only, limit, offset,
+    )
+
+
+@router.get("/open-repairs", response_model=List[schemas.OpenUsageRecordRead])
+def list_open_repairs(
+    response: Response,
+    dept: Optional[str] = Query(None, description="设备科室"),
+    overdue_only: bool = Query(False, description="仅返回已超过 end_time 仍未完成的维修"),
+    limit: int = Query(200, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    _user=Depends(require_role("device_admin", "sys_admin")),
+):
+    """维修中未完成的设备；填写了 end_time 且已超过时 overdue 为 true。总数见响应头 X-Total-Count。"""
+    U = models.UsageRecord
+    return _list_open_records(
+        db, response, and_(U.usage_type == "3", U.repair_completed_at.is_(None)),
+        now_china_as_utc(), dept, overdue_only, limit, offset,
+    )
+
+
 def _list_usage_query(
     db: Session,
     current_user: models.User,
@@ -430,7 +867,36 @@ def _list_usage_query(
         query = query.filter(models.UsageRecord.registration_date <= registration_date_to)
     if bed_number:
         query = query.filter(models.UsageRecord.bed_number == bed_number.strip())
-    return query.order_by(models.UsageRecord.start_time.desc())
+    # id 作为同一时间的次级排序键，保证游标分页稳定不漏不重
+    return query.order_by(models.UsageRecord.start_time.desc(), models.UsageRecord.id.desc())
+
+
+def _usage_count_key(
+    current_user: models.User, device_code, dept, user_id, from_time, to_time,
+    registration_date_from, registration_date_to, bed_number, include_deleted: bool,
+):
+    """总数缓存键：与 _list_usage_query 的筛选条件一致，普通用户仅看本人记录时按用户区分。"""
+    own = current_user.id if current_user.role == "user" and user_id is None else None
+    return count_cache_key(
+        "usage",
+        own=own, device_code=device_code, dept=dept, user_id=user_id,
+        from_time=from_time, to_time=to_time,
+        registration_date_from=registration_date_from, registration_date_to=registration_date_to,
+        bed_number=bed_number, include_deleted=include_deleted,
+    )
+
+
+def _usage_unfiltered(
+    current_user: models.User, device_code, dept, user_id, from_time, to_time,
+    registration_date_from, registration_date_to, bed_number, include_deleted: bool,
+) -> bool:
+    """与 _list_usage_query 对应：不加任何条件（含已撤销、非本人范围）时结果才是整张表，可用表行数估算。"""
+    if not include_deleted or current_user.role == "user":
+        return False
+    return not any((
+        device_code, dept, user_id is not None, from_time, to_time,
+        registration_date_from is not None, registration_date_to is not None, bed_number,
+    ))
 
 
 @router.get("/count")
@@ -444,10 +910,14 @@ def count_usage_records(
     registration_date_to: Optional[date] = Query(None, description="登记日期止"),
     bed_number: Optional[str] = Query(None, description="床号"),
     include_deleted: bool = Query(False, description="仅本人查看时有效，为 true 则含已撤销记录"),
+    approximate: bool = Query(
+        False,
+        description="管理员不加任何筛选（include_deleted=true）时允许返回数据库统计估算值（PostgreSQL），不扫描全表",
+    ),
     db: Session = Depends(get_db),
     current_user: Optional[models.User] = Depends(get_current_user_optional),
 ):
-    """返回符合条件的使用记录总数，用于分页与工作台统计。"""
+    """返回符合条件的使用记录总数，用于分页与工作台统计；结果按筛选条件短期缓存。"""
     if current_user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="请先登录后查看记录")
     from_time = parse_naive_as_china_then_utc(from_time) if from_time else None
@@ -458,11 +928,21 @@ def count_usage_records(
         registration_date_from, registration_date_to, bed_number,
         include_deleted=allow_include_deleted,
     )
-    return {"total": query.count()}
+    key = _usage_count_key(
+        current_user, device_code, dept, user_id, from_time, to_time,
+        registration_date_from, registration_date_to, bed_number, allow_include_deleted,
+    )
+    unfiltered = _usage_unfiltered(
+        current_user, device_code, dept, user_id, from_time, to_time,
+        registration_date_from, registration_date_to, bed_number, allow_include_deleted,
+    )
+    total, estimated = count_total(db, query, key, "usage_records", approximate and unfiltered)
+    return {"total": total, "approximate": True} if estimated else {"total": total}
 
 
 @router.get("", response_model=List[schemas.UsageRecordRead])
 def list_usage_records(
+    response: Response,
     device_code: Optional[str] = Query(None, description="设备编号，与 devices.device_code 一致"),
     dept: Optional[str] = Query(None, description="设备科室"),
     user_id: Optional[int] = Query(None),
@@ -472,16 +952,27 @@ def list_usage_records(
     registration_date_to: Optional[date] = Query(None, description="登记日期止"),
     bed_number: Optional[str] = Query(None, description="床号"),
     limit: int = Query(100, ge=1, le=500, description="每页条数"),
-    offset: int = Query(0, ge=0, description="偏移量，用于分页"),
+    offset: int = Query(0, ge=0, description="偏移量，用于分页（传 cursor 时忽略）"),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页响应头 X-Next-Cursor 的值，深翻页推荐使用"),
     include_deleted: bool = Query(False, description="仅本人查看时有效，为 true 则含已撤销记录"),
+    with_total: bool = Query(False, description="为 true 时同时返回总数（响应头 X-Total-Count），省去单独的 /count 请求"),
+    approximate: bool = Query(False, description="与 with_total 同用：不加任何筛选（同 /count）时允许返回估算总数（PostgreSQL）"),
     db: Session = Depends(get_db),
     current_user: Optional[models.User] = Depends(get_current_user_optional),
 ):
+    """分页返回使用记录；传 cursor 时按 (start_time, id) 做 seek 分页，下一页游标见响应头 X-Next-Cursor。
+
+    with_total=true 时总数与当前页在同一查询中取回（COUNT(*) OVER()），见响应头 X-Total-Count。
+    """
     if current_user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="请先登录后查看记录",
         )
+    try:
+        after = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     from_time = parse_naive_as_china_then_utc(from_time) if from_time else None
     to_time = parse_naive_as_china_then_utc(to_time) if to_time else None
     allow_include_deleted = (user_id is None) and include_deleted
@@ -496,157 +987,189 @@ def list_usage_records(
             joinedload(models.UsageRecord.user),
         )
     )
-    records = query.offset(offset).limit(limit).all()
-    return [
-        schemas.UsageRecordRead.model_validate(r).model_copy(
-            update={
-                "device_name": r.device.name if r.device else None,
-                "user_name": r.user.real_name if r.user else None,
-                "wecom_userid": getattr(r.user, "wx_userid", None) if r.user else None,
-                "device_dept": r.device.dept if r.device else None,
-                "user_dept": r.user.dept if r.user else None,
-                "is_deleted": getattr(r, "is_deleted", False),
-            }
+    key = None
+    if with_total:
+        key = _usage_count_key(
+            current_user, device_code, dept, user_id, from_time, to_time,
+            registration_date_from, registration_date_to, bed_number, allow_include_deleted,
         )
-        for r in records
-    ]
-
-
-def _build_excel(records: list, usage_type_label_map: dict) -> bytes:
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "使用记录"
-    for col, h in enumerate(EXPORT_HEADERS, 1):
-        ws.cell(row=1, column=col, value=h)
-    for row_idx, r in enumerate(records, 2):
-        for col_idx, val in enumerate(_record_to_row(r, usage_type_label_map), 1):
-            ws.cell(row=row_idx, column=col_idx, value=val)
-    # 表头加粗
-    for c in range(1, len(EXPORT_HEADERS) + 1):
-        ws.cell(row=1, column=c).font = Font(bold=True)
-    buf = BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    return buf.read()
-
-
-def _build_pdf(records: list, usage_type_label_map: dict) -> bytes:
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4, landscape
-    from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.lib.units import mm
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-
-    buf = BytesIO()
-    doc = SimpleDocTemplate(buf, pagesize=landscape(A4), rightMargin=12 * mm, leftMargin=12 * mm, topMargin=15 * mm, bottomMargin=15 * mm)
-    # 中文字体名，用于表格和标题
-    font_name = "Helvetica"
-    # 1) 优先尝试 ReportLab 内置 CID 字体（Adobe 亚洲语言包，若系统已安装）
-    try:
-        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
-        pdfmetrics.registerFont(UnicodeCIDFont("STSong-Light"))
-        font_name = "STSong-Light"
-    except Exception:
-        pass
-    # 2) 若未注册成功，尝试系统 TTF/TTC 字体
-    if font_name == "Helvetica":
-        windir = os.environ.get("WINDIR", "C:\\Windows")
-        fonts_dir = os.path.join(windir, "Fonts")
-        # Windows 常见中文字体（.ttc 居多，.ttf 部分系统有）
-        candidate_paths = [
-            os.path.join(fonts_dir, "simsun.ttc"),
-            os.path.join(fonts_dir, "msyh.ttc"),
-            os.path.join(fonts_dir, "msyhbd.ttc"),
-            os.path.join(fonts_dir, "simsun.ttf"),
-            os.path.join(fonts_dir, "msyh.ttf"),
-            os.path.join(fonts_dir, "simhei.ttf"),
-            "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
-            "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-        ]
-        # 项目内 static/fonts 下的字体（可放置 SimSun.ttf 等）
-        static_fonts = os.path.join(os.path.dirname(__file__), "..", "static", "fonts")
-        for name in ("SimSun.ttf", "SimHei.ttf", "msyh.ttf", "CJK.ttf"):
-            candidate_paths.append(os.path.join(static_fonts, name))
-        for path in candidate_paths:
-            if not os.path.isfile(path):
-                continue
-            try:
-                # TTC 需指定 subfontIndex（取第一个子字体）
-                if path.lower().endswith(".ttc"):
-                    pdfmetrics.registerFont(TTFont("CJK", path, subfontIndex=0))
-                else:
-                    pdfmetrics.registerFont(TTFont("CJK", path))
-                font_name = "CJK"
-                break
-            except TypeError:
-                # 旧版 reportlab 无 subfontIndex，对 .ttc 直接传 path 可能报错，跳过
-                try:
-                    pdfmetrics.registerFont(TTFont("CJK", path))
-                    font_name = "CJK"
-                    break
-                except Exception:
-                    pass
-            except Exception:
-                pass
-
-    data = [EXPORT_HEADERS]
-    for r in records:
-        data.append(_record_to_row(r, usage_type_label_map))
-    t = Table(data)
-    t.setStyle(TableStyle([
-        ("FONTNAME", (0, 0), (-1, -1), font_name),
-        ("FONTSIZE", (0, 0), (-1, -1), 9),
-        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#e0f2f1")),
-        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-    ]))
-    styles = getSampleStyleSheet()
-    title_style = styles["Title"]
-    title_style.fontName = font_name
-    doc.build([Paragraph("使用记录导出", title_style), t])
-    buf.seek(0)
-    return buf.read()
+        approximate = approximate and _usage_unfiltered(
+            current_user, device_code, dept, user_id, from_time, to_time,
+            registration_date_from, registration_date_to, bed_number, allow_include_deleted,
+        )
+    if after is not None:
+        if with_total:
+            # 游标页的窗口计数只覆盖游标之后的行，总数单独取（命中缓存时不查库）
+            total, estimated = count_total(db, query, key, "usage_records", approximate)
+            set_total_headers(response, total, estimated)
+        query = query.filter(
+            tuple_(models.UsageRecord.start_time, models.UsageRecord.id) < tuple_(after[0], after[1])
+        )
+        records = query.limit(limit).all()
+    elif with_total:
+        records, total, estimated = fetch_page_with_total(
+            db, query, key, "usage_records", offset, limit, approximate,
+        )
+        set_total_headers(response, total, estimated)
+    else:
+        records = query.offset(offset).limit(limit).all()
+    if len(records) == limit:
+        last = records[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.start_time, last.id)
+    return [_usage_read_with_relations(r) for r in records]
 
 
 def _export_csv_generator(
-    db: Session,
     device_code, dept, user_id, from_time, to_time,
     registration_date_from: Optional[date] = None,
     registration_date_to: Optional[date] = None,
     bed_number: Optional[str] = None,
     usage_type_label_map: Optional[dict] = None,
+    max_bytes: int = 0,
+    progress: Optional[ProgressCallback] = None,
 ):
-    """流式生成 CSV：先表头，再分批查询写入。"""
+    """流式生成 CSV：先表头，再从服务端游标逐批写入；内存恒定，与导出总量无关。
+
+    使用独立会话（响应流式发送期间请求会话可能已关闭）；max_bytes>0 时按批判断字节预算，
+    超出则停止并在末行写入截断提示。
+    """
     import codecs
-    yield codecs.BOM_UTF8
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(EXPORT_HEADERS)
-    yield output.getvalue()
-    output.close()
-    offset = 0
-    batch_size = 5000
-    while offset < EXPORT_MAX_RECORDS:
-        batch = _fetch_export_records(
+    db = SessionLocal()
+    try:
+        yield codecs.BOM_UTF8
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(EXPORT_HEADERS)
+        chunk = output.getvalue().encode("utf-8")
+        sent = len(codecs.BOM_UTF8) + len(chunk)
+        yield chunk
+        for batch in _iter_export_batches(
             db, device_code, dept, user_id, from_time, to_time,
             registration_date_from, registration_date_to, bed_number,
-            limit=batch_size, offset=offset,
+            progress=progress,
+        ):
+            output = StringIO()
+            writer = csv.writer(output)
+            for r in batch:
+                writer.writerow(_record_to_row(r, usage_type_label_map))
+            chunk = output.getvalue().encode("utf-8")
+            output.close()
+            if max_bytes and sent + len(chunk) > max_bytes:
+                output = StringIO()
+                csv.writer(output).writerow([f"（导出内容已达 {max_bytes} 字节上限，后续记录已截断，请缩小筛选范围后分批导出）"])
+                yield output.getvalue().encode("utf-8")
+                return
+            sent += len(chunk)
+            yield chunk
+    finally:
+        db.close()
+
+
+def _export_xlsx_generator(
+    device_code, dept, user_id, from_time, to_time,
+    registration_date_from: Optional[date] = None,
+    registration_date_to: Optional[date] = None,
+    bed_number: Optional[str] = None,
+    usage_type_label_map: Optional[dict] = None,
+    progress: Optional[ProgressCallback] = None,
+):
+    """生成 Excel：服务端游标逐批取出记录，写入模式工作表逐行追加到临时文件，全部写完后才分块发送（非流式）。"""
+    db = SessionLocal()
+    try:
+        rows = (
+            _record_to_row(r, usage_type_label_map)
+            for batch in _iter_export_batches(
+                db, device_code, dept, user_id, from_time, to_time,
+                registration_date_from, registration_date_to, bed_number,
+                progress=progress,
+            )
+            for r in batch
         )
-        if not batch:
-            break
-        output = StringIO()
-        writer = csv.writer(output)
-        for r in batch:
-            writer.writerow(_record_to_row(r, usage_type_label_map))
-        yield output.getvalue()
-        output.close()
-        offset += len(batch)
-        if len(batch) < batch_size:
-            break
+        yield from iter_xlsx_chunks("使用记录", EXPORT_HEADERS, rows)
+    finally:
+        db.close()
+
+
+def _export_pdf_generator(
+    device_code, dept, user_id, from_time, to_time,
+    registration_date_from: Optional[date] = None,
+    registration_date_to: Optional[date] = None,
+    bed_number: Optional[str] = None,
+    usage_type_label_map: Optional[dict] = None,
+    progress: Optional[ProgressCallback] = None,
+):
+    """流式生成 PDF：服务端游标逐批取出记录，按页切分小表格绘制到临时文件，完成后分块发送。"""
+    db = SessionLocal()
+    try:
+        rows = (
+            _record_to_row(r, usage_type_label_map)
+            for batch in _iter_export_batches(
+                db, device_code, dept, user_id, from_time, to_time,
+                registration_date_from, registration_date_to, bed_number,
+                progress=progress,
+            )
+            for r in batch
+        )
+        yield from iter_pdf_chunks("使用记录导出", EXPORT_HEADERS, rows)
+    finally:
+        db.close()
+
+
+def _export_max_rows(fmt: str) -> int:
+    """各格式导出行数上限：CSV/Excel 受可配置预算约束（0 为不限制，Excel 另受单表行数限制）；PDF 保留固定上限。"""
+    if fmt == "pdf":
+        return EXPORT_MAX_RECORDS
+    if fmt == "xlsx":
+        return min(settings.EXPORT_MAX_ROWS or XLSX_MAX_ROWS, XLSX_MAX_ROWS)
+    return settings.EXPORT_MAX_ROWS
+
+
+def _normalize_export_format(format: Optional[str]) -> str:
+    fmt = (format or "csv").lower().strip()
+    return fmt if fmt in ("xlsx", "pdf") else "csv"
+
+
+def _count_export_records(
+    db: Session, fmt: str, device_code, dept, user_id, from_time, to_time,
+    registration_date_from, registration_date_to, bed_number,
+) -> int:
+    """统计符合条件的记录数，超过该格式上限时直接拒绝。"""
+    max_rows = _export_max_rows(fmt)
+    total = _usage_query(
+        db, device_code, dept, user_id, from_time, to_time,
+        registration_date_from, registration_date_to, bed_number,
+    ).count()
+    if max_rows and total > max_rows:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"符合条件记录共 {total} 条，超过单次导出上限 {max_rows} 条，请缩小时间范围或筛选条件后导出。",
+        )
+    return total
+
+
+def _export_generator(fmt: str, *args, progress: Optional[ProgressCallback] = None, max_bytes: int = 0):
+    """按格式选择流式生成器；args 为筛选条件与类型标签映射（顺序同各生成器参数）。"""
+    if fmt == "xlsx":
+        return _export_xlsx_generator(*args, progress=progress)
+    if fmt == "pdf":
+        return _export_pdf_generator(*args, progress=progress)
+    return _export_csv_generator(*args, max_bytes=max_bytes, progress=progress)
+
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": XLSX_MEDIA_TYPE,
+    "pdf": "application/pdf",
+}
+
+
+def _require_export_admin(current_user: Optional[models.User]) -> models.User:
+    if not current_user or current_user.role not in ("device_admin", "sys_admin"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="仅管理员可导出",
+        )
+    return current_user
 
 
 @router.get("/export")
@@ -663,63 +1186,127 @@ def export_usage_records(
     db: Session = Depends(get_db),
     current_user: Optional[models.User] = Depends(get_current_user_optional),
 ):
-    if not current_user or current_user.role not in ("device_admin", "sys_admin"):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="仅管理员可导出",
-        )
+    _require_export_admin(current_user)
     from_time = parse_naive_as_china_then_utc(from_time) if from_time else None
     to_time = parse_naive_as_china_then_utc(to_time) if to_time else None
-    total = _usage_query(
-        db, device_code, dept, user_id, from_time, to_time,
+    fmt = _normalize_export_format(format)
+    total = _count_export_records(
+        db, fmt, device_code, dept, user_id, from_time, to_time,
         registration_date_from, registration_date_to, bed_number,
-    ).count()
-    if total > EXPORT_MAX_RECORDS:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"符合条件记录共 {total} 条，超过单次导出上限 {EXPORT_MAX_RECORDS} 条，请缩小时间范围或筛选条件后导出。",
-        )
-    fmt = (format or "csv").lower().strip()
+    )
     usage_type_label_map = _get_usage_type_label_map(db)
+    log_audit_deferred(current_user.id, "usage.export", format=fmt, count=total)
+    return StreamingResponse(
+        _export_generator(
+            fmt,
+            device_code, dept, user_id, from_time, to_time,
+            registration_date_from, registration_date_to, bed_number,
+            usage_type_label_map,
+            max_bytes=settings.EXPORT_MAX_BYTES,
+        ),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="usage_records.{fmt}"'},
+    )
 
-    if fmt == "csv":
-        log_audit(db, current_user.id, "usage.export", None, None, f"format={fmt},count={total}")
-        return StreamingResponse(
-            _export_csv_generator(
-                db, device_code, dept, user_id, from_time, to_time,
-                registration_date_from, registration_date_to, bed_number,
-                usage_type_label_map,
-            ),
-            media_type="text/csv; charset=utf-8",
-            headers={"Content-Disposition": 'attachment; filename="usage_records.csv"'},
+
+@router.post(
+    "/export-jobs",
+    response_model=schemas.ExportJobRead,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def create_export_job(
+    payload: schemas.ExportJobCreate,
+    db: Session = Depends(get_db),
+    current_user: Optional[models.User] = Depends(get_current_user_optional),
+):
+    """创建后台导出任务：立即返回任务信息，渲染在后台线程中进行，前端轮询进度后下载。"""
+    _require_export_admin(current_user)
+    fmt = _normalize_export_format(payload.format)
+    from_time = parse_naive_as_china_then_utc(payload.from_time) if payload.from_time else None
+    to_time = parse_naive_as_china_then_utc(payload.to_time) if payload.to_time else None
+    filters = (
+        payload.device_code, payload.dept, payload.user_id, from_time, to_time,
+        payload.registration_date_from, payload.registration_date_to, payload.bed_number,
+    )
+    total = _count_export_records(db, fmt, *filters)
+    cleanup_expired_jobs(db)
+    if count_active_jobs(db) >= settings.EXPORT_JOB_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="当前排队中的导出任务过多，请稍后再试",
         )
-    records = _fetch_export_records(
-        db, device_code, dept, user_id, from_time, to_time,
-        registration_date_from, registration_date_to, bed_number,
-        limit=EXPORT_MAX_RECORDS,
+    usage_type_label_map = _get_usage_type_label_map(db)
+    job = models.ExportJob(
+        created_by=current_user.id,
+        format=fmt,
+        params=payload.model_dump_json(exclude={"format"}, exclude_none=True),
+        status="pending",
+        rows_total=total,
     )
-    log_audit(db, current_user.id, "usage.export", None, None, f"format={fmt},count={len(records)}")
-    if fmt == "xlsx":
-        content = _build_excel(records, usage_type_label_map)
-        filename = "usage_records.xlsx"
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    elif fmt == "pdf":
-        content = _build_pdf(records, usage_type_label_map)
-        filename = "usage_records.pdf"
-        media_type = "application/pdf"
-    else:
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(EXPORT_HEADERS)
-        for r in records:
-            writer.writerow(_record_to_row(r, usage_type_label_map))
-        content = output.getvalue().encode("utf-8-sig")
-        output.close()
-        filename = "usage_records.csv"
-        media_type = "text/csv; charset=utf-8"
-    return Response(
-        content=content,
-        media_type=media_type,
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    log_audit_deferred(current_user.id, "usage.export", format=fmt, count=total, job=job.id)
+    submit_export_job(
+        job.id,
+        lambda progress: _export_generator(
+            fmt, *filters, usage_type_label_map,
+            progress=progress, max_bytes=settings.EXPORT_MAX_BYTES,
+        ),
+        f".{fmt}",
     )
+    return job
 
+
+def _get_own_export_job(db: Session, job_id: int, current_user: models.User) -> models.ExportJob:
+    """任务仅创建者与系统管理员可见。"""
+    job = db.query(models.ExportJob).filter(models.ExportJob.id == job_id).first()
+    if not job or (job.created_by != current_user.id and current_user.role != "sys_admin"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="导出任务不存在")
+    return job
+
+
+def _export_job_resource(job_id: int) -> str:
+    return f"export_job:{job_id}"
+
+
+@router.get("/export-jobs/{job_id}", response_model=schemas.ExportJobRead)
+def get_export_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: Optional[models.User] = Depends(get_current_user_optional),
+):
+    """查询导出任务状态与进度（rows_done / rows_total）；完成后附带下载地址。"""
+    _require_export_admin(current_user)
+    job = schemas.ExportJobRead.model_validate(_get_own_export_job(db, job_id, current_user))
+    if job.status == "done":
+        # 凭证与导出文件同样保留 EXPORT_JOB_TTL_HOURS，期间中断的下载可随时续传
+        ticket = create_download_ticket(
+            current_user, _export_job_resource(job_id), max(1, settings.EXPORT_JOB_TTL_HOURS) * 3600,
+        )
+        job.download_url = f"/api/usage/export-jobs/{job_id}/download?ticket={ticket}"
+    return job
+
+
+@router.get("/export-jobs/{job_id}/download")
+def download_export_job(
+    job_id: int,
+    ticket: Optional[str] = Query(None, description="下载凭证（浏览器直接跳转下载时代替 Authorization 头）"),
+    db: Session = Depends(get_db),
+    current_user: Optional[models.User] = Depends(get_current_user_optional),
+):
+    """下载已完成的导出文件；支持 Range 断点续传（大文件下载中断后可继续）。"""
+    if current_user is None and ticket:
+        current_user = user_from_download_ticket(db, ticket, _export_job_resource(job_id))
+    _require_export_admin(current_user)
+    job = _get_own_export_job(db, job_id, current_user)
+    if job.status != "done" or not job.file_path or not os.path.isfile(job.file_path):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="导出文件尚未生成或已过期",
+        )
+    return FileResponse(
+        job.file_path,
+        media_type=EXPORT_MEDIA_TYPES.get(job.format, "application/octet-stream"),
+        filename=f"usage_records.{job.format}",
+    )
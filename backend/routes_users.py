@@ -1,14 +1,21 @@
 """管理端用户列表与统计（仅管理员可访问）。"""
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import or_
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 
 from . import models, schemas
 from .audit import log_audit
 from .auth import hash_password, truncate_password_for_bcrypt, require_role
+from .count_cache import (
+    count_cache_key,
+    count_total,
+    fetch_page_with_total,
+    invalidate_counts,
+    set_total_headers,
+)
 from .database import get_db
+from .search_utils import ilike_any
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
@@ -47,8 +54,9 @@ def create_user(
     )
     db.add(user)
     db.flush()
-    log_audit(db, current_user.id, "user.create", "user", user.id, details=username, do_commit=False)
+    log_audit(db, current_user.id, "user.create", "user", user.id, details=username, do_commit=False, username=username)
     db.commit()
+    invalidate_counts("users")
     db.refresh(user)
     return schemas.UserListRead(
         id=user.id,
@@ -66,13 +74,13 @@ def _user_filter_query(db: Session, q: Optional[str]):
     """构建用户查询（可选按关键词模糊匹配工号/用户名、姓名、科室）。"""
     query = db.query(models.User)
     if q and q.strip():
-        key = f"%{q.strip()}%"
         query = query.filter(
-            or_(
-                models.User.username.ilike(key),
-                models.User.wx_userid.ilike(key),
-                models.User.real_name.ilike(key),
-                models.User.dept.ilike(key),
+            ilike_any(
+                q.strip(),
+                models.User.username,
+                models.User.wx_userid,
+                models.User.real_name,
+                models.User.dept,
             )
         )
     return query
@@ -81,31 +89,37 @@ def _user_filter_query(db: Session, q: Optional[str]):
 @router.get("/count")
 def count_users(
     q: Optional[str] = Query(None, description="关键词：工号/用户名/姓名/科室，模糊匹配"),
+    approximate: bool = Query(False, description="无 q 筛选时允许返回数据库统计估算值（PostgreSQL），不扫描全表"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_role("device_admin", "sys_admin")),
 ):
-    """返回用户总数（支持与列表一致的 q 筛选）。"""
-    total = _user_filter_query(db, q).count()
-    return {"total": total}
+    """返回用户总数（支持与列表一致的 q 筛选）；结果按筛选条件短期缓存。"""
+    key = count_cache_key("users", q=q)
+    total, estimated = count_total(db, _user_filter_query(db, q), key, "users", approximate and not key[1])
+    return {"total": total, "approximate": True} if estimated else {"total": total}
 
 
 @router.get("", response_model=List[schemas.UserListRead])
 def list_users(
+    response: Response,
     limit: int = Query(100, ge=1, le=500),
     offset: int = Query(0, ge=0),
     q: Optional[str] = Query(None, description="关键词：工号/用户名/姓名/科室，模糊匹配"),
+    with_total: bool = Query(False, description="为 true 时同时返回总数（响应头 X-Total-Count），省去单独的 /count 请求"),
+    approximate: bool = Query(False, description="与 with_total 同用：无 q 筛选时允许返回估算总数（PostgreSQL）"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_role("device_admin", "sys_admin")),
 ):
     """分页返回用户列表；支持 q 关键词模糊检索（工号/用户名、姓名、科室）。"""
-    query = _user_filter_query(db, q)
-    rows = (
-        query
-        .order_by(models.User.id.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
+    query = _user_filter_query(db, q).order_by(models.User.id.desc())
+    if with_total:
+        key = count_cache_key("users", q=q)
+        rows, total, estimated = fetch_page_with_total(
+            db, query, key, "users", offset, limit, approximate and not key[1],
+        )
+        set_total_headers(response, total, estimated)
+    else:
+        rows = query.offset(offset).limit(limit).all()
     return [
         schemas.UserListRead(
             id=u.id,
@@ -139,7 +153,7 @@ def admin_update_user_password(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="密码不能为空")
     u.password_hash = hash_password(plain)
     db.commit()
-    log_audit(db, current_user.id, "user.password_update", "user", u.id, details=f"reset:{u.username}")
+    log_audit(db, current_user.id, "user.password_update", "user", u.id, details=f"reset:{u.username}", username=u.username)
     return {"ok": True}
 
 
@@ -168,6 +182,7 @@ def admin_update_user_active(
         "user",
         u.id,
         details=f"{'enable' if u.is_active else 'disable'}:{u.username or u.wx_userid or u.id}",
+        is_active=u.is_active,
     )
     return {"ok": True, "is_active": u.is_active}
 
@@ -0,0 +1,81 @@
+"""
+审计日志维护：按 AUDIT_RETENTION_MONTHS 归档并删除过期审计；PostgreSQL 分区表同时提前建好后续月份的分区。
+建议由定时任务每天执行一次（不带子命令即 partitions + archive）。
+
+运行方式（在 backend 目录下）：
+  poetry run python run_audit_maintenance.py
+  poetry run python run_audit_maintenance.py migrate             # PostgreSQL：一次性把 audit_logs 转为月度分区表（低峰期执行）
+  poetry run python run_audit_maintenance.py partitions --months-ahead 6
+  poetry run python run_audit_maintenance.py archive --dry-run   # 只统计将归档的月份与行数
+  poetry run python run_audit_maintenance.py archive --format csv
+"""
+import argparse
+import sys
+from datetime import date
+from pathlib import Path
+
+# 项目根目录 = backend 的上一级
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from backend import audit_retention  # noqa: E402
+from backend.config import settings  # noqa: E402
+from backend.database import Base, engine  # noqa: E402
+
+
+def _partitions(months_ahead: int) -> None:
+    with engine.begin() as conn:
+        if not audit_retention.is_partitioned(conn):
+            print("audit_logs 不是分区表，跳过建分区（PostgreSQL 可先执行 migrate）")
+            return
+        created = audit_retention.ensure_partitions(conn, date.today(), months_ahead)
+    print(f"已新建分区: {', '.join(created)}" if created else "分区已齐全")
+
+
+def _archive(fmt: str, dry_run: bool) -> None:
+    if settings.AUDIT_RETENTION_MONTHS <= 0:
+        print("AUDIT_RETENTION_MONTHS=0，永久保留，跳过归档")
+        return
+    done = audit_retention.archive_expired(
+        engine,
+        date.today(),
+        settings.AUDIT_RETENTION_MONTHS,
+        settings.AUDIT_ARCHIVE_DIR,
+        fmt=fmt,
+        dry_run=dry_run,
+    )
+    if not done:
+        print("没有过期的审计")
+    for name, count in done:
+        print(f"{'将归档' if dry_run else '已归档并删除'} {name}: {count} 条")
+    if done and not dry_run:
+        print(f"归档目录: {settings.AUDIT_ARCHIVE_DIR}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="审计日志分区与归档维护")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("migrate", help="PostgreSQL：把 audit_logs 转为按月分区表")
+    p_part = sub.add_parser("partitions", help="提前建好后续月份的分区")
+    p_part.add_argument("--months-ahead", type=int, default=settings.AUDIT_PARTITION_MONTHS_AHEAD)
+    p_arch = sub.add_parser("archive", help="归档并删除保留期之前的审计")
+    p_arch.add_argument("--format", choices=audit_retention.ARCHIVE_FORMATS, default="ndjson")
+    p_arch.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    if args.command == "migrate":
+        moved = audit_retention.migrate_to_partitions(engine, date.today(), settings.AUDIT_PARTITION_MONTHS_AHEAD)
+        print(f"已转为分区表，迁移 {moved} 条审计")
+    elif args.command == "partitions":
+        _partitions(args.months_ahead)
+    elif args.command == "archive":
+        _archive(args.format, args.dry_run)
+    else:
+        _partitions(settings.AUDIT_PARTITION_MONTHS_AHEAD)
+        _archive("ndjson", False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+性能基准：使用记录 PDF 导出渲染耗时，旧实现（单个大 Table + 每次注册字体）对比新实现（按页切分小表格 + 字体缓存）。
+使用合成行数据，不访问数据库：
+  cd backend && poetry run python run_bench_export_pdf.py --rows 5000
+  poetry run python run_bench_export_pdf.py --rows 50000 --skip-old   # 旧实现在 5 万行时耗时过长，可跳过
+"""
+import argparse
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+# 项目根目录 = backend 的上一级
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from backend.export_utils import get_pdf_font_name, iter_pdf_chunks  # noqa: E402
+from backend.routes_usage import EXPORT_HEADERS  # noqa: E402
+
+
+def _rows(n: int):
+    for i in range(n):
+        yield [
+            "2025-01-01", "2025-01-01 08:00:00", f"基准设备{i % 1000}（BENCH_{i % 1000}）", "内科",
+            str(i % 60), f"ID{i}", "张三", "2025-01-01 08:00:00", "2025-01-01 18:00:00",
+            "基准用户", "信息科", "bench", "常规使用", "正常", "清洁", "", "基准数据",
+        ]
+
+
+def render_old(n: int) -> int:
+    """旧实现：每次注册字体，全部行放入一个 Table 交给 SimpleDocTemplate 布局。"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+    buf = BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=landscape(A4), rightMargin=12 * mm, leftMargin=12 * mm, topMargin=15 * mm, bottomMargin=15 * mm)
+    pdfmetrics.registerFont(UnicodeCIDFont("STSong-Light"))
+    font_name = "STSong-Light"
+    t = Table([EXPORT_HEADERS] + list(_rows(n)))
+    t.setStyle(TableStyle([
+        ("FONTNAME", (0, 0), (-1, -1), font_name),
+        ("FONTSIZE", (0, 0), (-1, -1), 9),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#e0f2f1")),
+        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+    ]))
+    title_style = getSampleStyleSheet()["Title"]
+    title_style.fontName = font_name
+    doc.build([Paragraph("使用记录导出", title_style), t])
+    return len(buf.getvalue())
+
+
+def render_new(n: int) -> int:
+    return sum(len(chunk) for chunk in iter_pdf_chunks("使用记录导出", EXPORT_HEADERS, _rows(n)))
+
+
+def _timed(label: str, fn, n: int) -> None:
+    start = time.perf_counter()
+    size = fn(n)
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {n} 行，{elapsed:.2f}s，{n / elapsed if elapsed else 0:.0f} 行/秒，文件 {size / 1024 / 1024:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 导出渲染基准")
+    parser.add_argument("--rows", type=int, default=5000, help="渲染行数，默认 5000")
+    parser.add_argument("--skip-old", action="store_true", help="跳过旧实现（行数大时旧实现很慢）")
+    args = parser.parse_args()
+    get_pdf_font_name()  # 与应用启动时一致，先预热字体注册
+    if not args.skip_old:
+        _timed("旧实现（单个大表格）", render_old, args.rows)
+    _timed("新实现（按页切分）", render_new, args.rows)
+
+
+if __name__ == "__main__":
+    main()
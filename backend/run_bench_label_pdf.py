@@ -0,0 +1,79 @@
+"""
+性能基准：批量打印设备二维码标签（POST /api/devices/labels.pdf 的渲染部分）。
+使用合成设备数据，不访问数据库；依次测量：
+  1) 串行渲染二维码（无缓存）+ 排版；
+  2) 进程池并行渲染（无缓存）+ 排版；
+  3) 缓存已热（再次打印同一批标签）+ 排版。
+磁盘缓存写入临时目录，结束后删除，不影响 QR_CACHE_DIR。
+  cd backend && poetry run python run_bench_label_pdf.py --labels 5000
+  poetry run python run_bench_label_pdf.py --labels 5000 --workers 8
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 项目根目录 = backend 的上一级
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from backend import qrcode_utils  # noqa: E402
+from backend.config import settings  # noqa: E402
+from backend.export_utils import get_pdf_font_name, iter_label_pdf_chunks  # noqa: E402
+from backend.routes_devices import LABEL_QR_BOX_SIZE  # noqa: E402
+
+
+def _devices(n: int):
+    base = settings.BASE_URL.rstrip("/")
+    return [
+        (f"{base}/h5/scan?device_code=BLB{i:07d}", [f"BLB{i:07d}", f"基准设备{i}", f"科室{i % 40}", f"{i % 30} 号病房"])
+        for i in range(n)
+    ]
+
+
+def _render(devices) -> int:
+    images = qrcode_utils.get_qr_images([v for v, _ in devices], "png", LABEL_QR_BOX_SIZE)
+    return sum(len(chunk) for chunk in iter_label_pdf_chunks(zip(images, [lines for _, lines in devices])))
+
+
+def _timed(label: str, devices) -> None:
+    start = time.perf_counter()
+    size = _render(devices)
+    elapsed = time.perf_counter() - start
+    n = len(devices)
+    print(f"{label}: {n} 张，{elapsed:.2f}s，{n / elapsed if elapsed else 0:.0f} 张/秒，文件 {size / 1024 / 1024:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="二维码标签 PDF 渲染基准")
+    parser.add_argument("--labels", type=int, default=5000, help="标签数，默认 5000")
+    parser.add_argument("--workers", type=int, default=max(2, settings.QR_RENDER_WORKERS), help="进程池大小")
+    args = parser.parse_args()
+    get_pdf_font_name()
+    devices = _devices(args.labels)
+    cache_dir = tempfile.mkdtemp(prefix="bench_qr_")
+    settings.QR_CACHE_DIR = cache_dir
+    try:
+        settings.QR_RENDER_WORKERS = 1
+        _timed("串行渲染", devices)
+
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.makedirs(cache_dir)
+        qrcode_utils.clear_qr_cache()
+        settings.QR_RENDER_WORKERS = args.workers
+        # 进程池启动（spawn 导入模块）只在首次发生，先预热，计时只含渲染
+        qrcode_utils._render_many(["warmup"] * qrcode_utils.QR_PARALLEL_MIN, "png", LABEL_QR_BOX_SIZE)
+        _timed(f"进程池渲染（{args.workers} 进程）", devices)
+
+        _timed("缓存命中", devices)
+    finally:
+        qrcode_utils.shutdown_qr_render_pool()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
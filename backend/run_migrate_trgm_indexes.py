@@ -0,0 +1,55 @@
+"""
+可选迁移（仅 PostgreSQL）：启用 pg_trgm 扩展，为设备名称/编号、用户工号/企业微信 userid/姓名/科室建立 GIN 三元组索引，
+使管理后台筛选框的 ILIKE '%关键词%' 走索引而不是顺序扫描（关键词不少于 3 个字符时有效）。
+
+- 索引用 CREATE INDEX CONCURRENTLY 建立，不阻塞写入，可在业务时间执行；已存在的索引跳过。
+- 无权限创建扩展（需超级用户或库属主，或由 DBA 预先执行 CREATE EXTENSION pg_trgm）时提示并退出，
+  检索功能不受影响，只是仍为顺序扫描。SQLite 等其他数据库无需执行。
+
+运行方式（在 backend 目录下）：
+  poetry run python run_migrate_trgm_indexes.py
+"""
+import os
+import sys
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+# (索引名, 表, 列)
+TRGM_INDEXES = [
+    ("ix_devices_name_trgm", "devices", "name"),
+    ("ix_devices_code_trgm", "devices", "device_code"),
+    ("ix_users_username_trgm", "users", "username"),
+    ("ix_users_wx_userid_trgm", "users", "wx_userid"),
+    ("ix_users_real_name_trgm", "users", "real_name"),
+    ("ix_users_dept_trgm", "users", "dept"),
+]
+
+load_dotenv()
+url = os.getenv("DATABASE_URL")
+if not url:
+    print("未设置 DATABASE_URL")
+    sys.exit(1)
+if "postgresql" not in url:
+    print("仅 PostgreSQL 支持 pg_trgm 索引，当前数据库沿用 LIKE 扫描，无需迁移")
+    sys.exit(0)
+
+# CONCURRENTLY 不能在事务块内执行，使用自动提交
+engine = create_engine(url, isolation_level="AUTOCOMMIT")
+
+with engine.connect() as conn:
+    try:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        print(f"无法启用 pg_trgm 扩展（{e.__class__.__name__}），请由 DBA 执行 CREATE EXTENSION pg_trgm 后重试；")
+        print("未建索引时检索照常可用，只是为顺序扫描")
+        sys.exit(0)
+    for name, table, column in TRGM_INDEXES:
+        conn.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)"
+        ))
+        print(f"已建立 {name}")
+    # 建完索引刷新统计，规划器才能按选择性选用
+    conn.execute(text("ANALYZE devices"))
+    conn.execute(text("ANALYZE users"))
+    print("完成")
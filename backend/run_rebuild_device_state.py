@@ -0,0 +1,33 @@
+"""
+重建设备实时状态计数（devices.open_borrow_count / open_repair_count）：按未撤销且未归还/未完成的借用、维修记录重算。
+用于直接改库后的纠偏（计数列首次自动补建时应用启动会回填一次）。
+一条 UPDATE 完成，期间并发的借用/归还可能被覆盖，建议在低峰期执行。
+
+运行方式（在 backend 目录下）：
+  poetry run python run_rebuild_device_state.py
+"""
+import sys
+from pathlib import Path
+
+# 项目根目录 = backend 的上一级
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from backend.database import Base, SessionLocal, engine  # noqa: E402
+from backend.device_state import rebuild_device_state  # noqa: E402
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rebuild_device_state(db)
+        db.commit()
+        print("已重建设备实时状态计数")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+重建使用记录按日汇总表（usage_daily_rollup）：按未撤销的明细重新聚合 (登记日期, 设备科室, 使用类型) 计数。
+用于首次回填（应用启动时汇总表为空会自动回填一次）、直接改库后的纠偏。
+重建在一个事务中先清空再写入，期间并发登记的增量可能丢失，建议在低峰期执行。
+
+运行方式（在 backend 目录下）：
+  poetry run python run_rebuild_usage_rollup.py
+"""
+import sys
+from pathlib import Path
+
+# 项目根目录 = backend 的上一级
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from backend.database import Base, SessionLocal, engine  # noqa: E402
+from backend.usage_rollup import rebuild_usage_rollup  # noqa: E402
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rows = rebuild_usage_rollup(db)
+        db.commit()
+        print(f"已重建 usage_daily_rollup，共 {rows} 行汇总")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
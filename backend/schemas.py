@@ -1,5 +1,5 @@
 from datetime import date, datetime
-from typing import List, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 from pydantic import BaseModel, Field, field_serializer, field_validator
 
@@ -111,13 +111,16 @@ class DeviceRead(DeviceBase):
     id: int
     is_deleted: bool = False
     created_at: datetime
+    live_status: int = Field(1, description="实时状态编码：人工状态叠加未归还借用（使用中）、未完成维修（维修中）")
+    open_borrow_count: Optional[int] = 0  # 未归还借用条数
+    open_repair_count: Optional[int] = 0  # 未完成维修条数
 
     @field_serializer("created_at")
     @classmethod
     def _ser_created_at(cls, v: datetime | None) -> str | None:
         return datetime_to_iso_utc(v)
 
-    @field_validator("status", mode="before")
+    @field_validator("status", "live_status", mode="before")
     @classmethod
     def status_to_int(cls, v: Union[str, int]) -> int:
         if isinstance(v, int):
@@ -131,6 +134,18 @@ class DeviceRead(DeviceBase):
         from_attributes = True
 
 
+# 单次打印标签的设备数上限（约 420 页 A4）
+DEVICE_LABEL_MAX = 10000
+
+
+class DeviceLabelRequest(BaseModel):
+    """批量打印二维码标签：传 ids 时只打印这些设备，否则按科室、关键词筛选（同设备列表）"""
+    ids: Optional[List[int]] = Field(None, max_length=DEVICE_LABEL_MAX, description="设备 ID 列表")
+    dept: Optional[str] = None
+    q: Optional[str] = Field(None, description="名称或编号模糊搜索")
+    include_inactive: bool = Field(False, description="含已停用设备")
+
+
 class UsageRecordBase(BaseModel):
     device_code: str = Field(..., description="设备编号，与 devices.device_code 一致")
     usage_type: int = Field(..., description="使用类型字典编码（数字）")
@@ -156,6 +171,9 @@ class UsageRecordBase(BaseModel):
 
 
 class UsageRecordCreate(UsageRecordBase):
+    # 客户端幂等键：批量登记时每条自带；单条登记也可用请求头 Idempotency-Key
+    idempotency_key: Optional[str] = Field(None, max_length=128)
+
     @field_validator("usage_type", mode="before")
     @classmethod
     def usage_type_coerce(cls, v: Union[str, int, None]) -> int:
@@ -202,6 +220,33 @@ class UsageRecordRead(UsageRecordBase):
         from_attributes = True
 
 
+class OpenUsageRecordRead(UsageRecordRead):
+    """未归还借用 / 未完成维修：overdue 表示已超过 end_time（借用为预计归还日期）。"""
+    overdue: bool = False
+
+
+# 批量登记单次最多条数（H5 离线缓存同步）
+USAGE_BATCH_MAX_ITEMS = 300
+
+
+class UsageBatchCreate(BaseModel):
+    items: List[UsageRecordCreate] = Field(..., min_length=1, max_length=USAGE_BATCH_MAX_ITEMS)
+
+
+class UsageBatchItemResult(BaseModel):
+    index: int  # 对应请求 items 中的序号
+    status: str  # created / duplicate / error
+    record: Optional[UsageRecordRead] = None  # 新建或已存在的记录
+    error: Optional[str] = None
+
+
+class UsageBatchResult(BaseModel):
+    created: int = 0
+    duplicated: int = 0
+    failed: int = 0
+    results: List[UsageBatchItemResult]
+
+
 class DictItemCreate(BaseModel):
     dict_type: str = Field(..., description="usage_type / device_status")
     code: int = Field(..., description="数字编码，同类型内唯一")
@@ -253,6 +298,7 @@ class AuditLogRead(BaseModel):
     target_id: Optional[int] = None
     target_code: Optional[str] = None  # 设备编码等，当 target_type=device 时由后端填充
     details: Optional[str] = None
+    details_json: Optional[Dict[str, Any]] = None  # 结构化详情，旧记录为空
     created_at: datetime
 
     @field_serializer("created_at")
@@ -263,3 +309,38 @@ class AuditLogRead(BaseModel):
     class Config:
         from_attributes = True
 
+
+
+class ExportJobCreate(BaseModel):
+    """创建后台导出任务：格式与筛选条件同 GET /api/usage/export。"""
+    format: str = Field("csv", description="导出格式: csv / xlsx / pdf")
+    device_code: Optional[str] = None
+    dept: Optional[str] = None
+    user_id: Optional[int] = None
+    from_time: Optional[datetime] = None
+    to_time: Optional[datetime] = None
+    registration_date_from: Optional[date] = None
+    registration_date_to: Optional[date] = None
+    bed_number: Optional[str] = None
+
+
+class ExportJobRead(BaseModel):
+    id: int
+    format: str
+    status: str  # pending / running / done / failed / expired
+    rows_total: int = 0
+    rows_done: int = 0
+    file_size: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    # 完成后给出带下载凭证的地址，前端直接跳转下载（浏览器自行流式保存、可断点续传）
+    download_url: Optional[str] = None
+
+    @field_serializer("created_at", "finished_at")
+    @classmethod
+    def _ser_datetime(cls, v: datetime | None) -> str | None:
+        return datetime_to_iso_utc(v)
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,24 @@
+"""
+关键词模糊检索：设备、用户筛选框的 ILIKE '%q%' 条件。
+PostgreSQL 执行 run_migrate_trgm_indexes.py 建立 pg_trgm GIN 索引后，同样的 ILIKE 条件由规划器走索引
+（关键词不少于 3 个字符时有效）；未安装扩展或其他数据库时仍为顺序扫描，结果一致。
+"""
+from sqlalchemy import or_
+
+LIKE_ESCAPE = "\\"
+
+
+def contains_pattern(q: str) -> str:
+    """关键词转为包含匹配模式：转义用户输入中的 % 和 _，避免被当作通配符。"""
+    escaped = (
+        q.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2)
+        .replace("%", LIKE_ESCAPE + "%")
+        .replace("_", LIKE_ESCAPE + "_")
+    )
+    return f"%{escaped}%"
+
+
+def ilike_any(q: str, *columns):
+    """任一列包含关键词（不区分大小写）。"""
+    pattern = contains_pattern(q)
+    return or_(*[col.ilike(pattern, escape=LIKE_ESCAPE) for col in columns])
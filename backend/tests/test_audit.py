@@ -15,3 +15,175 @@ def test_audit_list_admin_success(client: TestClient, admin_headers: dict):
     assert r.status_code == 200
     data = r.json()
     assert isinstance(data, list)
+
+
+def test_audit_list_cursor_and_target_code(client: TestClient, admin_headers: dict, created_device_code: str):
+    """游标分页按 (时间, id) 倒序不重不漏；设备类记录批量回填设备编号。"""
+    r = client.get("/api/audit-logs", headers=admin_headers, params={"target_type": "device", "limit": 50})
+    assert r.status_code == 200
+    created = [x for x in r.json() if x["action"] == "device.create" and x["target_code"] == created_device_code]
+    assert len(created) == 1
+
+    first = client.get("/api/audit-logs", headers=admin_headers, params={"limit": 2})
+    assert first.status_code == 200
+    cursor = first.headers.get("X-Next-Cursor")
+    assert cursor
+    second = client.get("/api/audit-logs", headers=admin_headers, params={"limit": 2, "cursor": cursor})
+    assert second.status_code == 200
+    both = client.get("/api/audit-logs", headers=admin_headers, params={"limit": 4}).json()
+    assert [x["id"] for x in first.json() + second.json()] == [x["id"] for x in both][: len(first.json() + second.json())]
+
+    assert client.get("/api/audit-logs", headers=admin_headers, params={"cursor": "%%%"}).status_code == 400
+
+
+def test_audit_list_single_target_lookup(client: TestClient, admin_headers: dict, created_device_code: str):
+    """一页中多条设备类记录只查询一次设备表（不再逐行查询）。"""
+    from sqlalchemy import event
+
+    from backend.database import engine
+
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        r = client.get("/api/audit-logs", headers=admin_headers, params={"target_type": "device", "limit": 100})
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+    assert r.status_code == 200
+    device_queries = [s for s in statements if "FROM devices" in s]
+    assert len(device_queries) <= 1
+
+
+def test_audit_details_json_filters(client: TestClient, admin_headers: dict, created_device_code: str, db):
+    """关键字参数写入结构化详情并自动生成文本；按设备编号、字段=值、count 下限筛选。"""
+    from backend import models
+    from backend.audit import log_audit
+
+    r = client.get("/api/audit-logs", headers=admin_headers, params={"device_code": created_device_code})
+    assert r.status_code == 200
+    rows = r.json()
+    assert rows and all(x["details_json"]["device_code"] == created_device_code for x in rows)
+    assert any(x["action"] == "device.create" and x["details"] == f"device_code={created_device_code}" for x in rows)
+
+    log_audit(db, None, "test.details", format="csv", count=12000, job=None)
+    log_audit(db, None, "test.details", format="xlsx", count=50)
+    log_audit(db, None, "test.details", format="csv", count=9)
+    log_audit(db, None, "test.details", format="odd", count="abc")
+    log_audit(db, None, "test.details", format="odd", count=12000.5)
+    db.expire_all()
+    latest = db.query(models.AuditLog).filter(models.AuditLog.action == "test.details").order_by(models.AuditLog.id).first()
+    assert latest.details == "format=csv,count=12000"
+    assert latest.details_json == {"format": "csv", "count": 12000}
+
+    def _counts(**params):
+        r = client.get("/api/audit-logs", headers=admin_headers, params={"action": "test.details", **params})
+        assert r.status_code == 200
+        return sorted(x["details_json"]["count"] for x in r.json() if x["details_json"]["format"] != "odd")
+
+    assert _counts(detail="format=csv") == [9, 12000]
+    assert _counts(detail=["format=csv", "count=9"]) == [9]
+    assert _counts(min_count=10000) == [12000]
+    # 非整数的 count 不会使查询报错：字符串不匹配，小数按数值比较
+    r = client.get("/api/audit-logs", headers=admin_headers, params={"action": "test.details", "min_count": 10000})
+    assert r.status_code == 200
+    assert sorted(str(x["details_json"]["count"]) for x in r.json()) == ["12000", "12000.5"]
+    assert _counts(detail="format=pdf") == []
+    assert client.get("/api/audit-logs", headers=admin_headers, params={"detail": "bad key=1"}).status_code == 400
+
+    db.query(models.AuditLog).filter(models.AuditLog.action == "test.details").delete()
+    db.commit()
+
+
+def test_audit_details_count_uses_expression_index(client: TestClient, admin_headers: dict, db):
+    """PostgreSQL：min_count 走表达式索引 ix_audit_details_count，非数值 count 不触发类型转换错误。"""
+    from sqlalchemy import select, text
+
+    from backend import models
+    from backend.audit import log_audit
+    from backend.routes_audit import _details_count_at_least
+
+    if db.get_bind().dialect.name != "postgresql":
+        pytest.skip("仅 PostgreSQL")
+    log_audit(db, None, "test.details_pg", count="abc")
+    log_audit(db, None, "test.details_pg", count=1.5)
+    log_audit(db, None, "test.details_pg", count=20000)
+    r = client.get("/api/audit-logs", headers=admin_headers, params={"action": "test.details_pg", "min_count": 10000})
+    assert r.status_code == 200
+    assert [x["details_json"]["count"] for x in r.json()] == [20000]
+
+    stmt = select(models.AuditLog.id).where(_details_count_at_least("postgresql", 10000))
+    sql = str(stmt.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True}))
+    db.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = "\n".join(db.execute(text("EXPLAIN " + sql)).scalars())
+    assert "ix_audit_details_count" in plan
+    db.rollback()
+    db.query(models.AuditLog).filter(models.AuditLog.action == "test.details_pg").delete()
+    db.commit()
+
+
+def test_audit_deferred_batched_and_flushed(client: TestClient, db):
+    """非关键审计异步批量写入：登录不再同步提交审计，排空队列后可查到；整批失败时逐条重试只丢弃坏记录。"""
+    from backend import audit, models
+
+    def _count(action):
+        db.expire_all()
+        return db.query(models.AuditLog).filter(models.AuditLog.action == action).count()
+
+    before = _count("auth.login")
+    r = client.post("/api/auth/login", json={"username": "admin", "password": "abc123"})
+    if r.status_code != 200:
+        pytest.skip("需 ADMIN_USERNAME=admin / ADMIN_PASSWORD=abc123")
+    audit.flush_audit_queue()
+    assert _count("auth.login") == before + 1
+
+    for i in range(120):
+        audit.log_audit_deferred(None, "test.deferred", None, None, f"n={i}")
+    audit.flush_audit_queue()
+    assert _count("test.deferred") == 120
+
+    good = audit._audit_values(None, "test.deferred", None, None, "good")
+    bad = dict(good, action=None)
+    audit._write_batch([good, bad])
+    assert _count("test.deferred") == 121
+
+    db.query(models.AuditLog).filter(models.AuditLog.action == "test.deferred").delete()
+    db.commit()
+
+
+def test_audit_archive_expired_months(client: TestClient, db, tmp_path):
+    """保留期之前的审计按月压缩归档后删除；dry_run 只统计，保留期内的记录不动。"""
+    import gzip
+    from datetime import date, datetime
+
+    from backend import audit_retention, models
+    from backend.database import engine
+
+    for ts in (datetime(2001, 3, 2, 8), datetime(2001, 3, 30, 23), datetime(2001, 5, 1), datetime(2001, 7, 1)):
+        db.add(models.AuditLog(actor_id=None, action="test.retention", details=f"中文 {ts:%m}", created_at=ts))
+    db.commit()
+
+    def _count():
+        db.expire_all()
+        return db.query(models.AuditLog).filter(models.AuditLog.action == "test.retention").count()
+
+    today = date(2002, 6, 15)
+    planned = audit_retention.archive_expired(engine, today, 12, str(tmp_path), dry_run=True)
+    assert planned == [("audit_logs_200103", 2), ("audit_logs_200105", 1)]
+    assert _count() == 4 and not list(tmp_path.iterdir())
+
+    done = audit_retention.archive_expired(engine, today, 12, str(tmp_path))
+    assert done == planned
+    assert _count() == 1
+    rows = list(audit_retention.read_archive(str(tmp_path / "audit_logs_200103.ndjson.gz")))
+    assert [r["details"] for r in rows] == ["中文 03", "中文 03"]
+    assert rows[0]["created_at"].startswith("2001-03-02")
+
+    audit_retention.archive_expired(engine, date(2002, 8, 1), 12, str(tmp_path), fmt="csv")
+    assert _count() == 0
+    with gzip.open(tmp_path / "audit_logs_200107.csv.gz", "rt", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines[0].startswith("id,") and "中文 07" in lines[1]
+    assert audit_retention.archive_expired(engine, today, 0, str(tmp_path)) == []
@@ -0,0 +1,58 @@
+"""工作台统计：权限、口径与明细一致、结果缓存及并发刷新只计算一次。"""
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+
+def test_dashboard_stats_requires_admin(client: TestClient):
+    """未登录访问工作台统计应 401。"""
+    r = client.get("/api/dashboard/stats")
+    assert r.status_code == 401
+
+
+def test_dashboard_stats_matches_counts(client: TestClient, admin_headers: dict, created_device_code: str, db, monkeypatch):
+    """设备/用户各项统计与逐项 count 结果一致。"""
+    from backend import models
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "DASHBOARD_CACHE_TTL_SECONDS", 0)
+    s = client.get("/api/dashboard/stats", headers=admin_headers).json()
+    D = models.Device
+    assert s["devices_total"] == db.query(D).count()
+    assert s["devices_active"] == db.query(D).filter(D.is_active.is_(True), D.is_deleted.is_(False)).count()
+    assert s["devices_inactive"] == db.query(D).filter(D.is_active.is_(False), D.is_deleted.is_(False)).count()
+    assert s["devices_deleted"] == db.query(D).filter(D.is_deleted.is_(True)).count()
+    assert s["users_total"] == db.query(models.User).filter(models.User.is_active.is_(True)).count()
+
+
+def test_dashboard_stats_cached_single_flight(client: TestClient, admin_headers: dict, monkeypatch):
+    """缓存过期时并发刷新只触发一次计算，TTL 内直接返回缓存结果。"""
+    from backend import routes_dashboard
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "DASHBOARD_CACHE_TTL_SECONDS", 60)
+    monkeypatch.setattr(routes_dashboard, "_stats_cache", None)
+    calls = []
+    compute = routes_dashboard._compute_dashboard_stats
+
+    def slow_compute(db):
+        calls.append(1)
+        time.sleep(0.2)
+        return compute(db)
+
+    monkeypatch.setattr(routes_dashboard, "_compute_dashboard_stats", slow_compute)
+    results = []
+
+    def fetch():
+        results.append(client.get("/api/dashboard/stats", headers=admin_headers).json())
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 8 and all(r == results[0] for r in results)
+    assert len(calls) == 1
+    client.get("/api/dashboard/stats", headers=admin_headers)
+    assert len(calls) == 1
@@ -55,6 +55,38 @@ def test_device_suggest(client: TestClient, admin_headers: dict, created_device_
         assert "device_code" in data[0] and "name" in data[0]
 
 
+def test_device_search_escapes_wildcards(client: TestClient, admin_headers: dict, created_device_code: str):
+    """关键词中的 % 与 _ 按字面匹配，不作为通配符。"""
+    part = created_device_code[len("TEST_"):]
+    r = client.get("/api/devices/suggest", params={"q": "%"}, headers=admin_headers)
+    assert r.status_code == 200
+    assert all("%" in d["device_code"] or "%" in d["name"] for d in r.json())
+    r = client.get("/api/devices", params={"q": "_" + part}, headers=admin_headers)
+    assert created_device_code in [d["device_code"] for d in r.json()]
+    r = client.get("/api/devices", params={"q": "%" + part}, headers=admin_headers)
+    assert created_device_code not in [d["device_code"] for d in r.json()]
+
+
+def test_device_by_code_cached_and_invalidated(client: TestClient, admin_headers: dict, created_device_code: str, monkeypatch):
+    """按编号精确查找：识别结果先规范化；缓存命中不查库，修改、停用后立即反映。"""
+    from backend import device_cache
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "DEVICE_CACHE_TTL_SECONDS", 3600)
+    r = client.get(f"/api/devices/by-code/{created_device_code} 测试设备")
+    assert r.status_code == 200, r.text
+    dev = r.json()
+    assert dev["device_code"] == created_device_code and dev["live_status"] == 1
+    assert created_device_code in device_cache._cache
+    assert client.get("/api/devices/by-code/NOT_EXIST_CODE_XYZ").status_code == 404
+
+    client.patch(f"/api/devices/{dev['id']}", json={"name": "改名后"}, headers=admin_headers)
+    assert client.get(f"/api/devices/by-code/{created_device_code}").json()["name"] == "改名后"
+    client.patch(f"/api/devices/{dev['id']}", json={"is_active": False}, headers=admin_headers)
+    assert client.get(f"/api/devices/by-code/{created_device_code}").status_code == 404
+    client.patch(f"/api/devices/{dev['id']}", json={"is_active": True}, headers=admin_headers)
+
+
 def test_device_get_by_id(client: TestClient, admin_headers: dict, created_device_code: str):
     """根据 ID 获取单台设备。"""
     list_r = client.get("/api/devices", headers=admin_headers, params={"q": created_device_code})
@@ -95,6 +127,44 @@ def test_device_count(client: TestClient, admin_headers: dict):
     assert "total" in r.json()
 
 
+def test_device_list_with_total(client: TestClient, admin_headers: dict, created_device_code: str, db):
+    """with_total=true 时总数随列表在响应头返回，与 /count 一致；新增设备后本进程总数缓存失效。"""
+    params = {"include_inactive": True}
+    r = client.get("/api/devices", params={**params, "with_total": True, "limit": 1}, headers=admin_headers)
+    assert r.status_code == 200
+    total = int(r.headers["X-Total-Count"])
+    assert total == client.get("/api/devices/count", params=params, headers=admin_headers).json()["total"]
+    code = created_device_code + "_T"
+    client.post("/api/devices", json={"device_code": code, "name": "总数测试", "dept": "测试科"}, headers=admin_headers)
+    r2 = client.get("/api/devices", params={**params, "with_total": True, "limit": 1}, headers=admin_headers)
+    assert int(r2.headers["X-Total-Count"]) == total + 1
+    # 偏移超出末页时仍返回总数
+    r3 = client.get("/api/devices", params={**params, "with_total": True, "offset": total + 10}, headers=admin_headers)
+    assert r3.json() == [] and int(r3.headers["X-Total-Count"]) == total + 1
+    from backend import models
+
+    db.query(models.Device).filter(models.Device.device_code == code).delete()
+    db.commit()
+
+
+def test_device_count_approximate_only_unfiltered(client: TestClient, admin_headers: dict, monkeypatch):
+    """估算值（表行数）只用于不加任何筛选的情况；默认隐藏停用/已删除或带筛选时返回精确计数。"""
+    from backend import count_cache
+
+    monkeypatch.setattr(count_cache, "estimate_table_rows", lambda db, table_name: 987654)
+    exact = client.get("/api/devices/count", headers=admin_headers).json()
+    assert client.get("/api/devices/count", params={"approximate": True}, headers=admin_headers).json() == exact
+    for params in ({"include_inactive": True}, {"include_inactive": True, "include_deleted": True, "dept": "测试科"}):
+        r = client.get("/api/devices/count", params={**params, "approximate": True}, headers=admin_headers)
+        assert "approximate" not in r.json()
+    full = {"include_inactive": True, "include_deleted": True, "approximate": True}
+    assert client.get("/api/devices/count", params=full, headers=admin_headers).json() == {"total": 987654, "approximate": True}
+    r = client.get("/api/devices", params={**full, "with_total": True, "limit": 1}, headers=admin_headers)
+    assert r.headers["X-Total-Count"] == "987654" and r.headers.get("X-Total-Approximate") == "1"
+    r = client.get("/api/devices", params={"approximate": True, "with_total": True, "limit": 1}, headers=admin_headers)
+    assert r.headers["X-Total-Count"] == str(exact["total"]) and "X-Total-Approximate" not in r.headers
+
+
 def test_device_export_csv_requires_admin(client: TestClient):
     """设备导出无 Token 应 401。"""
     r = client.get("/api/devices/export?format=csv")
@@ -106,3 +176,244 @@ def test_device_export_csv_success(client: TestClient, admin_headers: dict):
     r = client.get("/api/devices/export", headers=admin_headers, params={"format": "csv"})
     assert r.status_code == 200
     assert "text/csv" in r.headers.get("content-type", "")
+
+
+def test_device_export_csv_labels_from_dict(client: TestClient, admin_headers: dict, created_device_code: str, db):
+    """CSV 流式导出：状态显示名在 SQL 中取自字典项（重复编码不使行翻倍），未配置的编码用默认名。"""
+    import csv
+    from io import StringIO
+
+    from backend import models
+
+    items = [
+        models.DictItem(dict_type="device_status", code="97", label="测试状态"),
+        models.DictItem(dict_type="device_status", code="97", label="测试状态"),
+    ]
+    db.add_all(items)
+    db.commit()
+    try:
+        device_id = client.get("/api/devices/by-code/" + created_device_code).json()["id"]
+        assert client.patch(f"/api/devices/{device_id}", headers=admin_headers, json={"status": 97}).status_code == 200
+        r = client.get("/api/devices/export", headers=admin_headers, params={"q": created_device_code})
+        assert r.status_code == 200
+        assert r.content.startswith(b"\xef\xbb\xbf")
+        rows = list(csv.reader(StringIO(r.content.decode("utf-8-sig"))))
+        assert rows[0][0] == "设备编号"
+        assert len(rows) == 2
+        assert rows[1][0] == created_device_code
+        assert rows[1][4:6] == ["测试状态", "测试状态"]
+
+        assert client.patch(f"/api/devices/{device_id}", headers=admin_headers, json={"status": 4}).status_code == 200
+        r = client.get("/api/devices/export", headers=admin_headers, params={"q": created_device_code})
+        row = list(csv.reader(StringIO(r.content.decode("utf-8-sig"))))[1]
+        label_4 = next(
+            (i["label"] for i in client.get("/api/dict", params={"dict_type": "device_status"}).json() if str(i["code"]) == "4"),
+            "故障",
+        )
+        assert row[4] == row[5] == label_4
+    finally:
+        for item in items:
+            db.delete(item)
+        db.commit()
+
+
+def test_device_export_xlsx_success(client: TestClient, admin_headers: dict, created_device_code: str):
+    """管理员导出 Excel 应包含新建设备。"""
+    from io import BytesIO
+
+    from openpyxl import load_workbook
+
+    r = client.get("/api/devices/export", headers=admin_headers, params={"format": "xlsx"})
+    assert r.status_code == 200
+    wb = load_workbook(BytesIO(r.content), read_only=True)
+    codes = [row[0] for row in wb.active.iter_rows(min_row=2, values_only=True)]
+    assert created_device_code in codes
+
+
+def test_device_qrcode_etag_and_svg(client: TestClient, created_device_code: str):
+    """二维码按内容缓存：带 ETag，If-None-Match 命中返回 304；format=svg 返回矢量图。"""
+    r = client.get("/api/devices/by-code/" + created_device_code)
+    assert r.status_code == 200
+    device_id = r.json()["id"]
+
+    r = client.get(f"/api/devices/{device_id}/qrcode")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/png"
+    assert r.content.startswith(b"\x89PNG")
+    etag = r.headers["etag"]
+    assert "max-age" in r.headers["cache-control"]
+
+    again = client.get(f"/api/devices/{device_id}/qrcode")
+    assert again.headers["etag"] == etag and again.content == r.content
+
+    r304 = client.get(f"/api/devices/{device_id}/qrcode", headers={"If-None-Match": "W/" + etag})
+    assert r304.status_code == 304
+    assert r304.headers["etag"] == etag and not r304.content
+
+    svg = client.get(f"/api/devices/{device_id}/qrcode", params={"format": "svg"})
+    assert svg.status_code == 200
+    assert svg.headers["content-type"].startswith("image/svg+xml")
+    assert b"<svg" in svg.content
+    assert svg.headers["etag"] != etag
+
+    assert client.get(f"/api/devices/{device_id}/qrcode", params={"format": "gif"}).status_code == 422
+
+    # 尺寸不同即为不同内容，旧 ETag 不命中
+    larger = client.get(f"/api/devices/{device_id}/qrcode", params={"box_size": 12}, headers={"If-None-Match": etag})
+    assert larger.status_code == 200
+    assert larger.headers["etag"] != etag
+
+
+def test_device_qrcode_304_skips_cache_and_render(client: TestClient, created_device_code: str, monkeypatch):
+    """If-None-Match 命中时由内容哈希直接返回 304，不读缓存、不渲染。"""
+    from backend import qrcode_utils, routes_devices
+
+    device_id = client.get("/api/devices/by-code/" + created_device_code).json()["id"]
+    etag = client.get(f"/api/devices/{device_id}/qrcode", params={"box_size": 7}).headers["etag"]
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("304 不应读缓存或渲染")
+
+    monkeypatch.setattr(routes_devices, "get_qr_image", _fail)
+    monkeypatch.setattr(qrcode_utils, "_render", _fail)
+    r = client.get(f"/api/devices/{device_id}/qrcode", params={"box_size": 7}, headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.headers["etag"] == etag
+
+
+def test_device_labels_pdf(client: TestClient, admin_headers: dict, created_device_code: str):
+    """批量打印标签：需管理员；按 ids 或科室筛选生成 PDF，超出上限返回 400。"""
+    assert client.post("/api/devices/labels.pdf", json={}).status_code == 401
+
+    device_id = client.get("/api/devices/by-code/" + created_device_code).json()["id"]
+    r = client.post("/api/devices/labels.pdf", headers=admin_headers, json={"ids": [device_id]})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/pdf"
+    assert r.content.startswith(b"%PDF")
+    assert b"/Subtype /Image" in r.content
+
+    r = client.post("/api/devices/labels.pdf", headers=admin_headers, json={"dept": "测试科", "q": created_device_code})
+    assert r.status_code == 200
+    assert r.content.count(b"/Subtype /Image") == 1
+
+    from backend import schemas
+
+    r = client.post(
+        "/api/devices/labels.pdf",
+        headers=admin_headers,
+        json={"ids": list(range(schemas.DEVICE_LABEL_MAX + 1))},
+    )
+    assert r.status_code == 422
+
+
+def test_device_import_xlsx_csv_and_dry_run(
+    client: TestClient, admin_headers: dict, created_device_code: str, db, monkeypatch
+):
+    """批量导入：Excel 与 CSV（含 GBK 编码）按块写入；dry_run 只预检不写库；已存在、文件内重复、必填缺失跳过。"""
+    from io import BytesIO
+
+    from openpyxl import Workbook
+
+    from backend import device_import, models
+
+    prefix = f"TEST_IMP_{id(object())}_"
+    try:
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["设备编号", "设备名称", "科室", "位置", "状态"])
+        for i in range(5):
+            ws.append([f"{prefix}X{i}", f"导入设备{i}", "导入科", None, 1])
+        ws.append([f"{prefix}X0", "重复", "导入科", None, 1])
+        ws.append([created_device_code, "已存在", "导入科", None, 1])
+        ws.append([f"{prefix}X9", None, "导入科", None, 1])
+        buf = BytesIO()
+        wb.save(buf)
+        xlsx = buf.getvalue()
+        files = {"file": ("devices.xlsx", xlsx, "application/octet-stream")}
+
+        r = client.post("/api/devices/import", headers=admin_headers, params={"dry_run": True}, files=files)
+        assert r.status_code == 200, r.text
+        preview = r.json()
+        assert preview["dry_run"] is True
+        assert (preview["created"], preview["skipped"]) == (5, 3)
+        assert db.query(models.Device).filter(models.Device.device_code.like(f"{prefix}%")).count() == 0
+
+        # 块大小设为 2，验证跨块查重与逐块提交
+        monkeypatch.setattr(device_import, "IMPORT_CHUNK_SIZE", 2)
+        r = client.post("/api/devices/import", headers=admin_headers, files=files)
+        assert r.status_code == 200, r.text
+        result = r.json()
+        assert (result["created"], result["skipped"]) == (5, 3)
+        assert any("在本文件中重复" in e for e in result["errors"])
+        assert any("已存在" in e for e in result["errors"])
+        assert any("设备名称为空" in e for e in result["errors"])
+        assert client.get(f"/api/devices/by-code/{prefix}X3").status_code == 200
+        batches = (
+            db.query(models.AuditLog)
+            .filter(models.AuditLog.action == "device.import.batch")
+            .order_by(models.AuditLog.id.desc())
+            .limit(4)
+            .all()
+        )
+        assert sum(int(b.details.split("created=")[1]) for b in batches) >= 5
+
+        csv_text = "设备编号,设备名称,科室,位置,状态\n" + f"{prefix}C1,心电监护仪,内科,三楼,2\n{prefix}X1,重复,内科,,1\n"
+        r = client.post(
+            "/api/devices/import",
+            headers=admin_headers,
+            files={"file": ("devices.csv", csv_text.encode("gbk"), "text/csv")},
+        )
+        assert r.status_code == 200, r.text
+        assert (r.json()["created"], r.json()["skipped"]) == (1, 1)
+        device = db.query(models.Device).filter(models.Device.device_code == f"{prefix}C1").one()
+        assert (device.name, device.dept, device.status) == ("心电监护仪", "内科", "2")
+
+        r = client.post(
+            "/api/devices/import",
+            headers=admin_headers,
+            files={"file": ("devices.txt", b"x", "text/plain")},
+        )
+        assert r.status_code == 400
+        r = client.post(
+            "/api/devices/import",
+            headers=admin_headers,
+            files={"file": ("devices.xlsx", b"not a zip", "application/octet-stream")},
+        )
+        assert r.status_code == 400
+    finally:
+        db.rollback()
+        db.query(models.Device).filter(models.Device.device_code.like(f"{prefix}%")).delete(synchronize_session=False)
+        db.commit()
+
+
+def test_device_import_chunk_error_reports_committed_rows(client: TestClient, admin_headers: dict, db, monkeypatch):
+    """中途某块写入失败：返回 400 说明已提交条数与出错行号，已提交的块保留，出错块回滚。"""
+    from backend import device_import, models
+
+    prefix = f"TEST_IMPERR_{id(object())}_"
+    real_insert = device_import._insert_devices
+    calls = []
+
+    def failing_insert(db_, rows):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise RuntimeError("模拟写入失败")
+        return real_insert(db_, rows)
+
+    monkeypatch.setattr(device_import, "IMPORT_CHUNK_SIZE", 2)
+    monkeypatch.setattr(device_import, "_insert_devices", failing_insert)
+    csv_text = "设备编号,设备名称,科室,位置,状态\n" + "".join(f"{prefix}{i},设备{i},内科,,1\n" for i in range(5))
+    try:
+        r = client.post(
+            "/api/devices/import",
+            headers=admin_headers,
+            files={"file": ("devices.csv", csv_text.encode("utf-8"), "text/csv")},
+        )
+        assert r.status_code == 400
+        detail = r.json()["detail"]
+        assert "第4-5行" in detail and "已导入 2 条" in detail and "模拟写入失败" in detail
+        codes = {c for (c,) in db.query(models.Device.device_code).filter(models.Device.device_code.like(f"{prefix}%"))}
+        assert codes == {f"{prefix}0", f"{prefix}1"}
+    finally:
+        db.rollback()
+        db.query(models.Device).filter(models.Device.device_code.like(f"{prefix}%")).delete(synchronize_session=False)
+        db.commit()
@@ -25,3 +25,38 @@ def test_dict_create_requires_auth(client: TestClient):
         json={"dict_type": "usage_type", "code": 99, "label": "测试项"},
     )
     assert r.status_code == 401
+
+
+def test_dict_cache_invalidated_on_change(client: TestClient, admin_headers: dict, db, monkeypatch):
+    """字典增删改后列表立即反映变更；其他进程递增版本号后，超过比对间隔即重载。"""
+    import random
+
+    from backend import dict_cache, models
+    from backend.config import settings
+
+    code = random.randint(100000, 999999)
+    r = client.post("/api/dict", json={"dict_type": "usage_type", "code": code, "label": "缓存测试"}, headers=admin_headers)
+    assert r.status_code == 201
+    item_id = r.json()["id"]
+
+    def labels():
+        items = client.get("/api/dict", params={"dict_type": "usage_type"}).json()
+        return {i["code"]: i["label"] for i in items}
+
+    assert labels().get(code) == "缓存测试"
+    client.patch(f"/api/dict/{item_id}", json={"label": "缓存测试2"}, headers=admin_headers)
+    assert labels().get(code) == "缓存测试2"
+
+    # 模拟另一 worker 修改：直接改库并递增版本号，本进程在比对间隔内仍用旧缓存，过期后重载
+    monkeypatch.setattr(settings, "DICT_CACHE_CHECK_SECONDS", 3600)
+    labels()
+    db.query(models.DictItem).filter(models.DictItem.id == item_id).update({"label": "缓存测试3"})
+    dict_cache.bump_dict_version(db)
+    db.commit()
+    monkeypatch.setattr(dict_cache, "_version", dict_cache._read_version(db) - 1)
+    assert labels().get(code) == "缓存测试2"
+    monkeypatch.setattr(settings, "DICT_CACHE_CHECK_SECONDS", 0)
+    assert labels().get(code) == "缓存测试3"
+
+    client.delete(f"/api/dict/{item_id}", headers=admin_headers)
+    assert code not in labels()
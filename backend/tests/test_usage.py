@@ -140,6 +140,250 @@ def test_usage_duplicate_submit_idempotent(client: TestClient, admin_headers: di
     assert r1.json()["id"] == r2.json()["id"]
 
 
+def test_usage_batch_per_item_results(client: TestClient, admin_headers: dict, created_device_code: str):
+    """批量登记：逐条返回新建/重复/失败；借用互斥与防重复对库内及本批内记录均生效。"""
+    today = date.today().isoformat()
+    start = datetime.now(timezone(timedelta(hours=8))).strftime("%Y-%m-%dT%H:%M:%S")
+    other = {"device_code": created_device_code, "usage_type": 5, "registration_date": today, "start_time": start}
+    borrow = {
+        "device_code": created_device_code, "usage_type": 2, "registration_date": today,
+        "end_time": (date.today() + timedelta(days=1)).isoformat() + "T00:00:00", "patient_name": "借用人",
+    }
+    items = [
+        other,
+        borrow,
+        borrow,
+        {**other, "device_code": "NOT_EXIST_DEVICE_BATCH"},
+        other,
+        {"device_code": created_device_code, "usage_type": 5},
+    ]
+    r = client.post("/api/usage/batch", headers=admin_headers, json={"items": items})
+    assert r.status_code == 200, r.text
+    data = r.json()
+    assert [x["status"] for x in data["results"]] == ["created", "created", "error", "error", "duplicate", "error"]
+    assert (data["created"], data["duplicated"], data["failed"]) == (2, 1, 3)
+    assert data["results"][2]["error"] == "该设备当前有未归还的借用记录，请先归还后再借"
+    assert data["results"][4]["record"]["id"] == data["results"][0]["record"]["id"]
+
+    # 重新同步同一批：库内已有的视为重复，借用仍互斥
+    r2 = client.post("/api/usage/batch", headers=admin_headers, json={"items": items[:2]})
+    assert [x["status"] for x in r2.json()["results"]] == ["duplicate", "error"]
+
+
+def test_usage_idempotency_key(client: TestClient, admin_headers: dict, created_device_code: str):
+    """携带相同 Idempotency-Key 的重试返回首次创建的记录；借用重试不触发借用互斥；批量条目同样生效。"""
+    import uuid
+
+    today = date.today().isoformat()
+    borrow = {
+        "device_code": created_device_code, "usage_type": 2, "registration_date": today,
+        "end_time": (date.today() + timedelta(days=1)).isoformat() + "T00:00:00", "patient_name": "借用人",
+    }
+    key = uuid.uuid4().hex
+    headers = {**admin_headers, "Idempotency-Key": key}
+    r1 = client.post("/api/usage", headers=headers, json=borrow)
+    r2 = client.post("/api/usage", headers=headers, json=borrow)
+    assert r1.status_code == 201 and r2.status_code == 201, (r1.text, r2.text)
+    assert r1.json()["id"] == r2.json()["id"]
+    # 不同幂等键的新借用仍受互斥约束
+    r3 = client.post("/api/usage", headers={**admin_headers, "Idempotency-Key": uuid.uuid4().hex}, json=borrow)
+    assert r3.status_code == 400
+
+    item = {"device_code": created_device_code, "usage_type": 5, "registration_date": today, "idempotency_key": uuid.uuid4().hex}
+    b1 = client.post("/api/usage/batch", headers=admin_headers, json={"items": [item, item]}).json()
+    assert [x["status"] for x in b1["results"]] == ["created", "duplicate"]
+    b2 = client.post("/api/usage/batch", headers=admin_headers, json={"items": [item]}).json()
+    assert b2["results"][0]["status"] == "duplicate"
+    assert b2["results"][0]["record"]["id"] == b1["results"][0]["record"]["id"]
+
+
+def test_usage_daily_rollup_dashboard_and_trend(
+    client: TestClient, admin_headers: dict, created_device_code: str, db, monkeypatch,
+):
+    """登记、批量登记、撤销在同一事务中维护按日汇总；工作台统计与趋势读取汇总，重建后与明细一致。"""
+    import uuid
+
+    from backend import models
+    from backend.config import settings
+    from backend.time_utils import china_today
+    from backend.usage_rollup import rebuild_usage_rollup
+
+    monkeypatch.setattr(settings, "DASHBOARD_CACHE_TTL_SECONDS", 0)
+    today = china_today().isoformat()
+
+    def snapshot():
+        stats = client.get("/api/dashboard/stats", headers=admin_headers).json()
+        trend = client.get(
+            "/api/dashboard/usage-trend", params={"days": 7, "dept": "测试科", "usage_type": "5"}, headers=admin_headers,
+        ).json()
+        assert len(trend["items"]) == 7 and trend["to"] == today
+        return stats["usage_total"], stats["usage_today"], trend["items"][-1]["count"]
+
+    before = snapshot()
+    item = {"device_code": created_device_code, "usage_type": 5, "registration_date": today}
+    r = client.post("/api/usage", headers=admin_headers, json=item)
+    assert r.status_code == 201, r.text
+    b = client.post("/api/usage/batch", headers=admin_headers, json={"items": [{**item, "idempotency_key": uuid.uuid4().hex}]})
+    assert b.json()["created"] == 1
+    assert snapshot() == tuple(n + 2 for n in before)
+
+    assert client.post(f"/api/usage/{r.json()['id']}/undo", headers=admin_headers).status_code == 204
+    assert snapshot() == tuple(n + 1 for n in before)
+
+    rebuild_usage_rollup(db)
+    db.commit()
+    total = db.query(models.UsageRecord).filter(models.UsageRecord.is_deleted.is_(False)).count()
+    assert client.get("/api/dashboard/stats", headers=admin_headers).json()["usage_total"] == total
+
+
+def test_usage_rollup_follows_device_dept_change(
+    client: TestClient, admin_headers: dict, created_device_code: str, db,
+):
+    """设备改科室时计数随设备移到新科室；之后撤销旧记录不会使新科室为负，增量汇总与全量重建一致。"""
+    from backend import models
+    from backend.time_utils import china_today
+    from backend.usage_rollup import rebuild_usage_rollup
+
+    R = models.UsageDailyRollup
+    device = db.query(models.Device).filter(models.Device.device_code == created_device_code).one()
+    old_dept, new_dept = device.dept or "", "改科室测试科"
+    today = china_today()
+
+    def snapshot():
+        db.expire_all()
+        return {(r.dept, r.usage_type): r.count for r in db.query(R).filter(R.registration_date == today)}
+
+    r = client.post(
+        "/api/usage", headers=admin_headers,
+        json={"device_code": created_device_code, "usage_type": 5, "registration_date": today.isoformat()},
+    )
+    assert r.status_code == 201, r.text
+    try:
+        assert client.patch(
+            f"/api/devices/{device.id}", headers=admin_headers, json={"dept": new_dept}
+        ).status_code == 200
+        assert snapshot().get((new_dept, "5"), 0) >= 1
+        assert client.post(f"/api/usage/{r.json()['id']}/undo", headers=admin_headers).status_code == 204
+        incremental = snapshot()
+        assert all(v >= 0 for v in incremental.values())
+        rebuild_usage_rollup(db)
+        db.commit()
+        rebuilt = snapshot()
+        moved = {k: v for k, v in incremental.items() if k[0] == new_dept and v}
+        assert moved == {k: v for k, v in rebuilt.items() if k[0] == new_dept}
+    finally:
+        client.patch(f"/api/devices/{device.id}", headers=admin_headers, json={"dept": old_dept})
+
+
+def test_usage_open_borrows_and_repairs(client: TestClient, admin_headers: dict, created_device_code: str):
+    """未归还借用/未完成维修列表：含逾期标记与总数，归还或完成后移出列表；仅管理员可查。"""
+    assert client.get("/api/usage/open-borrows").status_code == 401
+    china_now = datetime.now(timezone(timedelta(hours=8)))
+    borrow = {
+        "device_code": created_device_code, "usage_type": 2,
+        "registration_date": (china_now - timedelta(days=3)).date().isoformat(),
+        "start_time": (china_now - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%S"),
+        "end_time": (china_now - timedelta(days=1)).date().isoformat() + "T00:00:00",
+        "patient_name": "借用人",
+    }
+    repair = {"device_code": created_device_code, "usage_type": 3, "registration_date": china_now.date().isoformat(), "note": "开不了机"}
+    b = client.post("/api/usage", headers=admin_headers, json=borrow)
+    # 不同幂等键避免同设备短时间内第二次提交被防重复合并
+    rp = client.post("/api/usage", headers={**admin_headers, "Idempotency-Key": f"open-repair-{b.json()['id']}"}, json=repair)
+    assert b.status_code == 201 and rp.status_code == 201, (b.text, rp.text)
+
+    def open_ids(path, **params):
+        r = client.get(path, params={"dept": "测试科", **params}, headers=admin_headers)
+        assert r.status_code == 200, r.text
+        assert int(r.headers["X-Total-Count"]) >= len(r.json())
+        return {x["id"]: x["overdue"] for x in r.json()}
+
+    assert open_ids("/api/usage/open-borrows")[b.json()["id"]] is True
+    assert b.json()["id"] in open_ids("/api/usage/open-borrows", overdue_only=True)
+    assert open_ids("/api/usage/open-repairs")[rp.json()["id"]] is False
+    assert rp.json()["id"] not in open_ids("/api/usage/open-repairs", overdue_only=True)
+
+    assert client.post(f"/api/usage/{b.json()['id']}/return", headers=admin_headers).status_code == 204
+    assert client.post(f"/api/usage/{rp.json()['id']}/repair-complete", headers=admin_headers).status_code == 204
+    assert b.json()["id"] not in open_ids("/api/usage/open-borrows")
+    assert rp.json()["id"] not in open_ids("/api/usage/open-repairs")
+
+
+def test_usage_concurrent_borrow_exactly_one(client: TestClient, admin_headers: dict, created_device_code: str):
+    """200 个并发借用同一设备：恰好一个成功，其余返回借用互斥 400（部分唯一索引兜底）。"""
+    import uuid
+    from concurrent.futures import ThreadPoolExecutor
+
+    borrow = {
+        "device_code": created_device_code, "usage_type": 2, "registration_date": date.today().isoformat(),
+        "end_time": (date.today() + timedelta(days=1)).isoformat() + "T00:00:00", "patient_name": "并发借用",
+    }
+
+    def submit(_):
+        r = client.post("/api/usage", headers={**admin_headers, "Idempotency-Key": uuid.uuid4().hex}, json=borrow)
+        return r.status_code, r.json().get("detail")
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        results = list(pool.map(submit, range(200)))
+    codes = [c for c, _ in results]
+    assert codes.count(201) == 1, codes
+    assert codes.count(400) == 199
+    assert {d for c, d in results if c == 400} == {"该设备当前有未归还的借用记录，请先归还后再借"}
+
+
+def test_usage_device_live_status_projection(client: TestClient, admin_headers: dict, created_device_code: str, db, monkeypatch):
+    """借用/维修登记、归还、维修完成、撤销在同一事务中维护设备实时状态；重建结果与增量一致。"""
+    import uuid
+
+    from backend.config import settings
+    from backend.device_state import rebuild_device_state
+
+    monkeypatch.setattr(settings, "DASHBOARD_CACHE_TTL_SECONDS", 0)
+    today = date.today().isoformat()
+
+    def state():
+        r = client.get("/api/devices", params={"q": created_device_code, "include_inactive": True}, headers=admin_headers)
+        d = next(x for x in r.json() if x["device_code"] == created_device_code)
+        return d["live_status"], d["open_borrow_count"], d["open_repair_count"]
+
+    def post(payload):
+        r = client.post("/api/usage", headers={**admin_headers, "Idempotency-Key": uuid.uuid4().hex}, json=payload)
+        assert r.status_code == 201, r.text
+        return r.json()["id"]
+
+    assert state() == (1, 0, 0)
+    stats = client.get("/api/dashboard/stats", headers=admin_headers).json()
+    borrow_id = post({
+        "device_code": created_device_code, "usage_type": 2, "registration_date": today,
+        "end_time": (date.today() + timedelta(days=1)).isoformat() + "T00:00:00", "patient_name": "借用人",
+    })
+    assert state() == (2, 1, 0)
+    assert client.get("/api/dashboard/stats", headers=admin_headers).json()["devices_borrowed"] == stats["devices_borrowed"] + 1
+    repair_id = post({"device_code": created_device_code, "usage_type": 3, "registration_date": today, "note": "报修"})
+    assert state() == (3, 1, 1)
+
+    assert client.post(f"/api/usage/{borrow_id}/return", headers=admin_headers).status_code == 204
+    assert client.post(f"/api/usage/{borrow_id}/return", headers=admin_headers).status_code == 400
+    assert state() == (3, 0, 1)
+    assert client.post(f"/api/usage/{repair_id}/undo", headers=admin_headers).status_code == 204
+    assert state() == (1, 0, 0)
+
+    b = client.post("/api/usage/batch", headers=admin_headers, json={"items": [
+        {"device_code": created_device_code, "usage_type": 3, "registration_date": today, "note": "批量报修",
+         "idempotency_key": uuid.uuid4().hex},
+    ]}).json()
+    assert b["created"] == 1
+    assert state() == (3, 0, 1)
+    rebuild_device_state(db)
+    db.commit()
+    assert state() == (3, 0, 1)
+
+
+def test_usage_batch_limits(client: TestClient, admin_headers: dict):
+    assert client.post("/api/usage/batch", json={"items": [{"device_code": "X"}]}).status_code == 401
+    assert client.post("/api/usage/batch", headers=admin_headers, json={"items": []}).status_code == 422
+
+
 def test_usage_list_filter_by_bed(client: TestClient, admin_headers: dict, created_device_code: str):
     """按床号筛选列表。"""
     base = datetime.now(timezone(timedelta(hours=8)))
@@ -187,3 +431,254 @@ def test_usage_form_schema(client: TestClient):
 
     r5 = client.get("/api/usage/form-schema", params={"usage_type": ""})
     assert r5.status_code == 400
+
+
+def test_usage_list_cursor_pagination(client: TestClient, admin_headers: dict, created_device_code: str, db):
+    """游标分页：limit=1 逐页翻，响应头 X-Next-Cursor 指向下一页，结果按开始时间倒序且不重复。"""
+    from backend import models
+
+    admin = db.query(models.User).filter(models.User.username.isnot(None)).first()
+    base = datetime(2025, 1, 1, 8, 0, 0)
+    for i in range(3):
+        db.add(models.UsageRecord(
+            device_code=created_device_code, user_id=admin.id, usage_type="1",
+            start_time=base + timedelta(hours=i), registration_date=date(2025, 1, 1),
+        ))
+    db.commit()
+
+    seen = []
+    cursor = None
+    for _ in range(5):
+        params = {"device_code": created_device_code, "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get("/api/usage", headers=admin_headers, params=params)
+        assert r.status_code == 200
+        seen.extend(item["id"] for item in r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == 3
+    assert len(set(seen)) == 3
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_usage_count_approximate_only_unfiltered(
+    client: TestClient, admin_headers: dict, created_device_code: str, db, monkeypatch,
+):
+    """估算值（表行数，含已撤销）只用于 include_deleted=true 且无任何筛选；默认隐藏已撤销时返回精确计数。"""
+    from backend import count_cache, models
+
+    admin = db.query(models.User).filter(models.User.username.isnot(None)).first()
+    db.add(models.UsageRecord(
+        device_code=created_device_code, user_id=admin.id, usage_type="1",
+        start_time=datetime(2025, 4, 1, 8, 0, 0), registration_date=date(2025, 4, 1), is_deleted=True,
+    ))
+    db.commit()
+    monkeypatch.setattr(count_cache, "estimate_table_rows", lambda db, table_name: 987654)
+    live = db.query(models.UsageRecord).filter(models.UsageRecord.is_deleted.is_(False)).count()
+    r = client.get("/api/usage/count", params={"approximate": True}, headers=admin_headers)
+    assert r.json() == {"total": live}
+    r = client.get("/api/usage", params={"approximate": True, "with_total": True, "limit": 1}, headers=admin_headers)
+    assert r.headers["X-Total-Count"] == str(live) and "X-Total-Approximate" not in r.headers
+    r = client.get(
+        "/api/usage/count", params={"approximate": True, "include_deleted": True, "device_code": created_device_code},
+        headers=admin_headers,
+    )
+    assert "approximate" not in r.json()
+
+    full = {"approximate": True, "include_deleted": True}
+    assert client.get("/api/usage/count", params=full, headers=admin_headers).json() == {"total": 987654, "approximate": True}
+    r = client.get("/api/usage", params={**full, "with_total": True, "limit": 1}, headers=admin_headers)
+    assert r.headers["X-Total-Count"] == "987654" and r.headers.get("X-Total-Approximate") == "1"
+
+
+def test_usage_list_with_total(client: TestClient, admin_headers: dict, created_device_code: str, db):
+    """with_total=true 时总数随当前页返回（含游标翻页），与 /count 一致；登记后本进程总数缓存失效。"""
+    from backend import models
+
+    admin = db.query(models.User).filter(models.User.username.isnot(None)).first()
+    for i in range(3):
+        db.add(models.UsageRecord(
+            device_code=created_device_code, user_id=admin.id, usage_type="1",
+            start_time=datetime(2025, 3, 1, 8, 0, 0) + timedelta(hours=i),
+            registration_date=date(2025, 3, 1), created_at=datetime(2025, 3, 1, 8, 0, 0),
+        ))
+    db.commit()
+    params = {"device_code": created_device_code, "with_total": True, "limit": 2}
+    r = client.get("/api/usage", params=params, headers=admin_headers)
+    assert r.status_code == 200
+    assert r.headers["X-Total-Count"] == "3"
+    assert client.get("/api/usage/count", params={"device_code": created_device_code}, headers=admin_headers).json() == {"total": 3}
+    r2 = client.get("/api/usage", params={**params, "cursor": r.headers["X-Next-Cursor"]}, headers=admin_headers)
+    assert len(r2.json()) == 1 and r2.headers["X-Total-Count"] == "3"
+
+    base = datetime.now(timezone(timedelta(hours=8)))
+    r3 = client.post("/api/usage", headers=admin_headers, json={
+        "device_code": created_device_code,
+        "usage_type": 3,
+        "registration_date": date.today().isoformat(),
+        "start_time": base.strftime("%Y-%m-%dT%H:%M:%S"),
+        "end_time": (base + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S"),
+        "note": "总数测试",
+    })
+    assert r3.status_code == 201, r3.text
+    r4 = client.get("/api/usage", params=params, headers=admin_headers)
+    assert r4.headers["X-Total-Count"] == "4"
+
+
+def test_usage_list_invalid_cursor(client: TestClient, admin_headers: dict):
+    """非法游标返回 400。"""
+    r = client.get("/api/usage", headers=admin_headers, params={"cursor": "not-a-cursor"})
+    assert r.status_code == 400
+
+
+def test_usage_export_csv_streams_rows_and_byte_budget(
+    client: TestClient, admin_headers: dict, created_device_code: str, db, monkeypatch
+):
+    """CSV 流式导出包含筛选出的全部记录；超过字节预算时截断并在末行提示。"""
+    from backend import models
+    from backend.config import settings
+
+    admin = db.query(models.User).filter(models.User.username.isnot(None)).first()
+    for i in range(5):
+        db.add(models.UsageRecord(
+            device_code=created_device_code, user_id=admin.id, usage_type="1",
+            start_time=datetime(2025, 2, 1, 8, 0, 0) + timedelta(hours=i),
+            registration_date=date(2025, 2, 1), note=f"导出{i}",
+        ))
+    db.commit()
+
+    r = client.get("/api/usage/export", headers=admin_headers, params={"format": "csv", "device_code": created_device_code})
+    assert r.status_code == 200
+    text = r.content.decode("utf-8-sig")
+    assert all(f"导出{i}" in text for i in range(5))
+
+    monkeypatch.setattr(settings, "EXPORT_MAX_BYTES", 300)
+    r2 = client.get("/api/usage/export", headers=admin_headers, params={"format": "csv", "device_code": created_device_code})
+    assert r2.status_code == 200
+    assert "已截断" in r2.content.decode("utf-8-sig")
+
+
+def test_usage_export_job_progress_and_ranged_download(
+    client: TestClient, admin_headers: dict, created_device_code: str, db, monkeypatch, tmp_path
+):
+    """后台导出任务：创建后轮询至完成，可整体下载，也可按 Range 续传。"""
+    import time
+
+    from backend import models
+    from backend.config import settings
+
+    monkeypatch.setattr(settings, "EXPORT_SPOOL_DIR", str(tmp_path))
+    admin = db.query(models.User).filter(models.User.username.isnot(None)).first()
+    for i in range(3):
+        db.add(models.UsageRecord(
+            device_code=created_device_code, user_id=admin.id, usage_type="1",
+            start_time=datetime(2025, 2, 2, 8, 0, 0) + timedelta(hours=i),
+            registration_date=date(2025, 2, 2), note=f"任务{i}",
+        ))
+    db.commit()
+
+    r = client.post("/api/usage/export-jobs", headers=admin_headers, json={"format": "csv", "device_code": created_device_code})
+    assert r.status_code == 202
+    job = r.json()
+    assert job["rows_total"] == 3
+    for _ in range(50):
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.1)
+        job = client.get(f"/api/usage/export-jobs/{job['id']}", headers=admin_headers).json()
+    assert job["status"] == "done"
+    assert job["rows_done"] == 3
+
+    dl = client.get(f"/api/usage/export-jobs/{job['id']}/download", headers=admin_headers)
+    assert dl.status_code == 200
+    assert all(f"任务{i}" in dl.content.decode("utf-8-sig") for i in range(3))
+    part = client.get(
+        f"/api/usage/export-jobs/{job['id']}/download",
+        headers={**admin_headers, "Range": "bytes=3-"},
+    )
+    assert part.status_code == 206
+    assert part.content == dl.content[3:]
+
+    # 前端直接跳转 download_url 下载（无 Authorization 头），凭证仅对本任务有效、不能当登录 token
+    url = job["download_url"]
+    assert client.get(url).content == dl.content
+    assert client.get(url, headers={"Range": "bytes=3-"}).status_code == 206
+    ticket = url.split("ticket=", 1)[1]
+    assert client.get(f"/api/usage/export-jobs/{job['id'] + 1}/download", params={"ticket": ticket}).status_code == 401
+    assert client.get(f"/api/usage/export-jobs/{job['id']}", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+
+
+def test_usage_export_job_stale_rows_do_not_block(
+    client: TestClient, admin_headers: dict, created_device_code: str, db, monkeypatch, tmp_path
+):
+    """进程重启遗留的排队/进行中任务心跳超时后标记为失败，不再占用排队名额导致一直 429；仍有进度的长任务不受影响。"""
+    from backend import models
+    from backend.config import settings
+    from backend.export_jobs import INTERRUPTED_ERROR
+
+    monkeypatch.setattr(settings, "EXPORT_SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "EXPORT_JOB_MAX_PENDING", 2)
+    admin = db.query(models.User).filter(models.User.username.isnot(None)).first()
+    stale_at = datetime.utcnow() - timedelta(minutes=settings.EXPORT_JOB_STALE_MINUTES + 5)
+    stale = [
+        models.ExportJob(created_by=admin.id, format="csv", status=s, created_at=stale_at, updated_at=stale_at)
+        for s in ("pending", "running", "running")
+    ]
+    # 创建已久但刚上报过进度的长任务仍在进行
+    alive = models.ExportJob(
+        created_by=admin.id, format="csv", status="running", created_at=stale_at, updated_at=datetime.utcnow()
+    )
+    db.add_all(stale + [alive])
+    db.commit()
+
+    r = client.post("/api/usage/export-jobs", headers=admin_headers, json={"format": "csv", "device_code": created_device_code})
+    assert r.status_code == 202
+    db.expire_all()
+    for job in stale:
+        assert job.status == "failed"
+        assert job.error == INTERRUPTED_ERROR
+    assert alive.status == "running"
+    alive.status = "failed"
+    db.commit()
+
+
+def test_usage_export_job_requires_admin(client: TestClient):
+    r = client.post("/api/usage/export-jobs", json={"format": "csv"})
+    assert r.status_code == 401
+    assert client.get("/api/usage/export-jobs/1").status_code == 401
+
+
+def test_usage_export_xlsx_spooled(client: TestClient, admin_headers: dict, created_device_code: str):
+    """管理员导出 Excel 应返回可被 openpyxl 解析的工作簿，首行为表头。"""
+    from io import BytesIO
+
+    from openpyxl import load_workbook
+
+    r = client.get("/api/usage/export", headers=admin_headers, params={"format": "xlsx", "device_code": created_device_code})
+    assert r.status_code == 200
+    assert "spreadsheetml" in r.headers.get("content-type", "")
+    wb = load_workbook(BytesIO(r.content), read_only=True)
+    header = next(wb.active.iter_rows(max_row=1, values_only=True))
+    assert header[0] == "登记日期"
+
+
+def test_usage_export_pdf_paginated(client: TestClient, admin_headers: dict, created_device_code: str, db):
+    """PDF 导出按页切分表格：60 条记录应生成多页。"""
+    import re
+
+    from backend import models
+
+    admin = db.query(models.User).filter(models.User.username.isnot(None)).first()
+    for i in range(60):
+        db.add(models.UsageRecord(
+            device_code=created_device_code, user_id=admin.id, usage_type="1",
+            start_time=datetime(2025, 3, 1, 8, 0, 0) + timedelta(minutes=i),
+            registration_date=date(2025, 3, 1),
+        ))
+    db.commit()
+    r = client.get("/api/usage/export", headers=admin_headers, params={"format": "pdf", "device_code": created_device_code})
+    assert r.status_code == 200
+    assert r.content.startswith(b"%PDF")
+    assert len(re.findall(rb"/Type /Page(?!s)", r.content)) >= 3
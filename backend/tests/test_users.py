@@ -26,6 +26,14 @@ def test_users_count(client: TestClient, admin_headers: dict):
     assert "total" in r.json()
 
 
+def test_users_list_with_total(client: TestClient, admin_headers: dict):
+    """with_total=true 时总数随列表在响应头 X-Total-Count 返回，与 /count 一致。"""
+    r = client.get("/api/users", params={"with_total": True, "limit": 1}, headers=admin_headers)
+    assert r.status_code == 200
+    assert len(r.json()) == 1
+    assert int(r.headers["X-Total-Count"]) == client.get("/api/users/count", headers=admin_headers).json()["total"]
+
+
 def test_users_list_with_search_q(client: TestClient, admin_headers: dict, db):
     """用户列表支持 q 参数：按工号/用户名、姓名、科室模糊检索。"""
     from backend import models
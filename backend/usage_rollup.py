@@ -0,0 +1,167 @@
+"""
+使用记录按日汇总（usage_daily_rollup）：登记、撤销、批量登记时在同一事务中增减
+(登记日期, 设备科室, 使用类型) 的计数，工作台统计与趋势只读几十行汇总，不再扫描 usage_records。
+设备改科室时在同一事务中把该设备的计数从原科室移到新科室（move_device_rollup）。
+汇总与明细不一致时（直接改库等）运行 run_rebuild_usage_rollup.py 重建。
+"""
+from collections import Counter
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, func, literal, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+# (登记日期, 设备科室, 使用类型) -> 增量
+RollupKey = Tuple[date, str, str]
+# 启动回填的 PostgreSQL 咨询锁键：多 worker 同时启动时只有一个执行回填
+ROLLUP_BACKFILL_LOCK_KEY = 0x55524F4C
+
+
+def rollup_date(registration_date: Optional[date], start_time) -> date:
+    """汇总所用日期：登记日期；早期未填登记日期的记录按开始时间所在日期计入。"""
+    if registration_date is not None:
+        return registration_date
+    return start_time.date()
+
+
+def _upsert_insert(db: Session):
+    """PostgreSQL / SQLite 的 INSERT ... ON CONFLICT 构造器，其他数据库返回 None。"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def _on_conflict_add(stmt):
+    R = models.UsageDailyRollup
+    return stmt.on_conflict_do_update(
+        index_elements=["registration_date", "dept", "usage_type"],
+        set_={"count": R.count + stmt.excluded.count},
+    )
+
+
+def _on_conflict_set(stmt):
+    return stmt.on_conflict_do_update(
+        index_elements=["registration_date", "dept", "usage_type"],
+        set_={"count": stmt.excluded.count},
+    )
+
+
+def add_rollup_counts(db: Session, counts: Dict[RollupKey, int]) -> None:
+    """按 (日期, 科室, 类型) 批量累加计数（在调用方 commit 之前调用，与明细同一事务）。"""
+    counts = {k: v for k, v in counts.items() if v}
+    if not counts:
+        return
+    R = models.UsageDailyRollup
+    rows = [
+        {"registration_date": d, "dept": dept or "", "usage_type": t, "count": n}
+        for (d, dept, t), n in counts.items()
+    ]
+    insert = _upsert_insert(db)
+    if insert is not None:
+        db.execute(_on_conflict_add(insert(R)), rows)
+        return
+    for row in rows:
+        result = db.execute(
+            update(R)
+            .where(
+                R.registration_date == row["registration_date"],
+                R.dept == row["dept"],
+                R.usage_type == row["usage_type"],
+            )
+            .values(count=R.count + row["count"])
+        )
+        if not result.rowcount:
+            db.add(R(**row))
+    db.flush()
+
+
+def adjust_usage_rollup(
+    db: Session, device_code: str, day: date, usage_type: str, delta: int
+) -> None:
+    """单条登记/撤销：科室取自设备表，INSERT ... SELECT ... ON CONFLICT 一条语句完成，不额外查询设备。"""
+    R, D = models.UsageDailyRollup, models.Device
+    insert = _upsert_insert(db)
+    if insert is None:
+        dept = db.query(D.dept).filter(D.device_code == device_code).scalar()
+        add_rollup_counts(db, {(day, dept or "", usage_type): delta})
+        return
+    source = select(
+        literal(day, R.registration_date.type),
+        func.coalesce(D.dept, ""),
+        literal(usage_type, R.usage_type.type),
+        literal(delta, R.count.type),
+    ).where(D.device_code == device_code)
+    stmt = insert(R).from_select(["registration_date", "dept", "usage_type", "count"], source)
+    db.execute(_on_conflict_add(stmt))
+
+
+def _device_day_counts(db: Session, device_code: str) -> Counter:
+    """某设备未撤销登记按 (日期, 类型) 的计数。"""
+    U = models.UsageRecord
+    day = func.coalesce(U.registration_date, func.date(U.start_time))
+    rows = (
+        db.query(day, U.usage_type, func.count(U.id))
+        .filter(U.device_code == device_code, U.is_deleted.is_(False))
+        .group_by(day, U.usage_type)
+        .all()
+    )
+    counts: Counter = Counter()
+    for d, usage_type, n in rows:
+        if isinstance(d, str):
+            d = date.fromisoformat(d[:10])
+        counts[(d, str(usage_type))] += n
+    return counts
+
+
+def move_device_rollup(
+    db: Session, device_code: str, old_dept: Optional[str], new_dept: Optional[str]
+) -> None:
+    """设备改科室：该设备已有登记的计数从原科室移到新科室，与设备更新同一事务（调用方 commit）。"""
+    old_dept, new_dept = old_dept or "", new_dept or ""
+    if old_dept == new_dept:
+        return
+    moved: Counter = Counter()
+    for (d, usage_type), n in _device_day_counts(db, device_code).items():
+        moved[(d, old_dept, usage_type)] -= n
+        moved[(d, new_dept, usage_type)] += n
+    add_rollup_counts(db, moved)
+
+
+def rebuild_usage_rollup(db: Session) -> int:
+    """按明细全量重建汇总（回填/纠偏），返回汇总行数；调用方负责 commit。"""
+    R, U, D = models.UsageDailyRollup, models.UsageRecord, models.Device
+    day = func.coalesce(U.registration_date, func.date(U.start_time))
+    dept = func.coalesce(D.dept, "")
+    rows = (
+        db.query(day, dept, U.usage_type, func.count(U.id))
+        .select_from(U)
+        .outerjoin(D, D.device_code == U.device_code)
+        .filter(U.is_deleted.is_(False))
+        .group_by(day, dept, U.usage_type)
+        .all()
+    )
+    counts: Counter = Counter()
+    for d, dept_value, usage_type, n in rows:
+        if isinstance(d, str):
+            # SQLite 的 date() 返回文本
+            d = date.fromisoformat(d[:10])
+        counts[(d, dept_value or "", str(usage_type))] += n
+    db.execute(delete(R))
+    rows = [
+        {"registration_date": d, "dept": dept_value, "usage_type": t, "count": n}
+        for (d, dept_value, t), n in counts.items()
+    ]
+    insert = _upsert_insert(db)
+    if insert is None:
+        add_rollup_counts(db, counts)
+    elif rows:
+        # 覆盖而非累加：并发重建（多 worker 启动回填）时同一键被写两次，结果仍与明细一致
+        db.execute(_on_conflict_set(insert(R)), rows)
+    return len(counts)